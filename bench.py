@@ -0,0 +1,917 @@
+"""Offline benchmark harness for hallmonitor
+
+Drives on_voice_state_update and the bot commands with synthetic gateway
+objects against a stubbed REST layer with injected latency and 429s, and
+reports events/sec, time-to-eject, event-loop lag and RSS.
+
+    python bench.py churn raid spam --duration 5 --rest-latency-ms 40 --rate-limit-ratio 0.05
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import types
+from collections import Counter
+
+import discord
+from discord.state import ChunkRequest
+
+SCENARIOS = ('churn', 'raid', 'spam', 'logging', 'shards', 'soak', 'coldstart', 'overwrites', 'lockdown')
+
+GUILD_ID = 900
+MONITORED_CHANNEL_IDS = (1001, 1002, 1003, 1004)
+DESTINATION_CHANNEL_ID = 2001
+LOG_CHANNEL_ID = 3000
+OWNER_ID = 1
+ALLOWED_USER_IDS = range(2, 102)
+
+CONFIG_TEMPLATE = """
+[Bot]
+token = offline
+sharded = {sharded}
+shard_count = {shard_count}
+
+[Users]
+owner = {owner}
+allowed = {allowed}
+
+[Guild:{guild}]
+channels = {channels}
+
+[Security]
+max_failed_attempts = 3
+lockout_duration = 300
+notify_on_unauthorized = true
+log_channel_id = {log_channel}
+log_flush_interval = 0.5
+
+[General]
+log_file = {directory}/bench.log
+state_file = {directory}/bench_state.db
+policy_snapshot = {directory}/bench_policy.snapshot
+journal_file = {directory}/bench_journal.jsonl
+config_poll_interval = 0
+"""
+
+def load_hallmonitor(directory, sharded=False, shard_count=1):
+    """Write a synthetic config and import the bot module against it
+
+    With sharded set, the module's create_bot() builds a ShardedSecureBot.
+    """
+    path = os.path.join(directory, 'config.ini')
+    with open(path, 'w') as f:
+        f.write(CONFIG_TEMPLATE.format(
+            owner=OWNER_ID,
+            allowed=', '.join(str(uid) for uid in ALLOWED_USER_IDS),
+            guild=GUILD_ID,
+            channels=', '.join(f"{cid}:{DESTINATION_CHANNEL_ID}" for cid in MONITORED_CHANNEL_IDS),
+            log_channel=LOG_CHANNEL_ID,
+            directory=directory,
+            sharded=str(sharded).lower(),
+            shard_count=shard_count
+        ))
+    os.environ['HALLMONITOR_CONFIG'] = path
+    import hallmonitor
+    return hallmonitor
+
+def percentile(samples, q):
+    """Exact percentile (0-100) of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+def rss_bytes():
+    """Current resident set size, falling back to the peak where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class FakeRest:
+    """Stand-in for Discord's REST layer with injected latency, 429s and 5xx
+
+    A rate-limited call sleeps for retry_after before succeeding, the same
+    way discord.py's HTTP client transparently retries a 429. A server error
+    is raised to the caller, which is left to the bot's action scheduler.
+    """
+
+    def __init__(self, latency, jitter=0.5, rate_limit_ratio=0.0, retry_after=1.0, server_error_ratio=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.server_error_ratio = server_error_ratio
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.server_errors = Counter()
+
+    async def call(self, route):
+        self.calls[route] += 1
+        delay = self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+        if random.random() < self.rate_limit_ratio:
+            self.rate_limited[route] += 1
+            delay += self.retry_after
+        await asyncio.sleep(delay)
+        if random.random() < self.server_error_ratio:
+            self.server_errors[route] += 1
+            raise discord.HTTPException(
+                types.SimpleNamespace(status=503, reason="Service Unavailable"), "injected server error"
+            )
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+
+class FakeGuild:
+    def __init__(self, rest, guild_id, shard_id=0):
+        self.rest = rest
+        self.id = guild_id
+        self.shard_id = shard_id
+        self.default_role = FakeRole(guild_id)
+
+    async def ban(self, user, **kwargs):
+        await self.rest.call('guild.ban')
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.members = []
+        self.overwrites = {}
+
+    async def edit(self, overwrites=None, **kwargs):
+        await self.guild.rest.call('channel.edit')
+        if overwrites is not None:
+            self.overwrites = dict(overwrites)
+
+    async def set_permissions(self, target, overwrite=None, **kwargs):
+        await self.guild.rest.call('channel.permissions')
+        self.overwrites = {key: value for key, value in self.overwrites.items() if key.id != target.id}
+        if overwrite is not None:
+            self.overwrites[target] = overwrite
+
+    def connect_allowed(self, member):
+        """Whether the overwrites let a member connect: member, then roles, then @everyone"""
+        roles = {role.id for role in member.roles}
+        everyone = role_grant = None
+        for target, overwrite in self.overwrites.items():
+            if overwrite.connect is None:
+                continue
+            if getattr(target, 'type', None) is not discord.Role:
+                if target.id == member.id:
+                    return overwrite.connect
+            elif target.id == self.guild.id:
+                everyone = overwrite.connect
+            elif target.id in roles:
+                role_grant = role_grant or overwrite.connect
+        if role_grant:
+            return True
+        return everyone is not False
+
+class FakeTextChannel:
+    def __init__(self, rest, channel_id):
+        self.rest = rest
+        self.id = channel_id
+
+    async def send(self, content=None, **kwargs):
+        await self.rest.call('channel.send')
+
+class FakeDMChannel:
+    def __init__(self, rest, closed=False):
+        self.rest = rest
+        self.closed = closed
+
+    async def send(self, content=None, **kwargs):
+        await self.rest.call('dm')
+        if self.closed:
+            raise discord.Forbidden(
+                types.SimpleNamespace(status=403, reason='Forbidden'),
+                'Cannot send messages to this user'
+            )
+
+class FakeMember(FakeUser):
+    def __init__(self, rest, tracker, user_id, guild, roles=(), dms_closed=False):
+        super().__init__(user_id)
+        self.rest = rest
+        self.tracker = tracker
+        self.guild = guild
+        self.roles = [FakeRole(role_id) for role_id in roles]
+        self.voice = None
+        self.dms_closed = dms_closed
+        self.dm_channel = None
+
+    async def move_to(self, channel, **kwargs):
+        await self.rest.call('member.move')
+        set_voice_channel(self, channel)
+        self.tracker.ejected(self.id)
+
+    async def create_dm(self):
+        await self.rest.call('dm.open')
+        self.dm_channel = FakeDMChannel(self.rest, self.dms_closed)
+        return self.dm_channel
+
+    async def send(self, content=None, **kwargs):
+        await (self.dm_channel or await self.create_dm()).send(content)
+
+    async def timeout(self, until, **kwargs):
+        await self.rest.call('member.timeout')
+
+class FakeContext:
+    def __init__(self, rest, author, guild, command):
+        self.rest = rest
+        self.author = author
+        self.guild = guild
+        self.command = command
+        self.channel = None
+        self.message = types.SimpleNamespace(attachments=[])
+        self.prefix = '!'
+        self.invoked_with = command.name
+
+    async def send(self, content=None, **kwargs):
+        await self.rest.call('channel.send')
+
+def set_voice_channel(member, channel):
+    """Move a fake member between channels, keeping member lists in sync"""
+    if member.voice and member.voice.channel and member in member.voice.channel.members:
+        member.voice.channel.members.remove(member)
+    member.voice = FakeVoiceState(channel) if channel else None
+    if channel:
+        channel.members.append(member)
+
+class EjectTracker:
+    """Records time from a join event to the member being moved out"""
+
+    def __init__(self):
+        self.joined = {}
+        self.samples = []
+
+    def join(self, user_id):
+        self.joined[user_id] = time.perf_counter()
+
+    def ejected(self, user_id):
+        joined = self.joined.pop(user_id, None)
+        if joined is not None:
+            self.samples.append(time.perf_counter() - joined)
+
+class LoopLagProbe:
+    """Measures how late the event loop wakes a sleeping task"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - start - self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+class Harness:
+    """Wires the imported bot to fake channels and the fake REST layer"""
+
+    def __init__(self, hm, rest, closed_dm_ratio=0.0):
+        self.hm = hm
+        self.closed_dm_ratio = closed_dm_ratio
+        self.bot = hm.bot
+        self.rest = rest
+        self.tracker = EjectTracker()
+        self.guild = FakeGuild(rest, GUILD_ID)
+        self.channels = {
+            cid: FakeVoiceChannel(cid, self.guild) for cid in MONITORED_CHANNEL_IDS
+        }
+        self.channels[DESTINATION_CHANNEL_ID] = FakeVoiceChannel(DESTINATION_CHANNEL_ID, self.guild)
+        self.channels[LOG_CHANNEL_ID] = FakeTextChannel(rest, LOG_CHANNEL_ID)
+        # Unmonitored channels make up most of the voice traffic
+        self.unmonitored = [FakeVoiceChannel(5000 + i, self.guild) for i in range(16)]
+        self.bot.get_channel = self.channels.get
+        self.bot._connection.user = FakeUser(0)
+        self._next_user_id = 10_000
+        self._pending = set()
+
+    async def start(self):
+        # What Client.login() does before setup_hook; AutoShardedBot creates its event queue here
+        await self.bot._async_setup_hook()
+        await self.bot.setup_hook()
+
+    async def stop(self):
+        await self.bot.close()
+
+    def member(self, allowed=False):
+        """Create a fake member, optionally on the allowlist"""
+        if allowed:
+            user_id = random.choice(ALLOWED_USER_IDS)
+        else:
+            self._next_user_id += 1
+            user_id = self._next_user_id
+        return FakeMember(
+            self.rest, self.tracker, user_id, self.guild,
+            dms_closed=random.random() < self.closed_dm_ratio
+        )
+
+    def dispatch(self, coro):
+        """Schedule a handler the way discord.py dispatches events: one task each"""
+        task = asyncio.create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def voice_event(self, member, channel):
+        """Dispatch a voice state update moving member into channel (None to leave)"""
+        before = member.voice or FakeVoiceState(None)
+        set_voice_channel(member, channel)
+        after = member.voice or FakeVoiceState(None)
+        # Only unauthorized joins of a monitored channel are expected to be ejected
+        self.tracker.joined.pop(member.id, None)
+        if channel is not None and channel.id in MONITORED_CHANNEL_IDS:
+            if not self.bot.policies.is_allowed(member.id):
+                self.tracker.join(member.id)
+        self.dispatch(self.hm.on_voice_state_update(member, before, after))
+
+    def command(self, member, name, *args, guild=None):
+        """Dispatch a command invocation, in the harness guild unless another is given"""
+        command = self.bot.get_command(name)
+        ctx = FakeContext(self.rest, member, guild or self.guild, command)
+        self.dispatch(command.callback(ctx, *args))
+
+    async def drain(self, timeout=60.0):
+        """Wait until dispatched handlers finish and queued evictions are done"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if not self._pending and not self.bot.evictions.pending() and not self.tracker.joined:
+                return True
+            await asyncio.sleep(0.01)
+        return False
+
+async def run_churn(harness, args):
+    """Steady voice churn, mostly in unmonitored channels"""
+    members = [harness.member(allowed=random.random() < 0.3) for _ in range(args.members)]
+    monitored = [harness.channels[cid] for cid in MONITORED_CHANNEL_IDS]
+    interval = 1 / args.rate
+    events = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.duration:
+        member = random.choice(members)
+        roll = random.random()
+        if roll < 0.1:
+            channel = random.choice(monitored)
+        elif roll < 0.8:
+            channel = random.choice(harness.unmonitored)
+        else:
+            channel = None
+        harness.voice_event(member, channel)
+        events += 1
+        await asyncio.sleep(interval)
+    await harness.drain()
+    return {'events': events, 'elapsed': time.perf_counter() - start}
+
+async def run_raid(harness, args):
+    """Burst of unauthorized joins into a single monitored channel"""
+    channel = harness.channels[MONITORED_CHANNEL_IDS[0]]
+    raiders = [harness.member() for _ in range(args.raid_size)]
+    start = time.perf_counter()
+    for raider in raiders:
+        harness.voice_event(raider, channel)
+        await asyncio.sleep(args.raid_window / args.raid_size)
+    drained = await harness.drain()
+    elapsed = time.perf_counter() - start
+    return {'events': len(raiders), 'elapsed': elapsed, 'drained': drained}
+
+async def run_spam(harness, args):
+    """Unauthorized command spam from a handful of users"""
+    spammers = [harness.member() for _ in range(args.spammers)]
+    interval = 1 / args.rate
+    events = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.duration:
+        harness.command(random.choice(spammers), 'listallowed')
+        events += 1
+        await asyncio.sleep(interval)
+    await harness.drain()
+    return {
+        'events': events,
+        'elapsed': time.perf_counter() - start,
+        'rate_limited': dict(harness.bot.rate_limiter.stats),
+        'notifications': dict(harness.bot.notifications.stats)
+    }
+
+async def run_shards(harness, args):
+    """Voice events and commands for guilds spread over several shards
+
+    The run imports the bot with sharded = true, so create_bot() builds a
+    ShardedSecureBot. Each shard gets its own guild and a gateway connection
+    that receives its events one at a time, and every event goes through the
+    bot's real voice and command handlers, so unauthorized commands build
+    SecurityResponse state partitioned per shard by security_for. Process
+    CPU time per event is the measurement: the fake gateway and REST layers
+    only sleep, so it is the cost of the handlers and the work they
+    schedule. Events/sec mostly reflects the modeled gateway latency.
+    """
+    bot = harness.bot
+    results = {}
+    channels = harness.unmonitored + [harness.channels[cid] for cid in MONITORED_CHANNEL_IDS]
+    for shard_count in args.shard_counts:
+        guilds = [FakeGuild(harness.rest, GUILD_ID * 1000 + shard_id, shard_id) for shard_id in range(shard_count)]
+        members = [[] for _ in range(shard_count)]
+        for i in range(args.members):
+            member = harness.member(allowed=random.random() < 0.3)
+            member.guild = guilds[i % shard_count]
+            members[i % shard_count].append(member)
+        queues = [asyncio.Queue() for _ in range(shard_count)]
+        for i in range(args.shard_events):
+            shard_id = i % shard_count
+            member = random.choice(members[shard_id])
+            if random.random() < 0.1:
+                queues[shard_id].put_nowait((member, None))
+            else:
+                queues[shard_id].put_nowait((member, random.choice(channels)))
+
+        async def shard_worker(shard_queue):
+            while not shard_queue.empty():
+                member, channel = shard_queue.get_nowait()
+                # Each gateway connection receives and decodes events one at a time
+                await asyncio.sleep(args.gateway_latency_ms / 1000)
+                if channel is None:
+                    harness.command(member, 'listallowed', guild=member.guild)
+                else:
+                    harness.voice_event(member, channel)
+
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        await asyncio.gather(*(shard_worker(shard_queue) for shard_queue in queues))
+        await harness.drain()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        partitions = sum(
+            1 for shard in bot.security_shards.values() for guild in guilds if guild.id in shard
+        )
+        results[shard_count] = (args.shard_events / elapsed, cpu / args.shard_events, partitions)
+        for member in (member for shard_members in members for member in shard_members):
+            set_voice_channel(member, None)
+    return {
+        'events': args.shard_events * len(args.shard_counts),
+        'bot': type(bot).__name__,
+        'throughput': results,
+    }
+
+class SlowHandler(logging.Handler):
+    """Handler whose writes block like a slow or network-mounted disk"""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+
+    def emit(self, record):
+        time.sleep(self.latency)
+
+async def run_logging(harness, args):
+    """Loop stall per logging call: direct file handler vs the bot's queued logging
+
+    The queued case logs through the QueueHandler and listener thread that
+    hallmonitor.setup_logging installed, with the slow disk added to the
+    listener next to the real log file and journal handlers.
+    """
+    latency = args.disk_latency_ms / 1000
+    results = {}
+
+    direct = logging.getLogger('bench.direct')
+    direct.propagate = False
+    direct.addHandler(SlowHandler(latency))
+
+    listener = harness.hm.log_listener
+    handlers = listener.handlers
+    listener.handlers = handlers + (SlowHandler(latency),)
+    queued = logging.getLogger('bench.queued')
+
+    try:
+        for name, logger in (('direct', direct), ('queued', queued)):
+            stalls = []
+            for i in range(args.log_events):
+                start = time.perf_counter()
+                logger.info("bench event %d", i)
+                stalls.append(time.perf_counter() - start)
+                await asyncio.sleep(0)
+            results[name] = stalls
+    finally:
+        listener.handlers = handlers
+    return {'events': args.log_events * 2, 'stalls': results}
+
+async def run_soak(harness, args):
+    """Simulated week of unauthorized attempts against a SecurityResponse"""
+    clock = [time.time()]
+    security = harness.hm.SecurityResponse(GUILD_ID, clock=lambda: clock[0])
+    step = 3600 / args.soak_rate
+    samples = []
+    for day in range(args.soak_days):
+        for _ in range(24 * args.soak_rate):
+            clock[0] += step
+            user_id = random.randrange(10 ** 12)
+            security.record_attempt(user_id)
+            if random.random() < 0.02:
+                security.set_timeout(user_id, 900)
+        start = time.perf_counter()
+        security.summary(10)
+        status = time.perf_counter() - start
+        samples.append((day + 1, len(security.attempts), len(security.timeout_until), status, rss_bytes()))
+    return {'events': args.soak_days * 24 * args.soak_rate, 'days': samples}
+
+def member_payload(user_id):
+    """Gateway member object as GUILD_CREATE and GUILD_MEMBERS_CHUNK carry it"""
+    return {
+        'user': {'id': str(user_id), 'username': f"user{user_id}", 'discriminator': '0',
+                 'avatar': None, 'global_name': None},
+        'roles': [],
+        'joined_at': '2024-01-01T00:00:00+00:00',
+        'deaf': False,
+        'mute': False,
+        'flags': 0,
+    }
+
+async def run_coldstart(harness, args):
+    """Time from bot construction to the first enforcement, full vs lean member cache
+
+    Each bot's own discord.py ConnectionState is fed a GUILD_CREATE payload
+    carrying the voice-connected members, and the guild is cached under the
+    bot's MemberCacheFlags. When the bot chunks at startup (full mode), the
+    rest of the guild arrives as GUILD_MEMBERS_CHUNK events of 1000 members,
+    one gateway round trip each, and discord.py caches every member. Lean
+    mode skips chunking; its second start loads the policy tables from the
+    snapshot the first wrote.
+    """
+    hm = harness.hm
+    channel = harness.channels[MONITORED_CHANNEL_IDS[0]]
+    in_voice = max(1, args.guild_members * args.voice_ratio // 100)
+    results = []
+    for label, lean in (('lean', True), ('lean (snapshot)', True), ('full', False)):
+        gc.collect()
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        bot = hm.SecureBot(lean_cache=lean)
+        bot.get_channel = harness.channels.get
+        bot._connection.user = FakeUser(0)
+        await bot.setup_hook()
+
+        state = bot._connection
+        voice_states = [
+            {
+                'user_id': str(user_id), 'channel_id': str(channel.id), 'session_id': 'bench',
+                'deaf': False, 'mute': False, 'self_deaf': False, 'self_mute': False,
+                'self_video': False, 'suppress': False, 'member': member_payload(user_id),
+            }
+            for user_id in range(1_000_000, 1_000_000 + in_voice)
+        ]
+        guild = discord.Guild(data={
+            'id': str(GUILD_ID),
+            'name': 'bench',
+            'member_count': args.guild_members,
+            'voice_states': voice_states,
+            'members': [voice_state['member'] for voice_state in voice_states],
+        }, state=state)
+        state._add_guild(guild)
+        del voice_states
+        if state._chunk_guilds:
+            request = ChunkRequest(guild.id, 0, asyncio.get_running_loop(), state._get_guild, cache=True)
+            state._chunk_requests[request.nonce] = request
+            chunk_count = -(-args.guild_members // 1000)
+            # Chunks cover the whole guild, voice-connected members included
+            for index in range(chunk_count):
+                await asyncio.sleep(args.gateway_latency_ms / 1000)
+                first = 1_000_000 + index * 1000
+                state.parse_guild_members_chunk({
+                    'guild_id': str(guild.id),
+                    'members': [
+                        member_payload(user_id)
+                        for user_id in range(first, first + min(1000, args.guild_members - index * 1000))
+                    ],
+                    'chunk_index': index,
+                    'chunk_count': chunk_count,
+                    'nonce': request.nonce,
+                })
+        cached = len(guild.members)
+
+        intruder = harness.member()
+        set_voice_channel(intruder, channel)
+        policy = bot.policies.policy_for(channel.id)
+        moved = await bot.evictions.submit(intruder, policy, time.perf_counter())
+        first_enforcement = time.perf_counter() - start
+
+        # Let the snapshot write spawned by setup_hook finish before shutting down
+        for _ in range(100):
+            if not lean or os.path.exists(hm.POLICY_SNAPSHOT):
+                break
+            await asyncio.sleep(0.01)
+        gc.collect()
+        results.append((label, first_enforcement, rss_bytes() - rss_before, bot.policy_source, moved, cached))
+        await bot.close()
+        del guild
+    return {'coldstart': results}
+
+async def settle(harness, timeout=30.0):
+    """Wait for the DMs, log posts and REST actions left over from a drained run"""
+    bot = harness.bot
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        idle = (
+            bot.notifications.queue.empty()
+            and (bot.log_writer is None or bot.log_writer.queue.empty())
+            and not any(bot.actions.depth(action_class) for action_class in bot.actions.CLASSES)
+            and not bot.actions._active
+        )
+        if idle:
+            return
+        await asyncio.sleep(0.05)
+
+async def run_overwrites(harness, args):
+    """Raid against reactive eviction, then against synced Connect overwrites
+
+    Once the overwrites are synced a refused join never reaches the bot, the
+    way Discord rejects it before any gateway event. Overwrites mode runs
+    with the bot's default overwrite_limit, which the bench allowlist
+    exceeds so the channel falls back to eviction, and again with the limit
+    raised to fit it. Also reports the REST cost of syncing one allowlist
+    change under the raised limit.
+    """
+    sync = harness.bot.overwrites
+    channel = harness.channels[MONITORED_CHANNEL_IDS[0]]
+    default_limit = sync.max_overwrites
+    # @everyone, the bot and every allowlisted user
+    needed = len(ALLOWED_USER_IDS) + 2
+    results = {}
+    start = time.perf_counter()
+    for mode, limit in (('reactive', None), ('overwrites', default_limit), ('overwrites', needed + 1)):
+        calls_before = Counter(harness.rest.calls)
+        refused = 0
+        if limit is not None:
+            sync.enabled = True
+            sync.max_overwrites = limit
+            await sync.sync()
+        for _ in range(args.raid_size):
+            raider = harness.member()
+            if mode == 'overwrites' and not channel.connect_allowed(raider):
+                refused += 1
+            else:
+                harness.voice_event(raider, channel)
+            await asyncio.sleep(args.raid_window / args.raid_size)
+        await harness.drain()
+        await settle(harness)
+        label = mode if limit is None else f"{mode} (overwrite_limit={limit})"
+        results[label] = (sum((harness.rest.calls - calls_before).values()), refused)
+
+    calls_before = Counter(harness.rest.calls)
+    harness.bot.policies.allow([harness.member().id])
+    changes = await sync.sync()
+    results['delta'] = (sum((harness.rest.calls - calls_before).values()), changes)
+    sync.enabled = False
+    sync.max_overwrites = default_limit
+    # Leave the channels open for the scenarios that follow
+    for channel_id in MONITORED_CHANNEL_IDS:
+        harness.channels[channel_id].overwrites = {}
+    sync.managed.clear()
+    return {'events': args.raid_size * 3, 'elapsed': time.perf_counter() - start, 'overwrites': results}
+
+async def run_lockdown(harness, args):
+    """Raid with raid detection on: lockdown entry and exit latency
+
+    Entry is timed from the first raid join to the lockdown overwrites being
+    in place, exit from the last raid join to the lockdown lifting. Joins the
+    lockdown overwrites refuse never reach the bot.
+    """
+    raids = harness.bot.raids
+    raids.enabled = True
+    raids.threshold = args.raid_threshold
+    raids.exit_threshold = args.raid_threshold // 2
+    raids.window = args.lockdown_window
+    raids.min_duration = args.lockdown_min_duration
+    raids.windows.clear()
+    channel = harness.channels[MONITORED_CHANNEL_IDS[0]]
+    log_posts = harness.rest.calls['channel.send']
+
+    start = raids.clock()
+    refused = 0
+    for _ in range(args.raid_size):
+        raider = harness.member()
+        if channel.connect_allowed(raider):
+            harness.voice_event(raider, channel)
+        else:
+            refused += 1
+        last_join = raids.clock()
+        await asyncio.sleep(args.raid_window / args.raid_size)
+    drained = await harness.drain()
+    lifted = False
+    for _ in range(int((args.lockdown_min_duration + args.lockdown_window) * 100) + 1000):
+        if not raids.lockdowns:
+            lifted = True
+            break
+        await asyncio.sleep(0.01)
+    await settle(harness)
+    raids.enabled = False
+
+    lockdown = raids.history[-1] if raids.history else None
+    result = {
+        'events': args.raid_size,
+        'elapsed': raids.clock() - start,
+        'drained': drained,
+        'lockdown': None,
+    }
+    if lockdown and lifted:
+        result['lockdown'] = {
+            'entry': lockdown['applied'] - start,
+            'exit': lockdown['ended'] - last_join,
+            'refused': refused,
+            'evicted': lockdown['evicted'],
+            'log posts': harness.rest.calls['channel.send'] - log_posts,
+            'restored': not channel.overwrites,
+        }
+    return result
+
+RUNNERS = {
+    'churn': run_churn,
+    'raid': run_raid,
+    'spam': run_spam,
+    'logging': run_logging,
+    'shards': run_shards,
+    'soak': run_soak,
+    'coldstart': run_coldstart,
+    'overwrites': run_overwrites,
+    'lockdown': run_lockdown,
+}
+
+def ms(seconds):
+    return f"{seconds * 1000:.2f}ms"
+
+def report(name, result, harness, lag, rest_before):
+    """Print one scenario's numbers"""
+    print(f"== {name}")
+    if 'elapsed' in result:
+        print(f"  events: {result['events']}  events/sec: {result['events'] / result['elapsed']:.1f}")
+    if harness.tracker.samples:
+        samples = harness.tracker.samples
+        print(
+            f"  time-to-eject: n={len(samples)} p50={ms(percentile(samples, 50))} "
+            f"p99={ms(percentile(samples, 99))} max={ms(max(samples))}"
+        )
+    if 'drained' in result and not result['drained']:
+        print("  WARNING: evictions did not drain before the timeout")
+    if 'throughput' in result:
+        print(f"  bot: {result['bot']}; events/sec is bound by --gateway-latency-ms, cpu/event is the handler cost")
+        for shard_count, (rate, cpu, partitions) in result['throughput'].items():
+            print(
+                f"  shards={shard_count}: cpu/event={cpu * 1e6:.1f}us "
+                f"security partitions={partitions} ({rate:.1f} events/sec)"
+            )
+    if 'stalls' in result:
+        for mode, stalls in result['stalls'].items():
+            print(
+                f"  {mode}: mean stall={ms(sum(stalls) / len(stalls))} "
+                f"p99={ms(percentile(stalls, 99))} total={ms(sum(stalls))}"
+            )
+    if 'days' in result:
+        for day, users, timeouts, status, rss in result['days']:
+            print(
+                f"  day {day}: tracked users={users} timeouts={timeouts} "
+                f"status summary={ms(status)} rss={rss / 2 ** 20:.1f}MB"
+            )
+    if 'coldstart' in result:
+        for label, first_enforcement, rss_delta, source, moved, cached in result['coldstart']:
+            print(
+                f"  {label}: time-to-first-enforcement={ms(first_enforcement)} "
+                f"steady-state rss +{rss_delta / 2 ** 20:.1f}MB members cached={cached} policy from {source}"
+                + ("" if moved else " (eviction FAILED)")
+            )
+    if 'overwrites' in result:
+        for label, (calls, refused) in result['overwrites'].items():
+            if label != 'delta':
+                print(f"  {label}: rest calls={calls} joins refused by Discord={refused}")
+        calls, changes = result['overwrites']['delta']
+        print(f"  one allowlist change: rest calls={calls} overwrite targets changed={changes}")
+    if 'lockdown' in result:
+        lockdown = result['lockdown']
+        if lockdown is None:
+            print("  WARNING: no lockdown started and lifted")
+        else:
+            print(
+                f"  lockdown entry={ms(lockdown['entry'])} after first join, "
+                f"exit={ms(lockdown['exit'])} after last join"
+            )
+            print(
+                f"  joins refused={lockdown['refused']} evicted={lockdown['evicted']} "
+                f"log posts={lockdown['log posts']} overwrites restored={lockdown['restored']}"
+            )
+    if 'rate_limited' in result:
+        print(f"  rate limiter: {result['rate_limited']}")
+    if 'notifications' in result:
+        print(f"  notifications: {result['notifications']}")
+    if lag:
+        print(f"  loop lag: p50={ms(percentile(lag, 50))} p99={ms(percentile(lag, 99))} max={ms(max(lag))}")
+    calls = harness.rest.calls - rest_before
+    if calls:
+        print(
+            f"  rest calls: {dict(calls)}  429s: {sum(harness.rest.rate_limited.values())} "
+            f"5xx: {sum(harness.rest.server_errors.values())}"
+        )
+    actions = Counter()
+    for (name, _), value in harness.bot.metrics.counters.items():
+        if name in ('hallmonitor_action_retries_total', 'hallmonitor_action_failures_total'):
+            actions[name] += value
+    if actions:
+        print(f"  action scheduler: retries={actions.get('hallmonitor_action_retries_total', 0)} "
+              f"failures={actions.get('hallmonitor_action_failures_total', 0)}")
+    print(f"  rss: {rss_bytes() / 2 ** 20:.1f}MB")
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        hm = load_hallmonitor(
+            directory,
+            sharded='shards' in args.scenarios,
+            shard_count=max(args.shard_counts)
+        )
+        rest = FakeRest(
+            args.rest_latency_ms / 1000,
+            rate_limit_ratio=args.rate_limit_ratio,
+            retry_after=args.retry_after,
+            server_error_ratio=args.server_error_ratio
+        )
+        harness = Harness(hm, rest, args.closed_dm_ratio)
+        await harness.start()
+        try:
+            for name in args.scenarios:
+                harness.tracker = EjectTracker()
+                rest_before = Counter(rest.calls)
+                probe = LoopLagProbe()
+                probe.start()
+                result = await RUNNERS[name](harness, args)
+                await probe.stop()
+                report(name, result, harness, probe.samples, rest_before)
+        finally:
+            await harness.stop()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        'scenarios', nargs='*', metavar='scenario',
+        help=f"one or more of {', '.join(SCENARIOS)} (default: churn raid spam)"
+    )
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per timed scenario")
+    parser.add_argument('--rate', type=float, default=500.0, help="events per second for churn/spam")
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--raid-size', type=int, default=200)
+    parser.add_argument('--raid-window', type=float, default=1.0, help="seconds the raid joins arrive over")
+    parser.add_argument('--raid-threshold', type=int, default=20, help="unauthorized joins that trigger a lockdown")
+    parser.add_argument('--lockdown-window', type=float, default=2.0, help="raid detection window in seconds")
+    parser.add_argument('--lockdown-min-duration', type=float, default=2.0)
+    parser.add_argument('--spammers', type=int, default=20)
+    parser.add_argument('--rest-latency-ms', type=float, default=40.0)
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="fraction of REST calls that hit a 429")
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--server-error-ratio', type=float, default=0.0, help="fraction of REST calls that fail with a 503")
+    parser.add_argument('--closed-dm-ratio', type=float, default=0.2, help="fraction of members with DMs closed")
+    parser.add_argument('--shard-counts', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--shard-events', type=int, default=2000)
+    parser.add_argument('--gateway-latency-ms', type=float, default=2.0)
+    parser.add_argument('--log-events', type=int, default=500)
+    parser.add_argument('--disk-latency-ms', type=float, default=2.0)
+    parser.add_argument('--soak-days', type=int, default=7)
+    parser.add_argument('--guild-members', type=int, default=200_000, help="members chunked in full cache mode")
+    parser.add_argument('--voice-ratio', type=int, default=1, help="percent of members in voice channels")
+    parser.add_argument('--soak-rate', type=int, default=2000, help="attempts per simulated hour")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+    if not args.scenarios:
+        args.scenarios = ['churn', 'raid', 'spam']
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    sys.exit(main())
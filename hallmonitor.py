@@ -1,125 +1,1458 @@
+import argparse
+import asyncio
+import os
 import discord
+from aiohttp import web
 from discord.ext import commands
 import logging
+import logging.handlers
+import atexit
+import json
+import queue
+import random
+import re
 from datetime import datetime, timedelta
+import bisect
+import contextlib
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import mmap
+import sys
+import threading
 import time
+import traceback
 import configparser
+import sqlite3
+import struct
+from collections import Counter, OrderedDict, deque, namedtuple
+from dataclasses import dataclass, field, fields, replace
+from typing import Dict, FrozenSet, Optional, Tuple
+
+# HALLMONITOR_CONFIG points the module at another file, e.g. for the benchmark harness
+CONFIG_FILE = os.environ.get('HALLMONITOR_CONFIG', 'config.ini')
+
+def read_config(path):
+    """Parse a config file, failing if it cannot be read"""
+    parser = configparser.RawConfigParser()
+    if not parser.read(path):
+        raise FileNotFoundError(f"Cannot read config file {path}")
+    return parser
 
 # Read configuration from config.ini
-config = configparser.RawConfigParser()
-config.read('config.ini')
+def file_digest(path):
+    """SHA-256 of a file's contents, used to tie snapshots to one config"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+config = read_config(CONFIG_FILE)
 
 # Bot configuration
 TOKEN = config['Bot']['token']
-MONITORED_CHANNEL_ID = int(config['Channels']['monitored'])
-GENERAL_CHANNEL_ID = int(config['Channels']['removal_destination'])
-OWNER_ID = int(config['Users']['owner'])
-ALLOWED_USER_IDS = [int(usr.strip()) for usr in config['Users']['allowed'].split(',')]
+# Opt-in sharding; shard_ids restricts this process to a subset, e.g. "0-3" or "4,5"
+SHARDED = config.getboolean('Bot', 'sharded', fallback=False)
+SHARD_COUNT = config.getint('Bot', 'shard_count', fallback=None)
+SHARD_IDS = config.get('Bot', 'shard_ids', fallback='')
+
+def parse_id_list(value):
+    """Parse a comma-separated list of Discord IDs, ignoring blanks"""
+    return [int(item.strip()) for item in value.split(',') if item.strip()]
+
+def parse_shard_ids(value):
+    """Parse shard IDs such as "0-3,8" into a sorted list"""
+    shard_ids = set()
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '-' in item:
+            first, last = item.split('-', 1)
+            shard_ids.update(range(int(first), int(last) + 1))
+        else:
+            shard_ids.add(int(item))
+    return sorted(shard_ids)
+
+def parse_channel_pairs(value):
+    """Parse "monitored:destination" pairs separated by commas"""
+    pairs = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            monitored, destination = item.split(':', 1)
+            pairs.append((int(monitored), int(destination)))
+    return pairs
+
+def parse_escalation(value):
+    """Parse an escalation ladder such as "2:5:warn, 3:15:timeout"
+
+    Each step is attempts:timeout_minutes:action; steps are returned ordered
+    by attempt threshold.
+    """
+    steps = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        max_attempts, timeout_mins, action = (part.strip() for part in item.split(':'))
+        if action not in ESCALATION_ACTIONS:
+            raise ValueError(f"Unknown escalation action: {action}")
+        steps.append((int(max_attempts), int(timeout_mins), action))
+    return tuple(sorted(steps))
+
+ESCALATION_ACTIONS = ("warn", "timeout", "long_timeout", "kick", "ban", "role_strip")
+
+# Ladder used when neither [Escalation] nor the guild configures one
+DEFAULT_ESCALATION = (
+    (2, 5, "warn"),           # Warning after 2 attempts
+    (3, 15, "timeout"),       # 15-min timeout after 3 attempts
+    (4, 60, "long_timeout"),  # 1-hour timeout after 4 attempts
+    (5, 1440, "ban"),         # Ban after 5 attempts
+)
+
+@dataclass(frozen=True)
+class EscalationPolicy:
+    """A compiled escalation ladder
+
+    steps are (attempts, timeout_minutes, action) ordered by threshold and
+    thresholds[level] is the attempt count that moves a user from level to
+    level + 1, so the next step is one index lookup. Independently of the
+    ladder, lockout_attempts failures inside the window lock a user out of
+    bot commands for lockout_seconds.
+    """
+    steps: Tuple[Tuple[int, int, str], ...] = DEFAULT_ESCALATION
+    window: float = 24 * 60 * 60
+    dry_run: bool = False
+    lockout_attempts: int = 0
+    lockout_seconds: float = 0
+    thresholds: Tuple[int, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'thresholds', tuple(step[0] for step in self.steps))
+
+    def next_step(self, level, attempts):
+        """(new level, step) if attempts reach the step after level, else None"""
+        if level < len(self.thresholds) and attempts >= self.thresholds[level]:
+            return level + 1, self.steps[level]
+        return None
+
+    def locks_out(self, attempts):
+        """Whether this many attempts triggers the bot-side command lockout"""
+        return 0 < self.lockout_attempts <= attempts
+
+@dataclass(frozen=True)
+class ChannelConfig:
+    """One monitored voice channel"""
+    channel_id: int
+    destination_id: int
+    guild_id: Optional[int] = None
+    allowed_users: FrozenSet[int] = frozenset()
+    allowed_roles: FrozenSet[int] = frozenset()
+    escalation: Tuple[Tuple[int, int, str], ...] = ()
+
+@dataclass(frozen=True)
+class GuildConfig:
+    """Guild-wide defaults inherited by the guild's monitored channels"""
+    guild_id: int
+    allowed_users: FrozenSet[int] = frozenset()
+    allowed_roles: FrozenSet[int] = frozenset()
+    escalation: Tuple[Tuple[int, int, str], ...] = ()
+    # Overrides of the [Escalation] window and dry-run setting
+    escalation_window: Optional[float] = None
+    escalation_dry_run: Optional[bool] = None
+
+@dataclass(frozen=True)
+class PolicyConfig:
+    """Everything the policy tables are compiled from"""
+    owner_id: int
+    allowed_users: FrozenSet[int]
+    allowed_roles: FrozenSet[int]
+    guilds: Dict[int, GuildConfig] = field(default_factory=dict)
+    channels: Dict[int, ChannelConfig] = field(default_factory=dict)
+    # Command name ("*" for every command) -> roles allowed to run it
+    command_roles: Dict[str, FrozenSet[int]] = field(default_factory=dict)
+    # Default escalation policy, overridden per guild by [Guild:<id>]
+    escalation: EscalationPolicy = EscalationPolicy()
+
+    def escalation_for(self, guild_id, steps=None):
+        """The escalation policy for a guild, optionally with another ladder"""
+        policy = self.escalation
+        guild = self.guilds.get(guild_id)
+        if guild:
+            policy = replace(
+                policy,
+                steps=guild.escalation or policy.steps,
+                window=policy.window if guild.escalation_window is None else guild.escalation_window,
+                dry_run=policy.dry_run if guild.escalation_dry_run is None else guild.escalation_dry_run
+            )
+        if steps:
+            policy = replace(policy, steps=steps)
+        return policy
+
+    def max_attempt_window(self):
+        """Longest attempt window of any guild, for pruning persisted attempts"""
+        return max(
+            [self.escalation.window]
+            + [guild.escalation_window for guild in self.guilds.values() if guild.escalation_window]
+        )
+
+def load_policy_config(config):
+    """Build and validate the policy model from a parsed config.ini
+
+    Monitored channels come from the legacy [Channels] section, from
+    "channels = monitored:destination, ..." in [Guild:<id>] sections and from
+    [Channel:<id>] sections with their own destination, allowlist, role
+    exemptions and escalation ladder.
+    """
+    guilds = {}
+    channels = {}
+
+    def add_channel(channel):
+        if channel.channel_id in channels:
+            raise ValueError(f"Channel {channel.channel_id} is configured more than once")
+        if channel.destination_id == channel.channel_id:
+            raise ValueError(f"Channel {channel.channel_id} uses itself as removal destination")
+        channels[channel.channel_id] = channel
+
+    if config.has_option('Channels', 'monitored'):
+        add_channel(ChannelConfig(
+            config.getint('Channels', 'monitored'),
+            config.getint('Channels', 'removal_destination')
+        ))
+
+    for section in config.sections():
+        if not section.startswith('Guild:'):
+            continue
+        guild_id = int(section.split(':', 1)[1])
+        options = config[section]
+        guilds[guild_id] = GuildConfig(
+            guild_id,
+            frozenset(parse_id_list(options.get('allowed', ''))),
+            frozenset(parse_id_list(options.get('allowed_roles', ''))),
+            parse_escalation(options.get('escalation', '')),
+            options.getfloat('escalation_window', fallback=None),
+            options.getboolean('escalation_dry_run', fallback=None)
+        )
+        for monitored, destination in parse_channel_pairs(options.get('channels', '')):
+            add_channel(ChannelConfig(monitored, destination, guild_id))
+
+    for section in config.sections():
+        if not section.startswith('Channel:'):
+            continue
+        options = config[section]
+        if 'destination' not in options:
+            raise ValueError(f"[{section}] is missing a destination")
+        guild_id = int(options['guild']) if 'guild' in options else None
+        if guild_id is not None and guild_id not in guilds:
+            guilds[guild_id] = GuildConfig(guild_id)
+        add_channel(ChannelConfig(
+            int(section.split(':', 1)[1]),
+            int(options['destination']),
+            guild_id,
+            frozenset(parse_id_list(options.get('allowed', ''))),
+            frozenset(parse_id_list(options.get('allowed_roles', ''))),
+            parse_escalation(options.get('escalation', ''))
+        ))
+
+    if not channels:
+        raise ValueError("No monitored channels configured")
+    # A destination that is itself monitored would bounce evicted members between channels
+    for channel in channels.values():
+        if channel.destination_id in channels:
+            raise ValueError(
+                f"Channel {channel.channel_id} uses monitored channel {channel.destination_id} "
+                f"as removal destination"
+            )
+
+    # [Commands] maps command names to role IDs; "all" applies to every command
+    command_roles = {}
+    if config.has_section('Commands'):
+        for name, value in config['Commands'].items():
+            command_roles['*' if name == 'all' else name] = frozenset(parse_id_list(value))
+
+    # [Escalation] sets the default ladder; [Security] max_failed_attempts and
+    # lockout_duration drive the bot-side command lockout
+    escalation = EscalationPolicy(
+        parse_escalation(config.get('Escalation', 'ladder', fallback='')) or DEFAULT_ESCALATION,
+        config.getfloat('Escalation', 'window', fallback=24 * 60 * 60),
+        config.getboolean('Escalation', 'dry_run', fallback=False),
+        config.getint('Security', 'max_failed_attempts', fallback=0),
+        config.getfloat('Security', 'lockout_duration', fallback=0)
+    )
+
+    return PolicyConfig(
+        int(config['Users']['owner']),
+        frozenset(parse_id_list(config['Users']['allowed'])),
+        frozenset(parse_id_list(config.get('Users', 'allowed_roles', fallback=''))),
+        guilds,
+        channels,
+        command_roles,
+        escalation
+    )
+
+POLICY_CONFIG = load_policy_config(config)
 
 # Security configuration
-MAX_FAILED_ATTEMPTS = int(config['Security']['max_failed_attempts'])
-LOCKOUT_DURATION = int(config['Security']['lockout_duration'])
 NOTIFY_ON_UNAUTHORIZED = config.getboolean('Security', 'notify_on_unauthorized')
 LOG_FILE = config['General']['log_file']
+# How often to check config.ini for changes, in seconds (0 disables the watcher)
+CONFIG_POLL_INTERVAL = config.getfloat('General', 'config_poll_interval', fallback=5.0)
+# File log rotation: none, size or time
+LOG_ROTATION = config.get('General', 'log_rotation', fallback='none')
+LOG_MAX_BYTES = config.getint('General', 'log_max_bytes', fallback=10 * 1024 * 1024)
+LOG_BACKUP_COUNT = config.getint('General', 'log_backup_count', fallback=5)
+LOG_ROTATE_WHEN = config.get('General', 'log_rotate_when', fallback='midnight')
+# File log format: text or json (one JSON object per line)
+LOG_FORMAT = config.get('General', 'log_format', fallback='text')
+# Append-only structured security event journal with a time/user index (empty disables it)
+JOURNAL_FILE = config.get('General', 'journal_file', fallback='security_journal.jsonl')
 LOG_CHANNEL_ID = config.getint('Security', 'log_channel_id', fallback=None)
+# Unauthorized joins are evicted in micro-batches with bounded concurrency
+EVICTION_BATCH_WINDOW = config.getfloat('Security', 'eviction_batch_window', fallback=0.05)
+EVICTION_MAX_BATCH = config.getint('Security', 'eviction_max_batch', fallback=100)
+EVICTION_CONCURRENCY = config.getint('Security', 'eviction_concurrency', fallback=5)
+# Outgoing REST actions: requests in flight overall, and retries on 429/5xx
+ACTION_CONCURRENCY = config.getint('Security', 'action_concurrency', fallback=10)
+ACTION_MAX_RETRIES = config.getint('Security', 'action_max_retries', fallback=3)
+ACTION_RETRY_BASE = config.getfloat('Security', 'action_retry_base', fallback=0.5)
+# Enforcement mode: reactive (evict after joining) or overwrites (also keep the
+# monitored channels' Connect overwrites in sync so Discord refuses the join)
+ENFORCEMENT_MODE = config.get('Security', 'enforcement_mode', fallback='reactive')
+# Seconds to coalesce policy changes before editing overwrites, and the most
+# overwrites a channel may need before the sync stands down for that channel
+OVERWRITE_SYNC_DELAY = config.getfloat('Security', 'overwrite_sync_delay', fallback=2.0)
+OVERWRITE_LIMIT = config.getint('Security', 'overwrite_limit', fallback=100)
+# Raid detection: unauthorized joins per channel within window seconds that
+# trigger a lockdown (0 disables), the rate it must fall to before lifting,
+# and the shortest lockdown
+RAID_THRESHOLD = config.getint('Raid', 'threshold', fallback=0)
+RAID_WINDOW = config.getfloat('Raid', 'window', fallback=10.0)
+RAID_BUCKETS = config.getint('Raid', 'buckets', fallback=10)
+RAID_EXIT_THRESHOLD = config.getint('Raid', 'exit_threshold', fallback=None)
+RAID_MIN_DURATION = config.getfloat('Raid', 'min_duration', fallback=60.0)
+# Eviction batch window while any channel is locked down
+RAID_BATCH_WINDOW = config.getfloat('Raid', 'batch_window', fallback=0.25)
+# Local Prometheus endpoint; port 0 disables it
+METRICS_HOST = config.get('Metrics', 'host', fallback='127.0.0.1')
+METRICS_PORT = config.getint('Metrics', 'port', fallback=0)
+LOOP_LAG_INTERVAL = config.getfloat('Metrics', 'loop_lag_interval', fallback=0.5)
+# Loop stall / slow handler detection; stack samples are rate limited per minute
+WATCHDOG_ENABLED = config.getboolean('Watchdog', 'enabled', fallback=True)
+WATCHDOG_STALL_THRESHOLD = config.getfloat('Watchdog', 'stall_threshold', fallback=0.5)
+WATCHDOG_HANDLER_THRESHOLD = config.getfloat('Watchdog', 'handler_threshold', fallback=2.0)
+WATCHDOG_MAX_SAMPLES = config.getint('Watchdog', 'max_samples_per_minute', fallback=6)
+WATCHDOG_STACK_DEPTH = config.getint('Watchdog', 'stack_depth', fallback=20)
+# Periodic sweep of monitored channels for unauthorized occupants, in seconds (0 disables)
+AUDIT_INTERVAL = config.getfloat('Security', 'audit_interval', fallback=600.0)
+LOG_QUEUE_SIZE = config.getint('Security', 'log_queue_size', fallback=1000)
+LOG_FLUSH_INTERVAL = config.getfloat('Security', 'log_flush_interval', fallback=2.0)
+# What to do when the log channel queue is full: drop_newest, drop_oldest or block
+LOG_OVERFLOW = config.get('Security', 'log_overflow', fallback='drop_newest')
+
+# Direct message delivery: queue size, parallel senders, how long to skip users
+# whose DMs are closed and the window in which identical messages are suppressed
+DM_QUEUE_SIZE = config.getint('Security', 'dm_queue_size', fallback=1000)
+DM_CONCURRENCY = config.getint('Security', 'dm_concurrency', fallback=4)
+DM_FORBIDDEN_TTL = config.getfloat('Security', 'dm_forbidden_ttl', fallback=3600.0)
+DM_DEDUP_WINDOW = config.getfloat('Security', 'dm_dedup_window', fallback=300.0)
+
+# Command rate limits (token buckets, commands per second; 0 disables a bucket)
+COMMAND_RATE = config.getfloat('Security', 'command_rate', fallback=0.5)
+COMMAND_BURST = config.getint('Security', 'command_burst', fallback=5)
+GLOBAL_COMMAND_RATE = config.getfloat('Security', 'global_command_rate', fallback=10.0)
+GLOBAL_COMMAND_BURST = config.getint('Security', 'global_command_burst', fallback=30)
+# Most users whose bucket state is kept; the least recently seen are evicted first
+RATE_LIMIT_MAX_USERS = config.getint('Security', 'rate_limit_max_users', fallback=10000)
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line for structured ingestion"""
+
+    # Structured fields passed through ``extra`` by log_security_event
+    EXTRA_FIELDS = ('event_type', 'user_id', 'guild_id', 'channel_id', 'details')
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        return json.dumps(entry, ensure_ascii=False)
+
+class JournalHandler(logging.Handler):
+    """Append security events to a JSON lines journal plus a fixed-width index
+
+    Each event becomes one JSON line in the journal and one 24-byte index
+    record (wall time, user ID, journal offset), both appended in time order.
+    A secondary user index holds the same records sorted by user and time,
+    covering the first N index records; once the unsorted tail grows past
+    an eighth of that it is merged in and the file atomically replaced.
+    The handler runs on the logging listener thread and ignores records that
+    are not security events.
+    """
+
+    INDEX_RECORD = struct.Struct('<dQQ')
+    # The user index starts with the number of index records it covers
+    USER_INDEX_HEADER = struct.Struct('<Q')
+    USER_INDEX_MIN_TAIL = 4096
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.index_path = path + '.idx'
+        self.user_index_path = path + '.uidx'
+        self.journal = open(path, 'ab')
+        self.index = open(self.index_path, 'ab')
+        self._recover()
+        self._indexed = self.index.tell() // self.INDEX_RECORD.size
+        self._user_indexed = self._read_user_index_header()
+        self._update_user_index()
+
+    @staticmethod
+    def user_key(record):
+        ts, user_id, offset = record
+        return user_id, ts, offset
+
+    def _read_user_index_header(self):
+        """Index records the user index covers, 0 if it is missing or does not match"""
+        try:
+            with open(self.user_index_path, 'rb') as f:
+                covered, = self.USER_INDEX_HEADER.unpack(f.read(self.USER_INDEX_HEADER.size))
+                size = os.fstat(f.fileno()).st_size
+        except (FileNotFoundError, struct.error):
+            return 0
+        if covered > self._indexed or size != self.USER_INDEX_HEADER.size + covered * self.INDEX_RECORD.size:
+            return 0
+        return covered
+
+    def _update_user_index(self):
+        """Merge the unsorted tail into the user index once it is big enough"""
+        tail = self._indexed - self._user_indexed
+        if tail < max(self.USER_INDEX_MIN_TAIL, self._user_indexed // 8):
+            return
+        record = self.INDEX_RECORD
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._user_indexed * record.size)
+            new = sorted(record.iter_unpack(f.read(tail * record.size)), key=self.user_key)
+        temp_path = f"{self.user_index_path}.tmp"
+        with open(temp_path, 'wb') as out:
+            out.write(self.USER_INDEX_HEADER.pack(self._indexed))
+            old = open(self.user_index_path, 'rb') if self._user_indexed else None
+            try:
+                if old is not None:
+                    old.seek(self.USER_INDEX_HEADER.size)
+                merged = heapq.merge(self._read_records(old), new, key=self.user_key)
+                chunk = []
+                for item in merged:
+                    chunk.append(record.pack(*item))
+                    if len(chunk) >= 4096:
+                        out.write(b''.join(chunk))
+                        chunk = []
+                out.write(b''.join(chunk))
+            finally:
+                if old is not None:
+                    old.close()
+        os.replace(temp_path, self.user_index_path)
+        self._user_indexed = self._indexed
+
+    def _read_records(self, f, count=4096):
+        if f is None:
+            return
+        size = self.INDEX_RECORD.size
+        for chunk in iter(lambda: f.read(size * count), b''):
+            yield from self.INDEX_RECORD.iter_unpack(chunk)
+
+    def _recover(self):
+        """Index journal lines written after the last index record (e.g. after a crash)"""
+        size = self.index.tell()
+        record_size = self.INDEX_RECORD.size
+        if size % record_size:
+            # Torn index write; drop the partial record
+            self.index.truncate(size - size % record_size)
+            size -= size % record_size
+        position = 0
+        if size:
+            with open(self.index_path, 'rb') as f:
+                f.seek(size - record_size)
+                _, _, offset = self.INDEX_RECORD.unpack(f.read(record_size))
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                f.readline()
+                position = f.tell()
+        with open(self.path, 'rb') as f:
+            f.seek(position)
+            for line in iter(f.readline, b''):
+                if not line.endswith(b'\n'):
+                    # Torn journal write; the next append starts a fresh line
+                    self.journal.write(b'\n')
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    position += len(line)
+                    continue
+                self.index.write(self.INDEX_RECORD.pack(entry['ts'], entry['user_id'] or 0, position))
+                position += len(line)
+        self.journal.flush()
+        self.index.flush()
+
+    def emit(self, record):
+        event_type = getattr(record, 'event_type', None)
+        if event_type is None:
+            return
+        try:
+            entry = {
+                'ts': record.created,
+                'mono': getattr(record, 'mono', None),
+                'event_type': event_type,
+                'user_id': record.user_id,
+                'guild_id': getattr(record, 'guild_id', None),
+                'channel_id': getattr(record, 'channel_id', None),
+                'details': record.details,
+            }
+            line = json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n'
+            offset = self.journal.tell()
+            self.journal.write(line)
+            self.journal.flush()
+            self.index.write(self.INDEX_RECORD.pack(record.created, record.user_id or 0, offset))
+            self.index.flush()
+            self._indexed += 1
+            self._update_user_index()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.journal.close()
+        self.index.close()
+        super().close()
+
+class JournalReader:
+    """Memory-mapped queries over a security journal and its indexes
+
+    The time range is found by binary search over the index. A query for
+    one user binary-searches the user index instead and only scans the
+    index records written since it was last merged; journal lines are
+    decoded only for matches.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.user_index_path = path + '.uidx'
+
+    def _timestamp(self, index, i):
+        return JournalHandler.INDEX_RECORD.unpack_from(index, i * JournalHandler.INDEX_RECORD.size)[0]
+
+    def _seek(self, index, low, high, since):
+        """First index record in [low, high) at or after since"""
+        if since is None:
+            return low
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamp(index, middle) < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _user_records(self, index, count, user_id, since):
+        """Index records for one user, oldest first: the sorted user index, then the tail"""
+        record = JournalHandler.INDEX_RECORD
+        header = JournalHandler.USER_INDEX_HEADER
+        covered = 0
+        try:
+            user_index_file = open(self.user_index_path, 'rb')
+        except FileNotFoundError:
+            user_index_file = None
+        if user_index_file is not None:
+            with user_index_file, mmap.mmap(user_index_file.fileno(), 0, access=mmap.ACCESS_READ) as users:
+                covered, = header.unpack_from(users)
+                if covered > count or len(users) != header.size + covered * record.size:
+                    covered = 0
+                target = (user_id, float('-inf') if since is None else since)
+                low, high = 0, covered
+                while low < high:
+                    middle = (low + high) // 2
+                    ts, entry_user, _ = record.unpack_from(users, header.size + middle * record.size)
+                    if (entry_user, ts) < target:
+                        low = middle + 1
+                    else:
+                        high = middle
+                for i in range(low, covered):
+                    item = record.unpack_from(users, header.size + i * record.size)
+                    if item[1] != user_id:
+                        break
+                    yield item
+        low = self._seek(index, covered, count, since)
+        yield from record.iter_unpack(index[low * record.size:count * record.size])
+
+    def query(self, user_id=None, since=None, until=None, event_types=None, limit=None, newest_first=False):
+        """Yield journal entries matching all of the given filters, oldest first by default"""
+        record = JournalHandler.INDEX_RECORD
+        try:
+            index_file = open(self.index_path, 'rb')
+            journal_file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with index_file, journal_file:
+            count = os.fstat(index_file.fileno()).st_size // record.size
+            if not count or not os.fstat(journal_file.fileno()).st_size:
+                return
+            with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index, \
+                    mmap.mmap(journal_file.fileno(), 0, access=mmap.ACCESS_READ) as journal:
+                if user_id is None:
+                    low = self._seek(index, 0, count, since)
+                    if newest_first:
+                        records = (record.unpack_from(index, i * record.size) for i in range(count - 1, low - 1, -1))
+                    else:
+                        records = record.iter_unpack(index[low * record.size:count * record.size])
+                else:
+                    records = self._user_records(index, count, user_id, since)
+                    if newest_first:
+                        records = reversed(list(records))
+                found = 0
+                for ts, entry_user, offset in records:
+                    if until is not None and ts > until:
+                        if newest_first:
+                            continue
+                        break
+                    if user_id is not None and entry_user != user_id:
+                        continue
+                    end = journal.find(b'\n', offset)
+                    entry = json.loads(journal[offset:end if end != -1 else len(journal)])
+                    if event_types and entry['event_type'] not in event_types:
+                        continue
+                    yield entry
+                    found += 1
+                    if limit and found >= limit:
+                        return
+
+def format_journal_entry(entry):
+    """One-line rendering of a journal entry for the CLI and !audit"""
+    timestamp = datetime.fromtimestamp(entry['ts']).strftime("%Y-%m-%d %H:%M:%S")
+    where = ""
+    if entry.get('guild_id'):
+        where += f" guild={entry['guild_id']}"
+    if entry.get('channel_id'):
+        where += f" channel={entry['channel_id']}"
+    return f"{timestamp} {entry['event_type']} user={entry['user_id']}{where} - {entry['details']}"
+
+def setup_logging():
+    """Route logging through a queue to a listener thread that owns the file
+
+    The event loop thread only pays for putting the record on a queue; the
+    file write (and any rotation) happens on the listener thread.
+    """
+    if LOG_ROTATION == 'size':
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    elif LOG_ROTATION == 'time':
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    elif LOG_ROTATION == 'none':
+        handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
+    else:
+        raise ValueError(f"Unknown log rotation mode: {LOG_ROTATION}")
+
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    handlers = [handler]
+    if JOURNAL_FILE:
+        handlers.append(JournalHandler(JOURNAL_FILE))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+# State persistence (empty state_file disables it)
+STATE_FILE = config.get('General', 'state_file', fallback='hallmonitor_state.db')
+STATE_FLUSH_INTERVAL = config.getfloat('General', 'state_flush_interval', fallback=1.0)
+
+# Startup mode for large guilds: no member chunking, a voice-only member cache
+# and policy tables loaded from a snapshot that matches the config and state
+LEAN_CACHE = config.getboolean('General', 'lean_cache', fallback=False)
+POLICY_SNAPSHOT = config.get('General', 'policy_snapshot', fallback='hallmonitor_policy.snapshot')
+
+# Lines per page for !listallowed and !security_status ("all" sends an attachment)
+LISTING_PAGE_SIZE = config.getint('General', 'listing_page_size', fallback=50)
+# Offenders named in the security_status summary
+STATUS_TOP_OFFENDERS = config.getint('General', 'status_top_offenders', fallback=10)
 
 # Set up logging
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+log_listener = setup_logging()
+
+# Compiled, immutable policy for one monitored channel
+ChannelPolicy = namedtuple(
+    'ChannelPolicy',
+    ['channel_id', 'guild_id', 'destination_id', 'users', 'roles', 'escalation']
 )
 
+class PolicyStore:
+    """Allowlist and per-channel policy index with copy-on-write updates
+
+    Readers grab ``allowed_users`` or ``channels`` once and work against that
+    snapshot; writers build new frozensets/dicts and swap the references, so
+    the hot path never sees a half-applied update.
+    """
+
+    def __init__(self, allowed_users=()):
+        # Users allowed to run commands and to join every monitored channel
+        self.allowed_users = frozenset(allowed_users)
+        # Per-channel rules: channel_id -> (guild_id, destination_id, users, roles, escalation)
+        self._rules = {}
+        # Compiled lookup table: channel_id -> ChannelPolicy
+        self.channels = {}
+        # Runtime allow/remove changes, re-applied when the config is reloaded
+        self.overrides = {}
+        # Configured command roles: command name ("*" for all) -> role IDs
+        self._command_roles = {}
+        # Runtime role grants on top of the config: "channel:<id>" / "command:<name>" -> role IDs
+        self.role_rules = {}
+        # Compiled command roles and role_id -> grants index used by MemberAuthCache
+        self.command_roles = {}
+        self.role_index = {}
+        # Sorted allowlist for paginated listing, rebuilt lazily after changes
+        self._sorted_allowed = None
+        # Optional StateStore that allowlist changes are written behind to
+        self.state = None
+
+    @classmethod
+    def from_config(cls, policy_config):
+        """Compile a PolicyConfig into a store"""
+        store = cls(policy_config.allowed_users)
+        rules = {}
+        for channel in policy_config.channels.values():
+            guild = policy_config.guilds.get(channel.guild_id)
+            users = channel.allowed_users
+            roles = policy_config.allowed_roles | channel.allowed_roles
+            escalation = channel.escalation
+            if guild:
+                users = users | guild.allowed_users
+                roles = roles | guild.allowed_roles
+                escalation = escalation or guild.escalation
+            # Joins only escalate where a channel or guild ladder is configured
+            if escalation:
+                escalation = policy_config.escalation_for(channel.guild_id, escalation)
+            else:
+                escalation = None
+            rules[channel.channel_id] = (
+                channel.guild_id, channel.destination_id, users, roles, escalation
+            )
+        store._rules = rules
+        store._command_roles = dict(policy_config.command_roles)
+        store._compile()
+        return store
+
+    def _compile(self):
+        """Rebuild the channel lookup table and role index and swap them in"""
+        role_rules = self.role_rules
+        channels = {
+            channel_id: ChannelPolicy(
+                channel_id,
+                guild_id,
+                destination_id,
+                self.allowed_users | users,
+                roles | role_rules.get(f"channel:{channel_id}", frozenset()),
+                escalation
+            )
+            for channel_id, (guild_id, destination_id, users, roles, escalation) in self._rules.items()
+        }
+        command_roles = dict(self._command_roles)
+        for scope, roles in role_rules.items():
+            if scope.startswith('command:'):
+                name = scope.split(':', 1)[1]
+                command_roles[name] = command_roles.get(name, frozenset()) | roles
+
+        # role_id -> everything that role grants: channel IDs and "command:<name>"
+        index = {}
+        for policy in channels.values():
+            for role_id in policy.roles:
+                index.setdefault(role_id, set()).add(policy.channel_id)
+        for name, roles in command_roles.items():
+            for role_id in roles:
+                index.setdefault(role_id, set()).add(f"command:{name}")
+
+        self.command_roles = command_roles
+        self.role_index = {role_id: frozenset(grants) for role_id, grants in index.items()}
+        self.channels = channels
+        self._sorted_allowed = None
+
+    def policy_for(self, channel_id):
+        """Return the policy for a monitored channel, or None"""
+        return self.channels.get(channel_id)
+
+    def is_allowed(self, user_id):
+        """Check the command allowlist"""
+        return user_id in self.allowed_users
+
+    # Everything needed to use the store without recompiling it
+    SNAPSHOT_FIELDS = (
+        'allowed_users', '_rules', 'channels', 'overrides', '_command_roles',
+        'role_rules', 'command_roles', 'role_index'
+    )
+    SNAPSHOT_VERSION = 2
+
+    def snapshot(self, config_digest, generation):
+        """Capture the compiled tables for write_policy_snapshot
+
+        Tables are replaced rather than mutated, except the overrides, which
+        are copied so the snapshot can be encoded and written from another thread.
+        """
+        tables = {name: getattr(self, name) for name in self.SNAPSHOT_FIELDS}
+        tables['overrides'] = dict(self.overrides)
+        return {
+            'version': self.SNAPSHOT_VERSION,
+            'config_digest': config_digest,
+            'generation': generation,
+            'tables': tables,
+        }
+
+    @classmethod
+    def load_snapshot(cls, path, config_digest, generation):
+        """Load a store saved by write_policy_snapshot, or None if missing or stale"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (
+            not isinstance(data, dict)
+            or data.get('version') != cls.SNAPSHOT_VERSION
+            or data.get('config_digest') != config_digest
+            or data.get('generation') != generation
+        ):
+            return None
+        try:
+            tables = cls.decode_tables(data['tables'])
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring malformed policy snapshot {path}: {e!r}")
+            return None
+        store = cls()
+        for name, value in tables.items():
+            setattr(store, name, value)
+        return store
+
+    @staticmethod
+    def encode_tables(tables):
+        """Snapshot tables as JSON-compatible data; IDs used as keys become strings"""
+        def escalation(policy):
+            if policy is None:
+                return None
+            return {f.name: getattr(policy, f.name) for f in fields(policy) if f.init}
+
+        return {
+            'allowed_users': sorted(tables['allowed_users']),
+            '_rules': {
+                str(channel_id): [guild_id, destination_id, sorted(users), sorted(roles), escalation(policy)]
+                for channel_id, (guild_id, destination_id, users, roles, policy) in tables['_rules'].items()
+            },
+            'channels': {
+                str(channel_id): [
+                    policy.guild_id, policy.destination_id, sorted(policy.users),
+                    sorted(policy.roles), escalation(policy.escalation)
+                ]
+                for channel_id, policy in tables['channels'].items()
+            },
+            'overrides': {str(user_id): allowed for user_id, allowed in tables['overrides'].items()},
+            '_command_roles': {name: sorted(roles) for name, roles in tables['_command_roles'].items()},
+            'role_rules': {scope: sorted(roles) for scope, roles in tables['role_rules'].items()},
+            'command_roles': {name: sorted(roles) for name, roles in tables['command_roles'].items()},
+            # Grants mix channel IDs and "command:<name>" strings, so they stay unsorted
+            'role_index': {str(role_id): list(grants) for role_id, grants in tables['role_index'].items()},
+        }
+
+    @staticmethod
+    def decode_tables(tables):
+        """Rebuild the tables encode_tables wrote; raises KeyError, TypeError or ValueError if malformed"""
+        def optional_int(value):
+            return None if value is None else int(value)
+
+        def escalation(data):
+            if data is None:
+                return None
+            return EscalationPolicy(
+                steps=tuple((int(attempts), int(minutes), str(action)) for attempts, minutes, action in data['steps']),
+                window=float(data['window']),
+                dry_run=bool(data['dry_run']),
+                lockout_attempts=int(data['lockout_attempts']),
+                lockout_seconds=float(data['lockout_seconds'])
+            )
+
+        def ids(values):
+            return frozenset(int(value) for value in values)
+
+        def grant(value):
+            return value if isinstance(value, str) else int(value)
+
+        return {
+            'allowed_users': ids(tables['allowed_users']),
+            '_rules': {
+                int(channel_id): (optional_int(guild_id), int(destination_id), ids(users), ids(roles), escalation(policy))
+                for channel_id, (guild_id, destination_id, users, roles, policy) in tables['_rules'].items()
+            },
+            'channels': {
+                int(channel_id): ChannelPolicy(
+                    int(channel_id), optional_int(guild_id), int(destination_id),
+                    ids(users), ids(roles), escalation(policy)
+                )
+                for channel_id, (guild_id, destination_id, users, roles, policy) in tables['channels'].items()
+            },
+            'overrides': {int(user_id): bool(allowed) for user_id, allowed in tables['overrides'].items()},
+            '_command_roles': {str(name): ids(roles) for name, roles in tables['_command_roles'].items()},
+            'role_rules': {str(scope): ids(roles) for scope, roles in tables['role_rules'].items()},
+            'command_roles': {str(name): ids(roles) for name, roles in tables['command_roles'].items()},
+            'role_index': {
+                int(role_id): frozenset(grant(value) for value in grants)
+                for role_id, grants in tables['role_index'].items()
+            },
+        }
+
+    def sorted_allowed(self):
+        """Allowlisted user IDs in order, cached until the allowlist changes"""
+        if self._sorted_allowed is None:
+            self._sorted_allowed = sorted(self.allowed_users)
+        return self._sorted_allowed
+
+    def allow(self, user_ids):
+        """Add users to the allowlist, returning the IDs that were new"""
+        added = frozenset(user_ids) - self.allowed_users
+        if added:
+            self.allowed_users = self.allowed_users | added
+            self.overrides.update(dict.fromkeys(added, True))
+            self._compile()
+            if self.state:
+                self.state.set_allowed(added, True)
+        return added
+
+    def remove(self, user_ids):
+        """Remove users from the allowlist, returning the IDs that were present"""
+        removed = frozenset(user_ids) & self.allowed_users
+        if removed:
+            self.allowed_users = self.allowed_users - removed
+            self.overrides.update(dict.fromkeys(removed, False))
+            self._compile()
+            if self.state:
+                self.state.set_allowed(removed, False)
+        return removed
+
+    def apply_overrides(self, overrides):
+        """Apply persisted allow/remove overrides on top of the configured allowlist"""
+        allowed = {user_id for user_id, is_allowed in overrides if is_allowed}
+        removed = {user_id for user_id, is_allowed in overrides if not is_allowed}
+        self.overrides.update(overrides)
+        self.allowed_users = (self.allowed_users | allowed) - removed
+        self._compile()
+
+    def apply_role_rules(self, role_rules):
+        """Apply runtime role grants (scope -> role IDs) without persisting them"""
+        merged = dict(self.role_rules)
+        for scope, roles in role_rules:
+            merged[scope] = merged.get(scope, frozenset()) | frozenset(roles)
+        self.role_rules = merged
+        self._compile()
+
+    def _config_roles(self, scope):
+        """Role IDs the config itself grants for a "channel:<id>" / "command:<name>" scope"""
+        kind, _, target = scope.partition(':')
+        if kind == 'channel':
+            rule = self._rules.get(int(target))
+            return rule[3] if rule else frozenset()
+        return self._command_roles.get(target, frozenset())
+
+    def export_rules(self):
+        """Allow rules as plain data
+
+        'roles' holds only the runtime role grants, which is what import_rules
+        restores; the grants config.ini makes are listed under 'config_roles'
+        for reference and ignored on import.
+        """
+        config_roles = {}
+        for channel_id, rule in self._rules.items():
+            if rule[3]:
+                config_roles[f"channel:{channel_id}"] = sorted(rule[3])
+        for name, role_ids in self._command_roles.items():
+            if role_ids:
+                config_roles[f"command:{name}"] = sorted(role_ids)
+        roles = {scope: sorted(role_ids) for scope, role_ids in self.role_rules.items() if role_ids}
+        return {'users': sorted(self.allowed_users), 'roles': roles, 'config_roles': config_roles}
+
+    def import_rules(self, data, replace=False):
+        """Apply exported allow rules as one atomic update
+
+        By default users and role grants are merged into the current rules;
+        with replace=True the allowlist and runtime role grants become exactly
+        what was imported. Role grants config.ini already makes are dropped,
+        so they are never persisted as runtime rules. Returns (users added,
+        users removed).
+        """
+        users = frozenset(int(user_id) for user_id in data.get('users', ()))
+        role_rules = {}
+        for scope, role_ids in data.get('roles', {}).items():
+            kind, _, target = scope.partition(':')
+            if kind == 'channel':
+                int(target)
+            elif kind != 'command' or not target:
+                raise ValueError(f"Unknown rule scope: {scope}")
+            roles = frozenset(int(role_id) for role_id in role_ids) - self._config_roles(scope)
+            if roles:
+                role_rules[scope] = roles
+
+        if replace:
+            allowed_users = users
+        else:
+            allowed_users = self.allowed_users | users
+            for scope, roles in self.role_rules.items():
+                role_rules[scope] = role_rules.get(scope, frozenset()) | roles
+        added = allowed_users - self.allowed_users
+        removed = self.allowed_users - allowed_users
+
+        self.allowed_users = allowed_users
+        self.role_rules = role_rules
+        self.overrides.update(dict.fromkeys(added, True))
+        self.overrides.update(dict.fromkeys(removed, False))
+        self._compile()
+        if self.state:
+            self.state.set_allowed(added, True)
+            self.state.set_allowed(removed, False)
+            self.state.replace_role_rules(role_rules)
+        return added, removed
+
+def write_policy_snapshot(path, data):
+    """Atomically write a PolicyStore snapshot as JSON"""
+    data = dict(data, tables=PolicyStore.encode_tables(data['tables']))
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+class MemberAuthCache:
+    """Cache of what each member's roles grant, kept current from member updates
+
+    A member's roles are walked once, against the policy store's role index,
+    and the resulting set of grants (channel IDs and "command:<name>") is
+    cached. Role changes refresh a single entry; a new role index (reload or
+    rule change) drops the whole cache.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.index = None
+        # (guild_id, member_id) -> frozenset of grants
+        self._grants = {}
+        self.stats = {'hits': 0, 'misses': 0, 'refreshes': 0}
+
+    @staticmethod
+    def _key(member):
+        guild = getattr(member, 'guild', None)
+        return (guild.id if guild else None, member.id)
+
+    @staticmethod
+    def compute(member, index):
+        """Walk a member's roles against a role index, without caching"""
+        grants = [index[role.id] for role in getattr(member, 'roles', ()) if role.id in index]
+        return frozenset().union(*grants)
+
+    def grants(self, member, index):
+        """Everything the member's roles grant under the given role index"""
+        if index is not self.index:
+            self.index = index
+            self._grants = {}
+        key = self._key(member)
+        grants = self._grants.get(key)
+        if grants is not None:
+            self.stats['hits'] += 1
+            return grants
+        self.stats['misses'] += 1
+        grants = self.compute(member, self.index)
+        if len(self._grants) >= self.max_entries:
+            # Evict the oldest entry; dicts keep insertion order
+            del self._grants[next(iter(self._grants))]
+        self._grants[key] = grants
+        return grants
+
+    def refresh(self, member):
+        """Recompute a cached member after a role change"""
+        key = self._key(member)
+        if self.index is not None and key in self._grants:
+            self.stats['refreshes'] += 1
+            self._grants[key] = self.compute(member, self.index)
+
+    def discard(self, member):
+        """Forget a member who left the guild"""
+        self._grants.pop(self._key(member), None)
+
 class SecurityResponse:
-    def __init__(self):
-        # Tracks attempts per user with timestamps
+    def __init__(self, guild_id=0, policy=None, clock=time.time):
+        # Guild this instance tracks; 0 for commands sent outside a guild
+        self.guild_id = guild_id
+        # Epoch-seconds clock, injectable so long soaks can run on simulated time
+        self.clock = clock
+        # Tracks attempts per user as a deque of epoch timestamps, oldest first
         self.attempts = {}
         # Tracks current warning level per user
         self.warning_levels = {}
-        # Tracks user timeouts
+        # Tracks user timeouts as epoch expiry times
         self.timeout_until = {}
-        
-        # Escalation configuration
-        self.ESCALATION_LEVELS = {
-            # Level: (max_attempts, timeout_duration_minutes, action)
-            1: (2, 5, "warn"),           # Warning after 2 attempts
-            2: (3, 15, "timeout"),       # 15-min timeout after 3 attempts
-            3: (4, 60, "long_timeout"),  # 1-hour timeout after 4 attempts
-            4: (5, 1440, "ban")          # Ban after 5 attempts
+        # Min-heap of (expires_at, user_id), at most one live entry per user
+        self._expiry = []
+        self._scheduled = {}
+        # Running aggregates for security_status: users per warning level,
+        # timeouts sorted by expiry as (expires_at, user_id), and a max-heap
+        # of (-attempts, user_id) offenders whose stale entries are skipped lazily
+        self.level_counts = Counter()
+        self.timeout_order = []
+        self._offenders = []
+        # Optional StateStore that changes are written behind to
+        self.state = None
+        self.set_policy(policy or EscalationPolicy())
+
+    def set_policy(self, policy):
+        """Use a compiled EscalationPolicy; its window bounds tracked attempts"""
+        self.policy = policy
+        # Time window for tracking attempts, in seconds
+        self.ATTEMPT_WINDOW = policy.window
+
+    def _user_expiry(self, user_id):
+        """When all state for a user can be dropped"""
+        attempts = self.attempts.get(user_id)
+        expires_at = attempts[-1] + self.ATTEMPT_WINDOW if attempts else 0
+        return max(expires_at, self.timeout_until.get(user_id, 0))
+
+    def _schedule(self, user_id):
+        """Make sure the user has an entry in the expiry heap"""
+        if user_id not in self._scheduled:
+            expires_at = self._user_expiry(user_id)
+            self._scheduled[user_id] = expires_at
+            heapq.heappush(self._expiry, (expires_at, user_id))
+
+    def purge_expired(self, now=None):
+        """Evict idle users and expired timeouts
+
+        Each user has at most one heap entry; when it comes due and the user
+        has been active since, it is pushed back once rather than once per
+        attempt, keeping this amortized O(1) per attempt.
+        """
+        if now is None:
+            now = self.clock()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, user_id = heapq.heappop(self._expiry)
+            expires_at = self._user_expiry(user_id)
+            if expires_at > now:
+                self._scheduled[user_id] = expires_at
+                heapq.heappush(self._expiry, (expires_at, user_id))
+                continue
+            del self._scheduled[user_id]
+            self.attempts.pop(user_id, None)
+            self._drop_level(user_id)
+            self._drop_timeout(user_id)
+            if self.state:
+                self.state.forget_user(self.guild_id, user_id)
+
+    def _set_level(self, user_id, level):
+        self._drop_level(user_id)
+        self.warning_levels[user_id] = level
+        self.level_counts[level] += 1
+
+    def _drop_level(self, user_id):
+        level = self.warning_levels.pop(user_id, None)
+        if level is not None:
+            self.level_counts[level] -= 1
+            if not self.level_counts[level]:
+                del self.level_counts[level]
+
+    def _set_timeout_until(self, user_id, until):
+        self._drop_timeout(user_id)
+        self.timeout_until[user_id] = until
+        bisect.insort(self.timeout_order, (until, user_id))
+
+    def _drop_timeout(self, user_id):
+        until = self.timeout_until.pop(user_id, None)
+        if until is not None:
+            index = bisect.bisect_left(self.timeout_order, (until, user_id))
+            if index < len(self.timeout_order) and self.timeout_order[index] == (until, user_id):
+                del self.timeout_order[index]
+
+    def set_timeout(self, user_id, seconds):
+        """Put a user in timeout for the given number of seconds"""
+        self._set_timeout_until(user_id, self.clock() + seconds)
+        # The heap entry is re-checked when it comes due, so only new users need one
+        self._schedule(user_id)
+        self._persist_user(user_id)
+
+    def set_warning_level(self, user_id, level):
+        """Record the escalation level a user has reached"""
+        self._set_level(user_id, level)
+        self._persist_user(user_id)
+
+    def _persist_user(self, user_id):
+        if self.state:
+            self.state.save_user(
+                self.guild_id,
+                user_id,
+                self.warning_levels.get(user_id, 0),
+                self.timeout_until.get(user_id)
+            )
+
+    def restore(self, attempt_rows, user_rows):
+        """Load persisted attempts and per-user state, dropping anything expired"""
+        now = self.clock()
+        cutoff = now - self.ATTEMPT_WINDOW
+        for user_id, timestamp in attempt_rows:
+            if timestamp > cutoff:
+                self.attempts.setdefault(user_id, deque()).append(timestamp)
+        for user_id, level, timeout_until in user_rows:
+            self._set_level(user_id, level)
+            if timeout_until and timeout_until > now:
+                self._set_timeout_until(user_id, timeout_until)
+        for user_id in self.attempts:
+            if user_id not in self.warning_levels:
+                self._set_level(user_id, 0)
+        for user_id in set(self.warning_levels):
+            self._schedule(user_id)
+        self.purge_expired(now)
+        self._rebuild_offenders()
+
+    def timeout_remaining(self, user_id):
+        """Seconds left on a user's timeout, clearing it once expired"""
+        until = self.timeout_until.get(user_id)
+        if until is None:
+            return 0
+        remaining = until - self.clock()
+        if remaining <= 0:
+            self._drop_timeout(user_id)
+            return 0
+        return remaining
+
+    def record_attempt(self, user_id, now=None):
+        """Record an attempt and return the number of attempts inside the window"""
+        if now is None:
+            now = self.clock()
+        self.purge_expired(now)
+
+        attempts = self.attempts.get(user_id)
+        # Initialize tracking for new users
+        if attempts is None:
+            attempts = self.attempts[user_id] = deque()
+            if user_id not in self.warning_levels:
+                self._set_level(user_id, 0)
+
+        # Drop attempts that fell out of the window
+        cutoff = now - self.ATTEMPT_WINDOW
+        while attempts and attempts[0] <= cutoff:
+            attempts.popleft()
+        attempts.append(now)
+        self._schedule(user_id)
+        heapq.heappush(self._offenders, (-len(attempts), user_id))
+        # Older entries for the same user pile up; rebuild once they dominate
+        if len(self._offenders) > 2 * len(self.attempts) + 64:
+            self._rebuild_offenders()
+        if self.state:
+            self.state.record_attempt(self.guild_id, user_id, now)
+        return len(attempts)
+
+    def _rebuild_offenders(self):
+        self._offenders = [
+            (-len(attempts), user_id) for user_id, attempts in self.attempts.items() if attempts
+        ]
+        heapq.heapify(self._offenders)
+
+    def top_offenders(self, n, now=None):
+        """The n users with the most attempts inside the window, as (user_id, attempts)
+
+        Heap entries are checked against the live attempt count as they are
+        popped: outdated ones are dropped, and one whose attempts have since
+        aged out is filed again under the lower count. The valid entries are
+        pushed back, so a call costs O(n log N) plus the stale entries it skips.
+        """
+        if now is None:
+            now = self.clock()
+        cutoff = now - self.ATTEMPT_WINDOW
+        heap = self._offenders
+        top = []
+        seen = set()
+        while heap and len(top) < n:
+            count, user_id = heapq.heappop(heap)
+            attempts = self.attempts.get(user_id)
+            if not attempts or user_id in seen:
+                continue
+            while attempts and attempts[0] <= cutoff:
+                attempts.popleft()
+            current = len(attempts)
+            if current != -count:
+                # A larger count means a newer entry is still in the heap
+                if 0 < current < -count:
+                    heapq.heappush(heap, (-current, user_id))
+                continue
+            seen.add(user_id)
+            top.append((user_id, current))
+        for user_id, current in top:
+            heapq.heappush(heap, (-current, user_id))
+        return top
+
+    def active_timeouts(self, now=None):
+        """Index of the first unexpired entry in timeout_order"""
+        if now is None:
+            now = self.clock()
+        return bisect.bisect_right(self.timeout_order, (now, float('inf')))
+
+    def summary(self, top=10, now=None):
+        """Counts for security_status, read from the running aggregates"""
+        if now is None:
+            now = self.clock()
+        return {
+            'locked': len(self.timeout_order) - self.active_timeouts(now),
+            'tracked': len(self.attempts),
+            'levels': sorted(self.level_counts.items()),
+            'top': self.top_offenders(top, now),
         }
-        
-        # Time window for tracking attempts (24 hours)
-        self.ATTEMPT_WINDOW = timedelta(hours=24)
 
     async def handle_unauthorized_attempt(self, ctx, bot):
         """Handle unauthorized command attempt with escalating responses"""
-        user_id = ctx.author.id
-        current_time = datetime.now()
-        
-        # Initialize tracking for new users
-        if user_id not in self.attempts:
-            self.attempts[user_id] = []
-            self.warning_levels[user_id] = 0
-            
-        # Clean up old attempts outside the window
-        self.attempts[user_id] = [
-            timestamp for timestamp in self.attempts[user_id]
-            if current_time - timestamp < self.ATTEMPT_WINDOW
-        ]
-        
-        # Add new attempt
-        self.attempts[user_id].append(current_time)
-        
-        # Check if user is in timeout
-        if user_id in self.timeout_until:
-            if current_time < self.timeout_until[user_id]:
-                remaining_time = (self.timeout_until[user_id] - current_time)
-                if NOTIFY_ON_UNAUTHORIZED:
-                    await ctx.author.send(
-                        f"You are in timeout for {remaining_time.seconds // 60} more minutes. "
-                        "Further attempts will result in increased restrictions."
-                    )
-                return
-            else:
-                del self.timeout_until[user_id]
-        
-        # Determine appropriate escalation level
-        attempt_count = len(self.attempts[user_id])
-        
-        for level, (max_attempts, timeout_mins, action) in self.ESCALATION_LEVELS.items():
-            if attempt_count >= max_attempts and self.warning_levels[user_id] < level:
-                self.warning_levels[user_id] = level
-                await self._apply_escalation(ctx, bot, level, timeout_mins, action)
-                break
-                
+        await self.handle_violation(
+            ctx.author,
+            ctx.guild,
+            bot,
+            f"Attempted command: {ctx.command}",
+            channel_id=ctx.channel.id if ctx.channel else None
+        )
+
+    async def handle_unauthorized_join(self, member, policy, bot):
+        """Count an unauthorized join against a channel's own escalation ladder"""
+        await self.handle_violation(
+            member,
+            member.guild,
+            bot,
+            f"Joined monitored channel {policy.channel_id}",
+            policy=policy.escalation,
+            channel_id=policy.channel_id
+        )
+
+    def evaluate(self, user_id, policy=None, now=None, enforce=True):
+        """Record an attempt and decide the response under a policy
+
+        Returns (outcome, step): outcome is 'in_timeout', 'escalate',
+        'lockout' or None, and step is the (attempts, timeout_mins, action)
+        reached when escalating. Warning levels always advance; bot-side
+        timeouts are only set when enforce is true. Discord actions are left
+        to the caller, so simulations can replay attempts through this too.
+        """
+        policy = policy or self.policy
+        if now is None:
+            now = self.clock()
+        attempt_count = self.record_attempt(user_id, now)
+
+        if self.timeout_remaining(user_id):
+            return 'in_timeout', None
+
+        escalation = policy.next_step(self.warning_levels[user_id], attempt_count)
+        if escalation:
+            level, step = escalation
+            self.set_warning_level(user_id, level)
+            if enforce and step[2] in ("timeout", "long_timeout"):
+                self.set_timeout(user_id, step[1] * 60)
+            return 'escalate', step
+        if policy.locks_out(attempt_count):
+            if enforce:
+                self.set_timeout(user_id, policy.lockout_seconds)
+            return 'lockout', None
+        return None, None
+
+    async def handle_violation(self, user, guild, bot, description, policy=None, channel_id=None):
+        """Record a violation and apply the next escalation step if one is due"""
+        user_id = user.id
+        policy = policy or self.policy
+        outcome, step = self.evaluate(user_id, policy, enforce=not policy.dry_run)
+        level = self.warning_levels[user_id]
+
+        if outcome == 'in_timeout':
+            if NOTIFY_ON_UNAUTHORIZED:
+                remaining_time = self.timeout_remaining(user_id)
+                bot.notifications.notify(
+                    user,
+                    f"You are in timeout for {int(remaining_time // 60)} more minutes. "
+                    "Further attempts will result in increased restrictions.",
+                    key="timeout-reminder"
+                )
+        elif policy.dry_run and outcome:
+            action = step[2] if step else "lockout"
+            await bot.log_security_event(
+                "ESCALATION_DRY_RUN",
+                user_id,
+                f"Would apply {action} (Level {level})",
+                guild_id=guild.id if guild else None,
+                channel_id=channel_id
+            )
+        elif outcome == 'escalate':
+            await self._apply_escalation(user, guild, bot, level, step[1], step[2])
+        elif outcome == 'lockout':
+            if NOTIFY_ON_UNAUTHORIZED:
+                bot.notifications.notify(
+                    user,
+                    f"You have been temporarily locked out of bot commands for "
+                    f"{int(policy.lockout_seconds)} seconds due to repeated failed attempts.",
+                    key="lockout"
+                )
+            await bot.log_security_event(
+                "LOCKOUT",
+                user_id,
+                f"Locked out for {int(policy.lockout_seconds)}s after "
+                f"{len(self.attempts[user_id])} failed attempts",
+                guild_id=guild.id if guild else None,
+                channel_id=channel_id
+            )
+
+        bot.metrics.inc(
+            'hallmonitor_unauthorized_attempts_total',
+            (('level', self.warning_levels[user_id]),)
+        )
+
         # Log the attempt
         await bot.log_security_event(
             "UNAUTHORIZED_ATTEMPT",
             user_id,
-            f"Attempted command: {ctx.command} (Level {self.warning_levels[user_id]})"
+            f"{description} (Level {level})" + (" (in timeout)" if outcome == 'in_timeout' else ""),
+            guild_id=guild.id if guild else None,
+            channel_id=channel_id
         )
 
-    async def _apply_escalation(self, ctx, bot, level, timeout_mins, action):
+    async def _apply_escalation(self, user, guild, bot, level, timeout_mins, action):
         """Apply the appropriate escalation response"""
-        user = ctx.author
-        guild = ctx.guild
 
         if action == "warn":
             if NOTIFY_ON_UNAUTHORIZED:
-                await user.send(
+                bot.notifications.notify(
+                    user,
                     f"⚠️ Warning (Level {level}): Unauthorized command attempts detected. "
                     "Further attempts will result in increased restrictions."
                 )
                 
         elif action == "timeout":
-            self.timeout_until[user.id] = datetime.now() + timedelta(minutes=timeout_mins)
             if NOTIFY_ON_UNAUTHORIZED:
-                await user.send(
+                bot.notifications.notify(
+                    user,
                     f"🚫 You have been timed out for {timeout_mins} minutes. "
                     "Please refrain from unauthorized actions."
                 )
             try:
-                await user.timeout(timedelta(minutes=timeout_mins), reason="Unauthorized command attempts")
+                await bot.sanction(
+                    'timeout', guild, user.id,
+                    lambda: user.timeout(timedelta(minutes=timeout_mins), reason="Unauthorized command attempts"),
+                    {'until': time.time() + timeout_mins * 60}
+                )
             except discord.errors.Forbidden:
                 await bot.log_security_event(
                     "ERROR",
@@ -128,30 +1461,88 @@ class SecurityResponse:
                 )
                     
         elif action == "long_timeout":
-            self.timeout_until[user.id] = datetime.now() + timedelta(minutes=timeout_mins)
             if NOTIFY_ON_UNAUTHORIZED:
-                await user.send(
+                bot.notifications.notify(
+                    user,
                     f"⛔ Extended timeout ({timeout_mins // 60} hours) applied. "
                     "Continued attempts will result in a ban."
                 )
             try:
-                await user.timeout(timedelta(minutes=timeout_mins), reason="Unauthorized command attempts")
+                await bot.sanction(
+                    'timeout', guild, user.id,
+                    lambda: user.timeout(timedelta(minutes=timeout_mins), reason="Unauthorized command attempts"),
+                    {'until': time.time() + timeout_mins * 60}
+                )
             except discord.errors.Forbidden:
                 await bot.log_security_event(
                     "ERROR",
                     user.id,
                     f"Failed to timeout user - Missing permissions"
                 )
+
+        elif action == "kick":
+            try:
+                await bot.sanction(
+                    'kick', guild, user.id,
+                    lambda: guild.kick(user, reason="Repeated unauthorized attempts")
+                )
+                if NOTIFY_ON_UNAUTHORIZED:
+                    bot.notifications.notify(
+                        user,
+                        "👢 You have been removed from the server due to repeated "
+                        "unauthorized attempts."
+                    )
+                await bot.log_security_event(
+                    "KICK",
+                    user.id,
+                    "User has been kicked due to unauthorized attempts",
+                    guild_id=guild.id
+                )
+            except discord.errors.Forbidden:
+                await bot.log_security_event(
+                    "ERROR",
+                    user.id,
+                    f"Failed to kick user - Missing permissions"
+                )
+
+        elif action == "role_strip":
+            # Remove the roles that grant access to monitored channels or commands
+            roles = [role for role in getattr(user, 'roles', ()) if role.id in bot.policies.role_index]
+            if not roles:
+                return
+            try:
+                await bot.sanction(
+                    'role_strip', guild, user.id,
+                    lambda: user.remove_roles(*roles, reason="Repeated unauthorized attempts"),
+                    {'roles': [role.id for role in roles]}
+                )
+                bot.auth_cache.refresh(user)
+                await bot.log_security_event(
+                    "ROLE_STRIP",
+                    user.id,
+                    f"Removed roles {', '.join(str(role.id) for role in roles)}",
+                    guild_id=guild.id
+                )
+            except discord.errors.Forbidden:
+                await bot.log_security_event(
+                    "ERROR",
+                    user.id,
+                    f"Failed to remove roles - Missing permissions"
+                )
                     
         elif action == "ban":
             try:
-                await guild.ban(
-                    user,
-                    reason="Excessive unauthorized bot command attempts",
-                    delete_message_days=1
+                await bot.sanction(
+                    'ban', guild, user.id,
+                    lambda: guild.ban(
+                        user,
+                        reason="Excessive unauthorized bot command attempts",
+                        delete_message_days=1
+                    )
                 )
                 if NOTIFY_ON_UNAUTHORIZED:
-                    await user.send(
+                    bot.notifications.notify(
+                        user,
                         "🔨 You have been banned from the server due to excessive "
                         "unauthorized bot command attempts. Contact server administrators "
                         "if you believe this was in error."
@@ -159,7 +1550,8 @@ class SecurityResponse:
                 await bot.log_security_event(
                     "BAN",
                     user.id,
-                    "User has been banned due to unauthorized attempts"
+                    "User has been banned due to unauthorized attempts",
+                    guild_id=guild.id
                 )
             except discord.errors.Forbidden:
                 await bot.log_security_event(
@@ -168,180 +1560,2717 @@ class SecurityResponse:
                     f"Failed to ban user - Missing permissions"
                 )
 
-class SecureBot(commands.Bot):
-    def __init__(self):
-        intents = discord.Intents.default()
-        intents.voice_states = True
-        intents.members = True
-        super().__init__(command_prefix='!', intents=intents)
-        self.security = SecurityResponse()
+def simulate_escalation(entries, policy):
+    """Replay journaled unauthorized attempts against an escalation policy
 
-    async def log_security_event(self, event_type, user_id, details):
-        """Log security events to file and Discord channel"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"{timestamp} - {event_type} - User: {user_id} - {details}"
-        
-        # Log to file
-        logging.info(log_message)
-        
-        # Log to Discord channel
-        if LOG_CHANNEL_ID:
-            channel = self.get_channel(LOG_CHANNEL_ID)
-            if channel:
-                await channel.send(f"```\n{log_message}\n```")
+    Each guild gets a fresh SecurityResponse running on the entries' own
+    timestamps, with no persistence and no Discord actions. Returns a Counter
+    of attempts and of the outcome each attempt produced.
+    """
+    responses = {}
+    outcomes = Counter()
+    now = [0.0]
+    for entry in entries:
+        now[0] = entry['ts']
+        guild_id = entry.get('guild_id') or 0
+        security = responses.get(guild_id)
+        if security is None:
+            security = responses[guild_id] = SecurityResponse(guild_id, policy, clock=lambda: now[0])
+        outcome, step = security.evaluate(entry['user_id'], now=entry['ts'])
+        outcomes['attempts'] += 1
+        outcomes[step[2] if step else (outcome or 'no action')] += 1
+    return outcomes
 
-    async def check_authorization(self, ctx):
-        """Check if user is authorized and handle unauthorized attempts"""
-        user_id = ctx.author.id
+class StateStore:
+    """SQLite (WAL) persistence for allowlist overrides and SecurityResponse state
 
-        # Owner is always authorized
-        if user_id == OWNER_ID:
-            await self.log_security_event(
-                "AUTHORIZED_COMMAND",
-                user_id,
-                f"Executed command: {ctx.command}"
-            )
-            return True
+    Changes are buffered in memory and a write-behind task commits them in one
+    transaction per flush on a worker thread, so commands never wait on fsync.
+    A crash loses at most the last flush interval of changes and never leaves
+    the database half-written.
+    """
 
-        # Check if user is in timeout
-        if user_id in self.security.timeout_until:
-            if datetime.now() < self.security.timeout_until[user_id]:
-                remaining_time = self.security.timeout_until[user_id] - datetime.now()
-                await self.log_security_event(
-                    "BLOCKED_ATTEMPT",
-                    user_id,
-                    f"Attempted command while in timeout: {ctx.command}"
-                )
-                if NOTIFY_ON_UNAUTHORIZED:
-                    await ctx.author.send(
-                        f"You are in timeout for {remaining_time.seconds // 60} more minutes."
-                    )
-                return False
-            else:
-                # Timeout expired
-                del self.security.timeout_until[user_id]
+    SCHEMA_VERSION = 6
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS allowlist (
+            user_id INTEGER PRIMARY KEY,
+            allowed INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS attempts (
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            user_id INTEGER NOT NULL,
+            ts REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS attempts_ts ON attempts (ts);
+        CREATE TABLE IF NOT EXISTS role_rules (
+            scope TEXT NOT NULL,
+            role_id INTEGER NOT NULL,
+            PRIMARY KEY (scope, role_id)
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            user_id INTEGER NOT NULL,
+            warning_level INTEGER NOT NULL,
+            timeout_until REAL,
+            PRIMARY KEY (guild_id, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS outbox (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            payload TEXT,
+            created REAL NOT NULL,
+            PRIMARY KEY (guild_id, user_id, action)
+        );
+        CREATE TABLE IF NOT EXISTS managed_overwrites (
+            channel_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            target_id INTEGER NOT NULL,
+            PRIMARY KEY (channel_id, kind, target_id)
+        );
+    """
 
-        # Check if user is allowed
-        if user_id in ALLOWED_USER_IDS:
+    def __init__(self, path, flush_interval=1.0, attempt_window=24 * 60 * 60):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.attempt_window = attempt_window
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self.conn.executescript(self.SCHEMA)
+        self.conn.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # Set by stop(); the writer is never cancelled mid-transaction
+        self._stopping = asyncio.Event()
+        # Future of the transaction running on the worker thread, if any
+        self._writing = None
+        # guild_id -> (attempt rows, user rows) read at startup, handed out on first use
+        self._preloaded = {}
+        # Bumped with every allowlist or role rule change, so policy snapshots can be validated
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'policy_generation'").fetchone()
+        self.policy_generation = row[0] if row else 0
+        # Optional coroutine function awaited after each successful flush
+        self.on_flush = None
+        self.stats = {'flushes': 0, 'writes': 0}
+
+    def _migrate(self):
+        """Upgrade databases written before security state was guild-scoped"""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        if version >= 2 or 'users' not in tables:
+            return
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("ALTER TABLE attempts ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("ALTER TABLE users RENAME TO users_v1")
+            self.conn.execute(
+                "CREATE TABLE users (guild_id INTEGER NOT NULL DEFAULT 0, user_id INTEGER NOT NULL, "
+                "warning_level INTEGER NOT NULL, timeout_until REAL, PRIMARY KEY (guild_id, user_id))"
+            )
+            self.conn.execute(
+                "INSERT INTO users (guild_id, user_id, warning_level, timeout_until) "
+                "SELECT 0, user_id, warning_level, timeout_until FROM users_v1"
+            )
+            self.conn.execute("DROP TABLE users_v1")
+
+    def load(self, include_policy=True):
+        """Bulk-read everything needed for a warm start
+
+        With include_policy=False the allowlist and role rules are skipped,
+        for when the policy tables come from a snapshot.
+        """
+        cutoff = time.time() - self.attempt_window
+        allowlist = []
+        role_rules = {}
+        if include_policy:
+            allowlist = self.conn.execute("SELECT user_id, allowed FROM allowlist").fetchall()
+            for scope, role_id in self.conn.execute("SELECT scope, role_id FROM role_rules"):
+                role_rules.setdefault(scope, set()).add(role_id)
+        attempts = self.conn.execute(
+            "SELECT guild_id, user_id, ts FROM attempts WHERE ts > ? ORDER BY ts", (cutoff,)
+        ).fetchall()
+        users = self.conn.execute(
+            "SELECT guild_id, user_id, warning_level, timeout_until FROM users"
+        ).fetchall()
+        return allowlist, attempts, users, role_rules
+
+    def load_into(self, policies, include_policy=True):
+        """Restore the allowlist and stage per-guild security state for restore_security"""
+        allowlist, attempts, users, role_rules = self.load(include_policy)
+        if include_policy:
+            policies.apply_overrides(allowlist)
+            policies.apply_role_rules(role_rules.items())
+        policies.state = self
+        for guild_id, user_id, timestamp in attempts:
+            self._preloaded.setdefault(guild_id, ([], []))[0].append((user_id, timestamp))
+        for guild_id, user_id, level, timeout_until in users:
+            self._preloaded.setdefault(guild_id, ([], []))[1].append((user_id, level, timeout_until))
+
+    def restore_security(self, security):
+        """Restore a guild's SecurityResponse from the startup read and attach this store"""
+        attempts, users = self._preloaded.pop(security.guild_id, ((), ()))
+        security.restore(attempts, users)
+        security.state = self
+
+    def _bump_policy_generation(self):
+        self.policy_generation += 1
+        self._queue(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('policy_generation', ?)",
+            (self.policy_generation,)
+        )
+
+    def set_allowed(self, user_ids, allowed):
+        """Persist allowlist overrides"""
+        if user_ids:
+            self._bump_policy_generation()
+        for user_id in user_ids:
+            self._queue(
+                "INSERT OR REPLACE INTO allowlist (user_id, allowed) VALUES (?, ?)",
+                (user_id, int(allowed))
+            )
+
+    def replace_role_rules(self, role_rules):
+        """Persist the full set of runtime role grants"""
+        self._bump_policy_generation()
+        self._queue("DELETE FROM role_rules", ())
+        for scope, role_ids in role_rules.items():
+            for role_id in role_ids:
+                self._queue(
+                    "INSERT INTO role_rules (scope, role_id) VALUES (?, ?)",
+                    (scope, role_id)
+                )
+
+    def save_outbox(self, guild_id, user_id, action, payload=None):
+        """Persist a sanction that has been scheduled but not yet confirmed"""
+        self._queue(
+            "INSERT OR REPLACE INTO outbox (guild_id, user_id, action, payload, created) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (guild_id, user_id, action, json.dumps(payload), time.time())
+        )
+
+    def clear_outbox(self, guild_id, user_id, action):
+        """Drop a sanction from the outbox once it succeeded or failed for good"""
+        self._queue(
+            "DELETE FROM outbox WHERE guild_id = ? AND user_id = ? AND action = ?",
+            (guild_id, user_id, action)
+        )
+
+    def load_outbox(self):
+        """Sanctions left pending by the previous run, oldest first"""
+        rows = self.conn.execute(
+            "SELECT guild_id, user_id, action, payload FROM outbox ORDER BY created"
+        ).fetchall()
+        return [(guild_id, user_id, action, json.loads(payload)) for guild_id, user_id, action, payload in rows]
+
+    def set_managed_overwrites(self, channel_id, keys):
+        """Persist the overwrite targets the sync owns on a channel"""
+        self._queue("DELETE FROM managed_overwrites WHERE channel_id = ?", (channel_id,))
+        for kind, target_id in keys:
+            self._queue(
+                "INSERT INTO managed_overwrites (channel_id, kind, target_id) VALUES (?, ?, ?)",
+                (channel_id, kind, target_id)
+            )
+
+    def load_managed_overwrites(self):
+        """Overwrite targets owned by the sync, as channel_id -> {(kind, target_id)}"""
+        managed = {}
+        for channel_id, kind, target_id in self.conn.execute(
+            "SELECT channel_id, kind, target_id FROM managed_overwrites"
+        ):
+            managed.setdefault(channel_id, set()).add((kind, target_id))
+        return managed
+
+    def record_attempt(self, guild_id, user_id, timestamp):
+        """Persist one unauthorized attempt"""
+        self._queue(
+            "INSERT INTO attempts (guild_id, user_id, ts) VALUES (?, ?, ?)",
+            (guild_id, user_id, timestamp)
+        )
+
+    def save_user(self, guild_id, user_id, warning_level, timeout_until):
+        """Persist a user's warning level and timeout"""
+        self._queue(
+            "INSERT OR REPLACE INTO users (guild_id, user_id, warning_level, timeout_until) "
+            "VALUES (?, ?, ?, ?)",
+            (guild_id, user_id, warning_level, timeout_until)
+        )
+
+    def forget_user(self, guild_id, user_id):
+        """Drop all persisted state for an expired user"""
+        params = (guild_id, user_id)
+        self._queue("DELETE FROM attempts WHERE guild_id = ? AND user_id = ?", params)
+        self._queue("DELETE FROM users WHERE guild_id = ? AND user_id = ?", params)
+
+    def _queue(self, sql, params):
+        self._pending.append((sql, params))
+        self._wakeup.set()
+
+    def start(self):
+        """Start the write-behind task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="state-writer")
+
+    async def stop(self):
+        """Stop the write-behind task, flush what is pending and close the database
+
+        The task is signalled rather than cancelled, so a transaction already
+        running on the worker thread commits before the final flush and close.
+        """
+        if self._task is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        await self._finish_write()
+        self.conn.close()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            await self._wakeup.wait()
+            # Wait out the flush interval, cut short by stop()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            if self._stopping.is_set():
+                break
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to persist state: {e}")
+
+    async def flush(self):
+        """Commit everything queued so far in a single transaction, requeueing it on failure"""
+        self._wakeup.clear()
+        # One transaction at a time on the connection
+        await self._finish_write()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._writing = asyncio.ensure_future(
+            asyncio.to_thread(self._write, batch, time.time() - self.attempt_window)
+        )
+        try:
+            # Cancelling the caller must not abandon a transaction half-way on the thread
+            await asyncio.shield(self._writing)
+        except Exception:
+            # The transaction rolled back; keep the batch, ahead of anything queued meanwhile
+            self._pending[:0] = batch
+            self._wakeup.set()
+            raise
+        self.stats['flushes'] += 1
+        self.stats['writes'] += len(batch)
+        if self.on_flush:
+            await self.on_flush()
+
+    async def _finish_write(self):
+        """Wait for a transaction still running on the worker thread; its flush handles errors"""
+        while self._writing is not None and not self._writing.done():
+            await asyncio.wait({self._writing})
+
+    def _write(self, batch, cutoff):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for sql, params in batch:
+                self.conn.execute(sql, params)
+            # Attempts outside the window are never read back
+            self.conn.execute("DELETE FROM attempts WHERE ts <= ?", (cutoff,))
+
+class CommandRateLimiter:
+    """Per-user and global token buckets for command invocations
+
+    Per-user state is [tokens, last refill] in an OrderedDict used as an LRU,
+    so memory stays bounded no matter how many distinct users spam commands.
+    An evicted user simply comes back with a full bucket.
+    """
+
+    def __init__(self, rate, burst, global_rate, global_burst, max_users, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_users = max_users
+        self.clock = clock
+        self._users = OrderedDict()
+        self._global = [float(global_burst), clock()]
+        self.stats = {'allowed': 0, 'dropped_user': 0, 'dropped_global': 0, 'evicted': 0}
+
+    @staticmethod
+    def _refill(bucket, rate, burst, now):
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+
+    def check(self, user_id, trusted=False):
+        """Take one token from the user's and, unless trusted, the global bucket
+
+        Trusted (allowlisted) callers skip the global bucket so spam from
+        everyone else cannot lock moderators out. Returns None when the
+        command may run, otherwise the name of the bucket that refused it
+        ('user' or 'global').
+        """
+        now = self.clock()
+        bucket = None
+        if self.rate > 0:
+            bucket = self._users.get(user_id)
+            if bucket is None:
+                bucket = [float(self.burst), now]
+                self._users[user_id] = bucket
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+                    self.stats['evicted'] += 1
+            else:
+                self._users.move_to_end(user_id)
+                self._refill(bucket, self.rate, self.burst, now)
+            if bucket[0] < 1:
+                self.stats['dropped_user'] += 1
+                return 'user'
+
+        if self.global_rate > 0 and not trusted:
+            self._refill(self._global, self.global_rate, self.global_burst, now)
+            if self._global[0] < 1:
+                self.stats['dropped_global'] += 1
+                return 'global'
+            self._global[0] -= 1
+
+        if bucket is not None:
+            bucket[0] -= 1
+        self.stats['allowed'] += 1
+        return None
+
+    def tracked_users(self):
+        """Number of users with bucket state"""
+        return len(self._users)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, cheap enough to record on every event"""
+
+    # Upper bounds in seconds; the last bucket catches everything slower
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        """Record one sample"""
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, q):
+        """Approximate percentile (0-100) as the upper bound of its bucket"""
+        if not self.count:
+            return 0.0
+        rank = self.count * q / 100
+        seen = 0
+        for bound, bucket_count in zip(self.BUCKETS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return self.BUCKETS[-1]
+
+    def summary(self):
+        """One-line human readable summary"""
+        if not self.count:
+            return "no samples"
+        mean_ms = self.total / self.count * 1000
+        return (
+            f"n={self.count} mean={mean_ms:.1f}ms "
+            f"p50<={self.percentile(50) * 1000:g}ms p99<={self.percentile(99) * 1000:g}ms"
+        )
+
+class Metrics:
+    """Counters, histograms and gauges rendered in Prometheus text format
+
+    Everything is recorded from the event loop thread, so plain dict and
+    integer updates are safe without locks and cost well under a microsecond.
+    Labels are passed as tuples of (name, value) pairs.
+    """
+
+    def __init__(self):
+        # (name, labels) -> value
+        self.counters = {}
+        # (name, labels) -> LatencyHistogram
+        self.histograms = {}
+        # (name, labels) -> callable returning the current value, for gauges and sampled counters
+        self.gauges = {}
+        # name -> (type, help)
+        self.descriptions = {}
+
+    def describe(self, name, metric_type, help_text):
+        """Register the TYPE and HELP lines for a metric"""
+        self.descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name, labels=(), amount=1):
+        """Increment a counter"""
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def histogram(self, name, labels=()):
+        """Return the histogram for a name and label set, creating it on first use"""
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        return histogram
+
+    def observe(self, name, seconds, labels=()):
+        """Record a latency sample"""
+        self.histogram(name, labels).observe(seconds)
+
+    def gauge(self, name, func, labels=()):
+        """Register a callable sampled at render time"""
+        self.gauges[(name, labels)] = func
+
+    def counter(self, name, func, labels=()):
+        """Register a callable returning a running total kept elsewhere, sampled at render time"""
+        self.gauges[(name, labels)] = func
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = tuple(labels) + tuple(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def render(self):
+        """Render every metric in Prometheus text exposition format"""
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self.descriptions:
+                described.add(name)
+                metric_type, help_text = self.descriptions[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name)
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), func in sorted(self.gauges.items(), key=lambda item: item[0]):
+            header(name)
+            lines.append(f"{name}{self._labels(labels)} {func()}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            header(name)
+            cumulative = 0
+            for bound, count in zip(histogram.BUCKETS, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{name}_bucket{self._labels(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram.total}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+class LoopWatchdog:
+    """Measures event loop lag and samples stacks of stalls and slow handlers
+
+    A heartbeat task on the loop records scheduling lag. A daemon thread
+    watches the heartbeat and, when the loop has been blocked longer than
+    the stall threshold, captures the loop thread's current stack with
+    sys._current_frames(). Handlers wrapped with track() are timed, and one
+    still running past the handler threshold has its coroutine stack logged.
+    Stack samples share a per-minute budget so a sick loop cannot flood the log.
+    """
+
+    def __init__(self, metrics, interval=0.5, stall_threshold=0.5, handler_threshold=2.0,
+                 max_samples_per_minute=6, stack_depth=20):
+        self.metrics = metrics
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.handler_threshold = handler_threshold
+        self.max_samples_per_minute = max_samples_per_minute
+        self.stack_depth = stack_depth
+        self.lag = metrics.histogram('hallmonitor_event_loop_lag_seconds')
+        # task -> (handler name, start time, already sampled)
+        self._in_flight = {}
+        self._heartbeat = time.monotonic()
+        self._loop = None
+        self._loop_thread_id = None
+        # The budget is shared with the watchdog thread, which must decide while the loop is blocked
+        self._sample_times = deque()
+        self._budget_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+
+    def start(self):
+        """Start the heartbeat task and the watchdog thread"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._beat(), name="loop-watchdog")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        """Stop the heartbeat task and the watchdog thread"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _take_sample(self, from_thread=False):
+        """Spend one unit of the per-minute sampling budget if any is left
+
+        Metrics are only touched on the loop thread; from the watchdog thread
+        the counter update is handed to the loop, and lands once it unblocks.
+        """
+        now = time.monotonic()
+        with self._budget_lock:
+            while self._sample_times and now - self._sample_times[0] > 60:
+                self._sample_times.popleft()
+            taken = len(self._sample_times) < self.max_samples_per_minute
+            if taken:
+                self._sample_times.append(now)
+        name = 'hallmonitor_stack_samples_total' if taken else 'hallmonitor_stack_samples_skipped_total'
+        if from_thread:
+            try:
+                self._loop.call_soon_threadsafe(self.metrics.inc, name)
+            except RuntimeError:
+                # The loop closed while the thread was sampling
+                pass
+        else:
+            self.metrics.inc(name)
+        return taken
+
+    async def _beat(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag.observe(max(0.0, time.perf_counter() - start - self.interval))
+            self._heartbeat = time.monotonic()
+            self._check_handlers()
+
+    def _check_handlers(self):
+        now = time.perf_counter()
+        for task, (name, start, sampled) in list(self._in_flight.items()):
+            if sampled or now - start < self.handler_threshold:
+                continue
+            self._in_flight[task] = (name, start, True)
+            if not self._take_sample():
+                continue
+            frames = task.get_stack(limit=self.stack_depth)
+            stack = "".join(traceback.StackSummary.extract((frame, frame.f_lineno) for frame in frames).format())
+            logging.warning(
+                f"Handler {name} still running after {(now - start) * 1000:.0f}ms; awaiting at:\n{stack}"
+            )
+
+    def _watch(self):
+        """Watchdog thread: sample the loop thread's stack while it is blocked"""
+        reported = None
+        while not self._stop.wait(self.stall_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.stall_threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            if not self._take_sample(from_thread=True):
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame, limit=self.stack_depth))
+            logging.warning(f"Event loop blocked for {blocked * 1000:.0f}ms; loop thread at:\n{stack}")
+
+    @contextlib.contextmanager
+    def track(self, name):
+        """Time the enclosed handler code running in the current task"""
+        task = asyncio.current_task()
+        if task is None or task in self._in_flight:
+            yield
+            return
+        start = time.perf_counter()
+        self._in_flight[task] = (name, start, False)
+        try:
+            yield
+        finally:
+            del self._in_flight[task]
+            elapsed = time.perf_counter() - start
+            self.metrics.observe('hallmonitor_handler_seconds', elapsed, (('handler', name),))
+            if elapsed > self.handler_threshold:
+                logging.warning(f"Slow handler {name} took {elapsed * 1000:.0f}ms")
+
+    def timed(self, name):
+        """Decorator form of track() for event handlers"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.track(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+class ActionScheduler:
+    """Single gateway for outgoing REST actions, by priority class and route
+
+    Actions wait in one queue per class and are started highest class first
+    (evict, then sanction, sync, dm, log) whenever a global slot and a slot on the
+    action's route are free, so a burst of DMs or log posts can never delay
+    an eviction. 429 and 5xx failures are retried with jittered exponential
+    backoff without holding a slot while waiting.
+    """
+
+    CLASSES = ('evict', 'sanction', 'sync', 'dm', 'log')
+    # Requests in flight per route; routes not listed get one slot
+    ROUTE_LIMITS = {
+        'member.move': 5,
+        'member.timeout': 3,
+        'member.roles': 2,
+        'guild.kick': 2,
+        'guild.ban': 2,
+        'dm': 4,
+        'channel.send': 1,
+        'channel.overwrites': 1,
+    }
+
+    def __init__(self, metrics, concurrency=10, route_limits=None, max_retries=3, retry_base=0.5,
+                 retry_max=30.0):
+        self.metrics = metrics
+        self.concurrency = concurrency
+        self.route_limits = dict(self.ROUTE_LIMITS, **(route_limits or {}))
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # class -> deque of [route, factory, future, enqueued_at, attempt]
+        self.queues = {action_class: deque() for action_class in self.CLASSES}
+        self._active = 0
+        self._route_active = {}
+        self._tasks = set()
+        self._closed = False
+
+    def run(self, action_class, route, factory):
+        """Queue factory() (a coroutine function) and return a future for its result
+
+        The future raises the action's exception once retries are exhausted
+        or the error is not retryable.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(action_class, [route, factory, future, time.perf_counter(), 0])
+        return future
+
+    def _enqueue(self, action_class, item):
+        if self._closed:
+            if not item[2].done():
+                item[2].cancel()
+            return
+        self.queues[action_class].append(item)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Start queued actions while global and route capacity allows"""
+        for action_class in self.CLASSES:
+            queue_ = self.queues[action_class]
+            while queue_ and self._active < self.concurrency:
+                route = queue_[0][0]
+                if self._route_active.get(route, 0) >= self.route_limits.get(route, 1):
+                    break
+                item = queue_.popleft()
+                self._active += 1
+                self._route_active[route] = self._route_active.get(route, 0) + 1
+                self.metrics.observe(
+                    'hallmonitor_action_wait_seconds',
+                    time.perf_counter() - item[3],
+                    (('class', action_class),)
+                )
+                task = asyncio.create_task(self._execute(action_class, item), name=f"action-{route}")
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            if self._active >= self.concurrency:
+                return
+
+    async def _execute(self, action_class, item):
+        route, factory, future, _, attempt = item
+        retry_in = None
+        try:
+            result = await factory()
+        except discord.errors.HTTPException as e:
+            if (e.status == 429 or e.status >= 500) and attempt < self.max_retries:
+                retry_in = min(self.retry_max, self.retry_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+            else:
+                self.metrics.inc('hallmonitor_action_failures_total', (('class', action_class),))
+                if not future.done():
+                    future.set_exception(e)
+        except Exception as e:
+            self.metrics.inc('hallmonitor_action_failures_total', (('class', action_class),))
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self._active -= 1
+            self._route_active[route] -= 1
+
+        if retry_in is not None:
+            self.metrics.inc('hallmonitor_action_retries_total', (('class', action_class),))
+            item[4] = attempt + 1
+            item[3] = time.perf_counter() + retry_in
+            asyncio.get_running_loop().call_later(retry_in, self._enqueue, action_class, item)
+        self._dispatch()
+
+    def depth(self, action_class):
+        """Actions of a class waiting to start"""
+        return len(self.queues[action_class])
+
+    async def stop(self):
+        """Cancel queued actions and wait for running ones to finish"""
+        self._closed = True
+        for queue_ in self.queues.values():
+            while queue_:
+                future = queue_.popleft()[2]
+                if not future.done():
+                    future.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+class EvictionScheduler:
+    """Collects unauthorized joins into micro-batches and evicts them concurrently
+
+    Repeat events for a member already waiting to be moved are folded into
+    the pending entry, and moves are dispatched through a semaphore sized to
+    the rate-limit bucket so a raid cannot monopolize the REST client.
+    """
+
+    def __init__(self, bot, batch_window=0.05, max_batch=100, concurrency=5):
+        self.bot = bot
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+        # member_id -> (member, policy, received_at), in arrival order
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task = None
+        self.drain_time = LatencyHistogram()
+        self.stats = {
+            'submitted': 0, 'deduplicated': 0, 'stale': 0,
+            'batches': 0, 'batched': 0, 'max_batch': 0,
+        }
+
+    def start(self):
+        """Start the background drain task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="eviction-scheduler")
+
+    async def stop(self):
+        """Stop the drain task, dropping anything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, _, _, result in self._pending.values():
+            if not result.done():
+                result.set_result(False)
+        self._pending.clear()
+
+    def submit(self, member, policy, received_at):
+        """Queue a member for eviction; never blocks
+
+        Returns a future that resolves to True once the member has been moved,
+        or False if the eviction was skipped or failed.
+        """
+        self.stats['submitted'] += 1
+        pending = self._pending.get(member.id)
+        if pending is not None:
+            # Keep the earliest timestamp so time-to-eject stays honest
+            self.stats['deduplicated'] += 1
+            received_at, result = pending[2], pending[3]
+        else:
+            result = asyncio.get_running_loop().create_future()
+        self._pending[member.id] = (member, policy, received_at, result)
+        self._wakeup.set()
+        return result
+
+    def pending(self):
+        """Number of members waiting to be evicted"""
+        return len(self._pending)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Give the rest of a burst a moment to arrive, longer during a raid lockdown
+            raids = self.bot.raids
+            await asyncio.sleep(raids.batch_window if raids.lockdowns else self.batch_window)
+            self._wakeup.clear()
+
+            batch = []
+            for member_id in list(self._pending)[:self.max_batch]:
+                batch.append(self._pending.pop(member_id))
+            if self._pending:
+                self._wakeup.set()
+            if not batch:
+                continue
+
+            self.stats['batches'] += 1
+            self.stats['batched'] += len(batch)
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+            start = time.perf_counter()
+            await asyncio.gather(*(self._evict(*item) for item in batch), return_exceptions=True)
+            self.drain_time.observe(time.perf_counter() - start)
+
+    async def _evict(self, member, policy, received_at, result):
+        evicted = False
+        try:
+            async with self._semaphore:
+                # Skip members who already left the channel while queued
+                voice = member.voice
+                if voice is None or voice.channel is None or voice.channel.id != policy.channel_id:
+                    self.stats['stale'] += 1
+                    return
+                evicted = await self.bot.enforce_channel(member, policy, received_at)
+        finally:
+            if not result.done():
+                result.set_result(evicted)
+
+    def summary(self):
+        """One-line human readable summary"""
+        batches = self.stats['batches']
+        mean_batch = self.stats['batched'] / batches if batches else 0
+        return (
+            f"batches={batches} mean_size={mean_batch:.1f} max_size={self.stats['max_batch']} "
+            f"deduplicated={self.stats['deduplicated']} stale={self.stats['stale']} "
+            f"pending={self.pending()} drain: {self.drain_time.summary()}"
+        )
+
+def overwrite_key(target):
+    """('role' | 'member', id) for a target in channel.overwrites"""
+    if isinstance(target, discord.Role) or getattr(target, 'type', None) is discord.Role:
+        return ('role', target.id)
+    return ('member', target.id)
+
+class OverwriteSync:
+    """Keeps monitored channels' Connect overwrites in step with the policy tables
+
+    In overwrites mode Discord refuses unauthorized joins itself: @everyone is
+    denied Connect on each monitored channel and allowlisted users and roles
+    are granted it. Requests are coalesced for a short delay, diffed against
+    the channel's current overwrites and only the changed targets are sent,
+    as one edit per channel through the action scheduler. Reactive eviction
+    keeps running for anyone who still gets in.
+
+    In reactive mode only channels under a raid lockdown are synced, and
+    their previous overwrites are put back when the lockdown lifts. The
+    targets the sync set are persisted, so on a channel it no longer
+    enforces (after a switch back to reactive mode, a crash mid-lockdown or
+    a channel dropped from the config) the next sync clears exactly those.
+    """
+
+    MODES = ('reactive', 'overwrites')
+
+    def __init__(self, bot, mode='reactive', delay=2.0, max_overwrites=100):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown enforcement mode: {mode}")
+        self.bot = bot
+        self.enabled = mode == 'overwrites'
+        self.delay = delay
+        self.max_overwrites = max_overwrites
+        # Channel IDs waiting for the delay to pass; _all means every monitored channel
+        self._requested = set()
+        self._all = False
+        self._timer = None
+        # Channels with an edit waiting in the action scheduler
+        self._queued = set()
+        # Channels that need more overwrites than the limit -> whether that was under a lockdown
+        self.over_limit = {}
+        # Channels under raid lockdown, and in reactive mode their overwrites from before it
+        self.locked = set()
+        self._saved = {}
+        # channel_id -> overwrite keys the sync set itself; only these are ever cleared
+        self.managed = bot.state.load_managed_overwrites() if bot.state else {}
+        self.stats = {'requests': 0, 'checked': 0, 'unchanged': 0, 'edits': 0, 'changes': 0, 'failures': 0}
+
+    def request(self, channel_ids=None):
+        """Sync some monitored channels (all by default) once the delay has passed"""
+        if not (self.enabled or self.locked or self.managed):
+            return
+        self.stats['requests'] += 1
+        if channel_ids is None:
+            self._all = True
+        else:
+            self._requested.update(channel_ids)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._fire)
+
+    def _fire(self):
+        self._timer = None
+        channel_ids = None if self._all else self._requested
+        self._all = False
+        self._requested = set()
+        self.bot.spawn(self.sync(channel_ids), name="overwrite-sync")
+
+    def stop(self):
+        """Drop any sync still waiting for its delay"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def desired(self, policy, guild_id, lockdown=False):
+        """Connect value per overwrite key for a channel policy
+
+        A channel needing more overwrites than the limit only gets its
+        @everyone deny lifted (None), leaving it to reactive eviction. Under
+        a lockdown @everyone is always denied instead, and the bot, the
+        allowed roles and then allowed users are granted as the limit allows.
+        """
+        desired = {('role', guild_id): False, ('member', self.bot.user.id): True}
+        desired.update(dict.fromkeys((('role', role_id) for role_id in policy.roles), True))
+        desired.update(dict.fromkeys((('member', user_id) for user_id in policy.users), True))
+        if len(desired) <= self.max_overwrites:
+            return desired
+        if lockdown:
+            return dict(itertools.islice(desired.items(), max(1, self.max_overwrites)))
+        return {('role', guild_id): None}
+
+    @staticmethod
+    def diff(channel, desired, managed=frozenset()):
+        """Apply desired Connect values to a channel's overwrites
+
+        Returns the full new overwrite mapping, the (target, overwrite) pairs
+        that changed and the keys the sync owns afterwards. Only targets in
+        managed (set by the sync earlier) are ever cleared, so grants and
+        denies made by hand are left alone. Other permissions in an overwrite
+        are kept and an overwrite left empty is dropped.
+        """
+        desired = dict(desired)
+        overwrites = {}
+        changed = []
+        owned = set()
+        for target, overwrite in channel.overwrites.items():
+            key = overwrite_key(target)
+            if key in desired:
+                want = desired.pop(key)
+            else:
+                want = None
+            if key not in managed and (want is None or overwrite.connect is want):
+                overwrites[target] = overwrite
+                continue
+            if want is not None:
+                owned.add(key)
+            if overwrite.connect is want:
+                overwrites[target] = overwrite
+                continue
+            overwrite = discord.PermissionOverwrite.from_pair(*overwrite.pair())
+            overwrite.update(connect=want)
+            changed.append((target, overwrite))
+            if not overwrite.is_empty():
+                overwrites[target] = overwrite
+        for key, want in desired.items():
+            if want is None:
+                continue
+            kind, target_id = key
+            target = discord.Object(target_id, type=discord.Role if kind == 'role' else discord.Member)
+            overwrite = discord.PermissionOverwrite(connect=want)
+            overwrites[target] = overwrite
+            changed.append((target, overwrite))
+            owned.add(key)
+        return overwrites, changed, owned
+
+    async def sync(self, channel_ids=None):
+        """Diff monitored channels now and apply what changed; returns targets changed"""
+        targets = set(self.bot.policies.channels) if self.enabled else set(self.locked)
+        # Channels still carrying overwrites the sync set get them cleared once it stops enforcing there
+        targets.update(self.managed)
+        if channel_ids is not None:
+            targets.intersection_update(channel_ids)
+        results = await asyncio.gather(*(
+            self._sync_channel(channel_id)
+            for channel_id in targets
+            if channel_id not in self._queued
+        ))
+        return sum(results)
+
+    async def lock(self, channel_id):
+        """Deny Connect on a channel right away, whatever the mode
+
+        Returns whether @everyone is denied Connect once the edit is done.
+        """
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return False
+        if not self.enabled and channel_id not in self.locked:
+            self._saved[channel_id] = (dict(channel.overwrites), self.managed.get(channel_id, set()))
+        self.locked.add(channel_id)
+        await self._sync_channel(channel_id)
+        return self.denied(channel)
+
+    async def unlock(self, channel_id):
+        """End a lockdown, restoring the overwrites it replaced in reactive mode"""
+        self.locked.discard(channel_id)
+        saved = self._saved.pop(channel_id, None)
+        channel = self.bot.get_channel(channel_id)
+        if saved is None or channel is None:
+            return
+        overwrites, managed = saved
+        if dict(channel.overwrites) == overwrites:
+            self._set_managed(channel_id, managed)
+            return
+        try:
+            await self.bot.actions.run(
+                'sync', 'channel.overwrites',
+                functools.partial(channel.edit, overwrites=overwrites, reason="Raid lockdown lifted")
+            )
+            self._set_managed(channel_id, managed)
+        except Exception as e:
+            self.stats['failures'] += 1
+            await self.bot.log_security_event(
+                "ERROR",
+                self.bot.user.id,
+                f"Failed to restore overwrites after lockdown: {e}",
+                guild_id=channel.guild.id,
+                channel_id=channel_id
+            )
+
+    def _plan(self, channel):
+        """Diff a channel against its current policy, tracking the overwrite limit"""
+        policy = self.bot.policies.channels.get(channel.id)
+        locked = channel.id in self.locked
+        if policy is None or not (self.enabled or locked):
+            # Not enforced here (reactive mode, or no longer monitored): undo what the sync set
+            return self.diff(channel, {}, self.managed.get(channel.id, set()))
+        desired = self.desired(policy, channel.guild.id, lockdown=locked)
+        if len(policy.roles) + len(policy.users) + 2 > self.max_overwrites:
+            if self.over_limit.get(channel.id) is not locked:
+                self.over_limit[channel.id] = locked
+                if locked:
+                    fallback = "granting Connect only to the allowed roles and users that fit during the lockdown"
+                else:
+                    fallback = "lifting its Connect deny and relying on eviction"
+                self.bot.spawn(self.bot.log_security_event(
+                    "OVERWRITE_LIMIT",
+                    self.bot.user.id,
+                    f"Channel needs more than {self.max_overwrites} overwrites; {fallback}",
+                    guild_id=channel.guild.id,
+                    channel_id=channel.id
+                ), name="log-overwrite-limit")
+        else:
+            self.over_limit.pop(channel.id, None)
+        return self.diff(channel, desired, self.managed.get(channel.id, set()))
+
+    @staticmethod
+    def denied(channel):
+        """Whether @everyone is denied Connect on a channel"""
+        return any(
+            overwrite.connect is False
+            for target, overwrite in channel.overwrites.items()
+            if overwrite_key(target) == ('role', channel.guild.id)
+        )
+
+    def _set_managed(self, channel_id, keys):
+        """Record which overwrite targets on a channel the sync now owns"""
+        if keys == self.managed.get(channel_id, set()):
+            return
+        if keys:
+            self.managed[channel_id] = set(keys)
+        else:
+            self.managed.pop(channel_id, None)
+        if self.bot.state:
+            self.bot.state.set_managed_overwrites(channel_id, keys)
+
+    async def _sync_channel(self, channel_id):
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return 0
+        self.stats['checked'] += 1
+        _, changed, owned = self._plan(channel)
+        if not changed:
+            self._set_managed(channel_id, owned)
+            self.stats['unchanged'] += 1
+            return 0
+
+        async def edit():
+            # Diff again once a slot is free; later requests are folded into this edit
+            self._queued.discard(channel_id)
+            if not (self.enabled or channel_id in self.locked or channel_id in self.managed):
+                return 0
+            overwrites, changed, owned = self._plan(channel)
+            if len(changed) == 1:
+                target, overwrite = changed[0]
+                await channel.set_permissions(
+                    target,
+                    overwrite=None if overwrite.is_empty() else overwrite,
+                    reason="Overwrite sync"
+                )
+            elif changed:
+                await channel.edit(overwrites=overwrites, reason="Overwrite sync")
+            self._set_managed(channel_id, owned)
+            return len(changed)
+
+        self._queued.add(channel_id)
+        try:
+            changes = await self.bot.actions.run('sync', 'channel.overwrites', edit)
+        except Exception as e:
+            self._queued.discard(channel_id)
+            self.stats['failures'] += 1
+            await self.bot.log_security_event(
+                "ERROR",
+                self.bot.user.id,
+                f"Overwrite sync failed: {e}",
+                guild_id=channel.guild.id,
+                channel_id=channel_id
+            )
+            return 0
+        if changes:
+            self.stats['edits'] += 1
+            self.stats['changes'] += changes
+            self.bot.metrics.inc('hallmonitor_overwrite_edits_total')
+            self.bot.metrics.inc('hallmonitor_overwrite_changes_total', amount=changes)
+        return changes
+
+class JoinRateWindow:
+    """Sliding-window event count in constant memory
+
+    The window is a ring of fixed-width buckets with a running total, so
+    adding and reading are O(1) and a bucket is only cleared when the
+    window slides past it.
+    """
+
+    def __init__(self, window=10.0, buckets=10):
+        self.width = window / buckets
+        self.counts = [0] * buckets
+        self.total = 0
+        # Absolute index (time // width) of the newest bucket
+        self._bucket = None
+
+    def _advance(self, now):
+        bucket = int(now // self.width)
+        if self._bucket is None or bucket - self._bucket >= len(self.counts):
+            self.counts = [0] * len(self.counts)
+            self.total = 0
+        else:
+            for expired in range(self._bucket + 1, bucket + 1):
+                index = expired % len(self.counts)
+                self.total -= self.counts[index]
+                self.counts[index] = 0
+        if self._bucket is None or bucket > self._bucket:
+            self._bucket = bucket
+
+    def add(self, now):
+        """Count one event and return the count inside the window"""
+        self._advance(now)
+        self.counts[self._bucket % len(self.counts)] += 1
+        self.total += 1
+        return self.total
+
+    def count(self, now):
+        """Events inside the window"""
+        self._advance(now)
+        return self.total
+
+class RaidMonitor:
+    """Per-channel raid detection and automatic lockdown
+
+    Unauthorized joins are counted per monitored channel in a JoinRateWindow.
+    When the count reaches the threshold the channel is locked down: Connect
+    is denied to everyone outside the allowlist through OverwriteSync (in
+    either enforcement mode), per-member log posts and DMs for the channel
+    give way to one summary when the lockdown ends, and evictions are batched
+    over a longer window. The lockdown lifts once it has lasted min_duration
+    and the count is at or below exit_threshold. If the deny cannot be put
+    in place the raid is logged and enforcement carries on without one.
+    """
+
+    def __init__(self, bot, threshold=0, window=10.0, buckets=10, exit_threshold=None, min_duration=60.0,
+                 batch_window=0.25, clock=time.monotonic):
+        self.bot = bot
+        self.enabled = threshold > 0
+        self.threshold = threshold
+        self.window = window
+        self.buckets = buckets
+        self.exit_threshold = threshold // 2 if exit_threshold is None else exit_threshold
+        self.min_duration = min_duration
+        self.batch_window = batch_window
+        self.clock = clock
+        # channel_id -> JoinRateWindow, one per monitored channel that has seen a join
+        self.windows = {}
+        # channel_id -> state of the active lockdown
+        self.lockdowns = {}
+        # The most recent finished lockdowns, for !security_status and the benchmark
+        self.history = deque(maxlen=10)
+
+    def record(self, policy, now=None):
+        """Count an unauthorized join; returns True if the channel is locked down"""
+        if not self.enabled:
+            return False
+        if now is None:
+            now = self.clock()
+        window = self.windows.get(policy.channel_id)
+        if window is None:
+            window = self.windows[policy.channel_id] = JoinRateWindow(self.window, self.buckets)
+        count = window.add(now)
+        lockdown = self.lockdowns.get(policy.channel_id)
+        if lockdown is not None:
+            lockdown['joins'] += 1
+            lockdown['peak'] = max(lockdown['peak'], count)
+            return True
+        if count < self.threshold:
+            return False
+        self.lockdowns[policy.channel_id] = {
+            'guild_id': policy.guild_id,
+            'started': now,
+            'applied': None,
+            'failed': False,
+            'ended': None,
+            'joins': count,
+            'peak': count,
+            'evicted': 0,
+        }
+        self.bot.metrics.inc('hallmonitor_raid_lockdowns_total')
+        self.bot.spawn(self._run(policy.channel_id), name=f"lockdown-{policy.channel_id}")
+        return True
+
+    def locked(self, channel_id):
+        """The active lockdown for a channel, or None"""
+        lockdown = self.lockdowns.get(channel_id)
+        if lockdown is None or lockdown['failed']:
+            return None
+        return lockdown
+
+    def active(self):
+        """Channel IDs currently locked down"""
+        return [channel_id for channel_id, lockdown in self.lockdowns.items() if not lockdown['failed']]
+
+    async def _run(self, channel_id):
+        lockdown = self.lockdowns[channel_id]
+        if await self.bot.overwrites.lock(channel_id):
+            lockdown['applied'] = self.clock()
+            await self.bot.log_security_event(
+                "RAID_LOCKDOWN",
+                self.bot.user.id,
+                f"{lockdown['joins']} unauthorized joins within {self.window:g}s; "
+                f"denying Connect to everyone outside the allowlist",
+                guild_id=lockdown['guild_id'],
+                channel_id=channel_id
+            )
+        else:
+            # Kept until the raid subsides so it is not retried on every join, but
+            # enforcement, log posts and DMs carry on as if there were no lockdown
+            lockdown['failed'] = True
+            await self.bot.overwrites.unlock(channel_id)
+            await self.bot.log_security_event(
+                "ERROR",
+                self.bot.user.id,
+                f"{lockdown['joins']} unauthorized joins within {self.window:g}s, but Connect "
+                f"could not be denied; no lockdown, relying on eviction",
+                guild_id=lockdown['guild_id'],
+                channel_id=channel_id
+            )
+
+        window = self.windows[channel_id]
+        while True:
+            await asyncio.sleep(window.width)
+            if self.lockdowns.get(channel_id) is not lockdown:
+                # Lifted by stop()
+                return
+            now = self.clock()
+            if now - lockdown['started'] >= self.min_duration and window.count(now) <= self.exit_threshold:
+                break
+        await self._lift(channel_id)
+
+    async def _lift(self, channel_id):
+        lockdown = self.lockdowns.pop(channel_id, None)
+        if lockdown is None or lockdown['failed']:
+            return
+        await self.bot.overwrites.unlock(channel_id)
+        lockdown['ended'] = self.clock()
+        self.history.append(lockdown)
+        await self.bot.log_security_event(
+            "RAID_LOCKDOWN_ENDED",
+            self.bot.user.id,
+            f"Lockdown lifted after {lockdown['ended'] - lockdown['started']:.0f}s: "
+            f"{lockdown['joins']} unauthorized joins (peak {lockdown['peak']} per {self.window:g}s), "
+            f"{lockdown['evicted']} evicted",
+            guild_id=lockdown['guild_id'],
+            channel_id=channel_id
+        )
+
+    async def stop(self):
+        """Lift every lockdown so no channel is left locked while the bot is down"""
+        for channel_id in list(self.lockdowns):
+            await self._lift(channel_id)
+
+class LogChannelWriter:
+    """Background task that batches security events into log channel posts
+
+    Events are queued without touching the network and coalesced into code-block
+    messages of at most 2000 characters, flushed when a message fills up or when
+    the flush interval elapses. Only one send is in flight at a time, so a burst
+    of events costs a handful of requests instead of one per event.
+    """
+
+    MAX_MESSAGE_LENGTH = 2000
+    OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+    def __init__(self, bot, channel_id, max_queue=1000, flush_interval=2.0, overflow='drop_newest'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+        self.bot = bot
+        self.channel_id = channel_id
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.stats = {'queued': 0, 'flushed': 0, 'dropped': 0, 'messages': 0, 'errors': 0}
+        self._task = None
+        # Lines taken off the queue but not yet posted, so stop() can still flush them
+        self._batch = []
+        self._carry = None
+        self._flushing = False
+        self._closing = False
+        # Room for lines inside the ``` fences
+        self._budget = self.MAX_MESSAGE_LENGTH - len("```\n\n```")
+
+    def start(self):
+        """Start the background writer task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="log-channel-writer")
+
+    async def stop(self):
+        """Stop the writer, flushing anything still queued"""
+        if self._task is not None:
+            self._closing = True
+            # A send in flight is allowed to finish rather than being cut off
+            if not self._flushing:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        pending = self._batch
+        self._batch = []
+        if self._carry is not None:
+            pending.append(self._carry)
+            self._carry = None
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        if pending:
+            await self._flush(pending)
+
+    async def submit(self, line):
+        """Queue a log line; only the 'block' policy ever waits"""
+        if len(line) > self._budget:
+            line = line[:self._budget - 3] + "..."
+        if self.overflow == 'block':
+            await self.queue.put(line)
+        else:
+            try:
+                self.queue.put_nowait(line)
+            except asyncio.QueueFull:
+                if self.overflow == 'drop_newest':
+                    self.stats['dropped'] += 1
+                    return
+                self.queue.get_nowait()
+                self.stats['dropped'] += 1
+                self.queue.put_nowait(line)
+        self.stats['queued'] += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            line = self._carry if self._carry is not None else await self.queue.get()
+            self._carry = None
+            batch = self._batch = [line]
+            size = len(line)
+            deadline = loop.time() + self.flush_interval
+            while True:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    line = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                # Flush on size: the next line would overflow this message
+                if size + 1 + len(line) > self._budget:
+                    self._carry = line
+                    break
+                batch.append(line)
+                size += 1 + len(line)
+            self._flushing = True
+            try:
+                await self._flush(batch)
+            finally:
+                self._flushing = False
+                self._batch = []
+
+    def _chunk(self, lines):
+        """Split lines into message bodies that fit the length budget"""
+        chunks, current, size = [], [], 0
+        for line in lines:
+            if current and size + 1 + len(line) > self._budget:
+                chunks.append(current)
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + (1 if len(current) > 1 else 0)
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def _flush(self, lines):
+        channel = self.bot.get_channel(self.channel_id)
+        if channel is None:
+            self.stats['dropped'] += len(lines)
+            return
+        for chunk in self._chunk(lines):
+            try:
+                body = "\n".join(chunk)
+                await self.bot.actions.run('log', 'channel.send', lambda: channel.send(f"```\n{body}\n```"))
+                self.stats['flushed'] += len(chunk)
+                self.stats['messages'] += 1
+            except Exception as e:
+                # Any failure, not just HTTPException, must leave the writer running
+                self.stats['errors'] += 1
+                self.stats['dropped'] += len(chunk)
+                logging.warning(f"Failed to post {len(chunk)} events to log channel: {e}")
+
+class NotificationService:
+    """Background DM sender with DM channel caching and duplicate suppression
+
+    notify() never touches the network: it checks a TTL'd cache of users whose
+    DMs are closed and a window of recently sent messages, then queues the DM
+    for a small pool of sender tasks. DM channels are cached per user so
+    repeat messages skip the open-DM request.
+    """
+
+    def __init__(self, max_queue=1000, concurrency=4, forbidden_ttl=3600.0, dedup_window=300.0,
+                 max_entries=10000, latency=None, actions=None, clock=time.monotonic):
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # Optional ActionScheduler the REST calls are routed through
+        self.actions = actions
+        self.concurrency = concurrency
+        self.forbidden_ttl = forbidden_ttl
+        self.dedup_window = dedup_window
+        self.max_entries = max_entries
+        self.latency = latency
+        self.clock = clock
+        # user_id -> DM channel, least recently used first
+        self._channels = OrderedDict()
+        # user_id -> time until which DMs are not attempted
+        self._forbidden = {}
+        # (user_id, key) -> time until which the same message is suppressed
+        self._recent = {}
+        self.stats = {
+            'queued': 0, 'sent': 0, 'deduplicated': 0, 'skipped_forbidden': 0,
+            'forbidden': 0, 'dropped': 0, 'errors': 0
+        }
+        self._tasks = []
+
+    def start(self):
+        """Start the sender tasks"""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._run(), name=f"dm-sender-{i}")
+                for i in range(self.concurrency)
+            ]
+
+    async def stop(self):
+        """Stop the sender tasks; DMs still queued are dropped"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.stats['dropped'] += self.queue.qsize()
+
+    def notify(self, user, text, key=None):
+        """Queue a DM without waiting
+
+        key groups messages for duplicate suppression and defaults to the
+        text itself. Returns False if the DM was suppressed or dropped.
+        """
+        now = self.clock()
+        user_id = user.id
+        blocked_until = self._forbidden.get(user_id)
+        if blocked_until is not None:
+            if blocked_until > now:
+                self.stats['skipped_forbidden'] += 1
+                return False
+            del self._forbidden[user_id]
+
+        recent_key = (user_id, key or text)
+        if self._recent.get(recent_key, 0) > now:
+            self.stats['deduplicated'] += 1
+            return False
+        try:
+            self.queue.put_nowait((user, text))
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            return False
+        self._recent[recent_key] = now + self.dedup_window
+        if len(self._recent) > self.max_entries:
+            self._prune(now)
+        self.stats['queued'] += 1
+        return True
+
+    def _prune(self, now):
+        """Drop expired suppression entries, then the oldest if still over the cap"""
+        self._recent = {key: until for key, until in self._recent.items() if until > now}
+        self._forbidden = {uid: until for uid, until in self._forbidden.items() if until > now}
+        while len(self._recent) > self.max_entries:
+            del self._recent[next(iter(self._recent))]
+
+    async def _run(self):
+        while True:
+            user, text = await self.queue.get()
+            try:
+                await self._send(user, text)
+            except Exception:
+                # Network errors outside HTTPException must not kill the sender
+                self.stats['errors'] += 1
+                logging.exception(f"Failed to DM user {user.id}")
+
+    async def _request(self, factory):
+        if self.actions:
+            return await self.actions.run('dm', 'dm', factory)
+        return await factory()
+
+    async def _send(self, user, text):
+        start = time.perf_counter()
+        try:
+            channel = self._channels.get(user.id)
+            if channel is None:
+                channel = getattr(user, 'dm_channel', None) or await self._request(user.create_dm)
+                self._channels[user.id] = channel
+                if len(self._channels) > self.max_entries:
+                    self._channels.popitem(last=False)
+            else:
+                self._channels.move_to_end(user.id)
+            await self._request(lambda: channel.send(text))
+            self.stats['sent'] += 1
+        except discord.errors.Forbidden:
+            # DMs closed or no shared guild; don't try again until the TTL runs out
+            self.stats['forbidden'] += 1
+            self._forbidden[user.id] = self.clock() + self.forbidden_ttl
+            self._channels.pop(user.id, None)
+        except discord.errors.HTTPException as e:
+            self.stats['errors'] += 1
+            logging.warning(f"Failed to DM user {user.id}: {e}")
+        finally:
+            if self.latency:
+                self.latency.observe(time.perf_counter() - start)
+
+class SecureBot(commands.Bot):
+    def __init__(self, lean_cache=LEAN_CACHE, **options):
+        intents = discord.Intents.default()
+        intents.voice_states = True
+        intents.members = True
+        self.lean_cache = lean_cache
+        if lean_cache:
+            # Only people in voice channels matter; don't chunk or cache everyone else
+            options.setdefault('chunk_guilds_at_startup', False)
+            options.setdefault('member_cache_flags', discord.MemberCacheFlags(voice=True, joined=False))
+        super().__init__(command_prefix='!', intents=intents, **options)
+        # Guild-scoped security state, partitioned by shard: shard_id -> {guild_id: SecurityResponse}
+        self.security_shards = {}
+        self.policy_config = POLICY_CONFIG
+        self.config_digest = file_digest(CONFIG_FILE)
+        self.state = None
+        if STATE_FILE:
+            self.state = StateStore(
+                STATE_FILE,
+                flush_interval=STATE_FLUSH_INTERVAL,
+                attempt_window=self.policy_config.max_attempt_window()
+            )
+        generation = self.state.policy_generation if self.state else 0
+        self.policies = None
+        if lean_cache and POLICY_SNAPSHOT:
+            self.policies = PolicyStore.load_snapshot(POLICY_SNAPSHOT, self.config_digest, generation)
+        # Generation of the snapshot on disk; None means it needs writing
+        self._snapshot_generation = generation if self.policies else None
+        self.policy_source = 'snapshot' if self.policies else 'config'
+        if self.policies is None:
+            self.policies = PolicyStore.from_config(self.policy_config)
+        if self.state:
+            self.state.load_into(self.policies, include_policy=self.policy_source == 'config')
+            self.state.on_flush = self._save_policy_snapshot
+        # Per-stage enforcement latency; 'eject' is event received -> move done
+        self.metrics = Metrics()
+        self.stage_latency = {
+            stage: self.metrics.histogram('hallmonitor_enforcement_stage_seconds', (('stage', stage),))
+            for stage in ('move', 'eject', 'log', 'notify')
+        }
+        self._metrics_runner = None
+        self.watchdog = LoopWatchdog(
+            self.metrics,
+            interval=LOOP_LAG_INTERVAL,
+            stall_threshold=WATCHDOG_STALL_THRESHOLD,
+            handler_threshold=WATCHDOG_HANDLER_THRESHOLD,
+            max_samples_per_minute=WATCHDOG_MAX_SAMPLES,
+            stack_depth=WATCHDOG_STACK_DEPTH
+        )
+        self._background_tasks = set()
+        self._reconciling = False
+        self.auth_cache = MemberAuthCache()
+        self.rate_limiter = CommandRateLimiter(
+            COMMAND_RATE,
+            COMMAND_BURST,
+            GLOBAL_COMMAND_RATE,
+            GLOBAL_COMMAND_BURST,
+            RATE_LIMIT_MAX_USERS
+        )
+        self.actions = ActionScheduler(
+            self.metrics,
+            concurrency=ACTION_CONCURRENCY,
+            route_limits={'member.move': EVICTION_CONCURRENCY, 'dm': DM_CONCURRENCY},
+            max_retries=ACTION_MAX_RETRIES,
+            retry_base=ACTION_RETRY_BASE
+        )
+        self._outbox_replayed = False
+        self.overwrites = OverwriteSync(
+            self,
+            mode=ENFORCEMENT_MODE,
+            delay=OVERWRITE_SYNC_DELAY,
+            max_overwrites=OVERWRITE_LIMIT
+        )
+        self.raids = RaidMonitor(
+            self,
+            threshold=RAID_THRESHOLD,
+            window=RAID_WINDOW,
+            buckets=RAID_BUCKETS,
+            exit_threshold=RAID_EXIT_THRESHOLD,
+            min_duration=RAID_MIN_DURATION,
+            batch_window=RAID_BATCH_WINDOW
+        )
+        self.evictions = EvictionScheduler(
+            self,
+            batch_window=EVICTION_BATCH_WINDOW,
+            max_batch=EVICTION_MAX_BATCH,
+            concurrency=EVICTION_CONCURRENCY
+        )
+        self.notifications = NotificationService(
+            max_queue=DM_QUEUE_SIZE,
+            concurrency=DM_CONCURRENCY,
+            forbidden_ttl=DM_FORBIDDEN_TTL,
+            dedup_window=DM_DEDUP_WINDOW,
+            latency=self.stage_latency['notify'],
+            actions=self.actions
+        )
+        self.log_writer = None
+        if LOG_CHANNEL_ID:
+            self.log_writer = LogChannelWriter(
+                self,
+                LOG_CHANNEL_ID,
+                max_queue=LOG_QUEUE_SIZE,
+                flush_interval=LOG_FLUSH_INTERVAL,
+                overflow=LOG_OVERFLOW
+            )
+
+    # Scheduler route for each sanction kind
+    SANCTION_ROUTES = {
+        'timeout': 'member.timeout',
+        'kick': 'guild.kick',
+        'ban': 'guild.ban',
+        'role_strip': 'member.roles',
+    }
+
+    async def sanction(self, action, guild, user_id, factory, payload=None):
+        """Run a sanction through the action scheduler, keeping it in the outbox until done
+
+        A sanction still queued or retrying when the bot stops stays in the
+        outbox and is replayed by replay_outbox on the next start.
+        """
+        if self.state:
+            self.state.save_outbox(guild.id, user_id, action, payload)
+        try:
+            result = await self.actions.run('sanction', self.SANCTION_ROUTES[action], factory)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if self.state:
+                self.state.clear_outbox(guild.id, user_id, action)
+            raise
+        if self.state:
+            self.state.clear_outbox(guild.id, user_id, action)
+        return result
+
+    async def replay_outbox(self):
+        """Re-issue sanctions that were pending when the previous run stopped"""
+        if not self.state or self._outbox_replayed:
+            return
+        self._outbox_replayed = True
+        replayed = 0
+        for guild_id, user_id, action, payload in self.state.load_outbox():
+            guild = self.get_guild(guild_id)
+            if guild is None:
+                # Not ours (another shard process) or we were removed; leave it for them
+                continue
+            try:
+                if action == 'ban':
+                    factory = functools.partial(
+                        guild.ban, discord.Object(user_id), reason="Excessive unauthorized bot command attempts"
+                    )
+                elif action == 'kick':
+                    factory = functools.partial(
+                        guild.kick, discord.Object(user_id), reason="Repeated unauthorized attempts"
+                    )
+                else:
+                    member = guild.get_member(user_id) or await guild.fetch_member(user_id)
+                    if action == 'timeout':
+                        remaining = payload['until'] - time.time()
+                        if remaining <= 0:
+                            self.state.clear_outbox(guild_id, user_id, action)
+                            continue
+                        factory = functools.partial(
+                            member.timeout, timedelta(seconds=remaining), reason="Unauthorized command attempts"
+                        )
+                    else:
+                        roles = [discord.Object(role_id) for role_id in payload['roles']]
+                        factory = functools.partial(
+                            member.remove_roles, *roles, reason="Repeated unauthorized attempts"
+                        )
+                await self.sanction(action, guild, user_id, factory, payload)
+                replayed += 1
+            except discord.errors.HTTPException as e:
+                self.state.clear_outbox(guild_id, user_id, action)
+                await self.log_security_event(
+                    "ERROR",
+                    user_id,
+                    f"Failed to replay pending {action}: {e}",
+                    guild_id=guild_id
+                )
+        if replayed:
+            await self.log_security_event(
+                "OUTBOX_REPLAYED",
+                self.user.id,
+                f"Re-issued {replayed} sanctions left pending by the previous run"
+            )
+
+    async def _save_policy_snapshot(self, force=False):
+        """Write the policy snapshot if the tables changed since the last one"""
+        if not (self.lean_cache and POLICY_SNAPSHOT):
+            return
+        generation = self.state.policy_generation if self.state else 0
+        if not force and generation == self._snapshot_generation:
+            return
+        data = self.policies.snapshot(self.config_digest, generation)
+        self._snapshot_generation = generation
+        try:
+            await asyncio.to_thread(write_policy_snapshot, POLICY_SNAPSHOT, data)
+        except OSError as e:
+            self._snapshot_generation = None
+            logging.warning(f"Failed to write policy snapshot: {e}")
+
+    def member_allowed(self, policy, member):
+        """Check a member against a compiled channel policy
+
+        One set lookup for allowlisted users; otherwise one cached lookup of
+        what the member's roles grant, without walking member.roles.
+        """
+        if member.id in policy.users:
+            return True
+        if not policy.roles:
+            return False
+        return policy.channel_id in self.auth_cache.grants(member, self.policies.role_index)
+
+    def command_allowed(self, member, command_name):
+        """Check whether a member's roles allow a command"""
+        policies = self.policies
+        if not policies.command_roles:
+            return False
+        if self.lean_cache:
+            # Role updates only arrive for cached (voice) members, so a cached grant
+            # could outlive its role; the invoking message carries fresh roles
+            grants = MemberAuthCache.compute(member, policies.role_index)
+        else:
+            grants = self.auth_cache.grants(member, policies.role_index)
+        return "command:*" in grants or f"command:{command_name}" in grants
+
+    def security_for(self, guild):
+        """Return the SecurityResponse for a guild (None for DMs), creating it on first use"""
+        guild_id = guild.id if guild else 0
+        shard_id = guild.shard_id if guild else 0
+        shard = self.security_shards.setdefault(shard_id, {})
+        security = shard.get(guild_id)
+        if security is None:
+            security = shard[guild_id] = SecurityResponse(
+                guild_id,
+                policy=self.policy_config.escalation_for(guild_id)
+            )
+            if self.state:
+                self.state.restore_security(security)
+        return security
+
+    async def reload_config(self):
+        """Re-read config.ini and atomically swap in the new policy tables
+
+        The new tables are fully built and validated before anything is
+        replaced, so an invalid file leaves the running policy untouched and
+        events already in flight keep the snapshot they started with.
+        Returns the reload time in seconds.
+        """
+        start = time.perf_counter()
+        parser = await asyncio.to_thread(read_config, CONFIG_FILE)
+        config_digest = await asyncio.to_thread(file_digest, CONFIG_FILE)
+        policy_config = load_policy_config(parser)
+        policies = PolicyStore.from_config(policy_config)
+        old_policies = self.policies
+        policies.apply_overrides(old_policies.overrides.items())
+        policies.apply_role_rules(old_policies.role_rules.items())
+        policies.state = old_policies.state
+
+        self.policy_config = policy_config
+        self.config_digest = config_digest
+        self.policies = policies
+        for shard in self.security_shards.values():
+            for guild_id, security in shard.items():
+                security.set_policy(policy_config.escalation_for(guild_id))
+        if self.state:
+            self.state.attempt_window = policy_config.max_attempt_window()
+        self.spawn(self._save_policy_snapshot(force=True), name="policy-snapshot")
+        self.overwrites.request()
+        return time.perf_counter() - start
+
+    async def _watch_config(self):
+        """Poll config.ini's mtime and reload when it changes"""
+        last_mtime = os.stat(CONFIG_FILE).st_mtime
+        while True:
+            await asyncio.sleep(CONFIG_POLL_INTERVAL)
+            try:
+                mtime = os.stat(CONFIG_FILE).st_mtime
+            except OSError:
+                continue
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+            try:
+                elapsed = await self.reload_config()
+            except Exception as e:
+                await self.log_security_event("ERROR", self.user.id, f"Config reload failed: {e}")
+            else:
+                await self.log_security_event(
+                    "CONFIG_RELOADED", self.user.id, f"Reloaded after file change in {elapsed * 1000:.1f}ms"
+                )
+
+    def _register_metrics(self):
+        metrics = self.metrics
+        metrics.describe('hallmonitor_voice_events_total', 'counter', 'Voice state updates received')
+        metrics.describe('hallmonitor_enforcements_total', 'counter', 'Members moved out of monitored channels')
+        metrics.describe('hallmonitor_move_failures_total', 'counter', 'Failed attempts to move a member')
+        metrics.describe(
+            'hallmonitor_unauthorized_attempts_total', 'counter',
+            'Unauthorized attempts by escalation level reached'
+        )
+        metrics.describe('hallmonitor_log_queue_depth', 'gauge', 'Events waiting for the log channel')
+        metrics.describe('hallmonitor_log_events_dropped_total', 'counter', 'Log channel events dropped')
+        metrics.describe('hallmonitor_evictions_pending', 'gauge', 'Members queued for eviction')
+        metrics.describe('hallmonitor_rest_request_seconds', 'histogram', 'Discord REST latency per route')
+        metrics.describe('hallmonitor_rest_errors_total', 'counter', 'Discord REST errors per route and status')
+        metrics.describe('hallmonitor_event_loop_lag_seconds', 'histogram', 'Event loop scheduling lag')
+        metrics.describe(
+            'hallmonitor_reconcile_evictions_total', 'counter',
+            'Members removed by reconciliation sweeps'
+        )
+        metrics.describe('hallmonitor_reconcile_seconds', 'histogram', 'Reconciliation sweep duration')
+        metrics.describe('hallmonitor_handler_seconds', 'histogram', 'Event and command handler duration')
+        metrics.describe('hallmonitor_stack_samples_total', 'counter', 'Stack samples logged by the watchdog')
+        metrics.describe(
+            'hallmonitor_stack_samples_skipped_total', 'counter',
+            'Stack samples skipped because the per-minute budget was spent'
+        )
+        metrics.describe(
+            'hallmonitor_enforcement_stage_seconds', 'histogram',
+            'Channel enforcement latency per stage'
+        )
+        metrics.describe(
+            'hallmonitor_commands_rate_limited_total', 'counter',
+            'Command invocations dropped by the rate limiter, by bucket'
+        )
+        metrics.describe('hallmonitor_action_queue_depth', 'gauge', 'REST actions waiting to start, by class')
+        metrics.describe(
+            'hallmonitor_action_wait_seconds', 'histogram',
+            'Time REST actions waited for a slot, by class'
+        )
+        metrics.describe('hallmonitor_action_retries_total', 'counter', 'REST actions retried after 429/5xx')
+        metrics.describe('hallmonitor_action_failures_total', 'counter', 'REST actions that failed for good')
+        metrics.describe('hallmonitor_overwrite_edits_total', 'counter', 'Channel overwrite edits sent by the sync')
+        metrics.describe(
+            'hallmonitor_overwrite_changes_total', 'counter',
+            'Overwrite targets changed by the sync'
+        )
+        metrics.describe('hallmonitor_raid_lockdowns_total', 'counter', 'Raid lockdowns started')
+        metrics.describe('hallmonitor_raid_lockdowns_active', 'gauge', 'Channels currently locked down')
+        metrics.gauge('hallmonitor_raid_lockdowns_active', lambda: len(self.raids.active()))
+        for action_class in ActionScheduler.CLASSES:
+            metrics.gauge(
+                'hallmonitor_action_queue_depth',
+                functools.partial(self.actions.depth, action_class),
+                (('class', action_class),)
+            )
+        metrics.gauge('hallmonitor_evictions_pending', self.evictions.pending)
+        metrics.describe('hallmonitor_dm_queue_depth', 'gauge', 'Direct messages waiting to be sent')
+        metrics.describe(
+            'hallmonitor_dms_suppressed_total', 'counter',
+            'Direct messages skipped as duplicates or to users with closed DMs'
+        )
+        metrics.gauge('hallmonitor_dm_queue_depth', self.notifications.queue.qsize)
+        metrics.counter(
+            'hallmonitor_dms_suppressed_total',
+            lambda: self.notifications.stats['deduplicated'] + self.notifications.stats['skipped_forbidden']
+        )
+        if self.log_writer:
+            metrics.gauge('hallmonitor_log_queue_depth', self.log_writer.queue.qsize)
+            metrics.counter('hallmonitor_log_events_dropped_total', lambda: self.log_writer.stats['dropped'])
+
+    def _instrument_http(self):
+        """Time every REST request by route template"""
+        request = self.http.request
+        metrics = self.metrics
+
+        async def timed_request(route, **kwargs):
+            labels = (('route', f"{route.method} {route.path}"),)
+            start = time.perf_counter()
+            try:
+                return await request(route, **kwargs)
+            except discord.errors.HTTPException as e:
+                metrics.inc('hallmonitor_rest_errors_total', labels + (('status', e.status),))
+                raise
+            finally:
+                metrics.observe('hallmonitor_rest_request_seconds', time.perf_counter() - start, labels)
+
+        self.http.request = timed_request
+
+    async def _start_metrics_server(self):
+        async def handle_metrics(request):
+            return web.Response(text=self.metrics.render(), content_type='text/plain')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+        self._metrics_runner = web.AppRunner(app, access_log=None)
+        await self._metrics_runner.setup()
+        await web.TCPSite(self._metrics_runner, METRICS_HOST, METRICS_PORT).start()
+
+    async def setup_hook(self):
+        """Start background tasks once the event loop is running"""
+        self._register_metrics()
+        self._instrument_http()
+        if WATCHDOG_ENABLED:
+            self.watchdog.start()
+        if METRICS_PORT:
+            await self._start_metrics_server()
+        if CONFIG_POLL_INTERVAL > 0:
+            self.spawn(self._watch_config(), name="config-watcher")
+        if AUDIT_INTERVAL > 0:
+            self.spawn(self._audit_channels(), name="channel-audit")
+        if self._snapshot_generation is None:
+            self.spawn(self._save_policy_snapshot(force=True), name="policy-snapshot")
+        self.evictions.start()
+        self.notifications.start()
+        if self.state:
+            self.state.start()
+        if self.log_writer:
+            self.log_writer.start()
+
+    async def invoke(self, ctx):
+        """Run a command under the watchdog's handler timing"""
+        with self.watchdog.track(f"command:{ctx.command}"):
+            await super().invoke(ctx)
+
+    async def close(self):
+        try:
+            await self.watchdog.stop()
+            self.overwrites.stop()
+            if self._metrics_runner:
+                await self._metrics_runner.cleanup()
+            await self.evictions.stop()
+            # Everything that still sends through the action scheduler stops before it
+            await self.raids.stop()
+            await self.notifications.stop()
+            if self.log_writer:
+                await self.log_writer.stop()
+            await self.actions.stop()
+            if self.state:
+                await self.state.stop()
+        finally:
+            await super().close()
+
+    def spawn(self, coro, name=None):
+        """Run a coroutine as a supervised background task
+
+        Failures are logged and never propagate into the caller, and a strong
+        reference is kept until the task finishes.
+        """
+        task = asyncio.create_task(coro, name=name)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+        return task
+
+    def _background_task_done(self, task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(
+                f"Background task {task.get_name()} failed",
+                exc_info=task.exception()
+            )
+
+    async def _timed(self, stage, coro):
+        """Await a coroutine and record its duration in the stage histogram"""
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.stage_latency[stage].observe(time.perf_counter() - start)
+
+    async def enforce_channel(self, member, policy, received_at):
+        """Eject an unauthorized member, then fan out logging and notification
+
+        The move is the only step awaited inline; the log post and DM run
+        concurrently as background tasks so they never delay the next eviction.
+        Returns True if the member was moved.
+        """
+        general_channel = self.get_channel(policy.destination_id)
+        if not general_channel:
+            self.spawn(self.log_security_event(
+                "ERROR",
+                self.user.id,
+                "General channel not found"
+            ), name="log-error")
+            return False
+
+        async def move():
+            # The member may have left while the move waited for a slot
+            voice = member.voice
+            if voice is None or voice.channel is None or voice.channel.id != policy.channel_id:
+                return False
+            await member.move_to(general_channel)
+            return True
+
+        start = time.perf_counter()
+        try:
+            if not await self.actions.run('evict', 'member.move', move):
+                self.evictions.stats['stale'] += 1
+                return False
+        except Exception as e:
+            self.metrics.inc('hallmonitor_move_failures_total')
+            self.spawn(self.log_security_event(
+                "ERROR",
+                member.id,
+                f"Error moving user: {str(e)}",
+                guild_id=policy.guild_id,
+                channel_id=policy.channel_id
+            ), name="log-error")
+            return False
+        done = time.perf_counter()
+        self.metrics.inc('hallmonitor_enforcements_total')
+        self.stage_latency['move'].observe(done - start)
+        self.stage_latency['eject'].observe(done - received_at)
+
+        # During a lockdown the channel gets one summary post when it lifts
+        lockdown = self.raids.locked(policy.channel_id)
+        if lockdown is not None:
+            lockdown['evicted'] += 1
+        self.spawn(self._timed('log', self.log_security_event(
+            "CHANNEL_ENFORCEMENT",
+            member.id,
+            f"Moved unauthorized user from monitored channel",
+            guild_id=member.guild.id,
+            channel_id=policy.channel_id,
+            post=lockdown is None
+        )), name="log-enforcement")
+        if NOTIFY_ON_UNAUTHORIZED and lockdown is None:
+            self.notifications.notify(
+                member,
+                "You've been moved to the general channel as you don't "
+                "have permission to join the restricted voice channel."
+            )
+        if policy.escalation:
+            security = self.security_for(member.guild)
+            self.spawn(security.handle_unauthorized_join(member, policy, self), name="escalate-join")
+        return True
+
+    async def reconcile(self, reason):
+        """Sweep every monitored channel and evict unauthorized occupants
+
+        Enforcement only fires on join transitions, so anyone who joined while
+        the bot was down or reconnecting would otherwise stay put. The sweep
+        reads the cached channel member lists and hands offenders to the
+        eviction scheduler. Returns (occupants checked, members removed, seconds).
+        """
+        if self._reconciling:
+            return None
+        self._reconciling = True
+        try:
+            start = time.perf_counter()
+            checked = 0
+            evictions = []
+            for policy in self.policies.channels.values():
+                channel = self.get_channel(policy.channel_id)
+                if channel is None:
+                    continue
+                for member in list(channel.members):
+                    checked += 1
+                    if not self.member_allowed(policy, member):
+                        evictions.append(self.evictions.submit(member, policy, time.perf_counter()))
+            removed = sum(await asyncio.gather(*evictions)) if evictions else 0
+            elapsed = time.perf_counter() - start
+        finally:
+            self._reconciling = False
+
+        self.metrics.inc('hallmonitor_reconcile_evictions_total', amount=removed)
+        self.metrics.observe('hallmonitor_reconcile_seconds', elapsed)
+        if removed or reason != 'audit':
+            await self.log_security_event(
+                "RECONCILIATION",
+                self.user.id,
+                f"Sweep on {reason}: removed {removed} of {len(evictions)} unauthorized "
+                f"({checked} occupants checked) in {elapsed * 1000:.0f}ms"
+            )
+        return checked, removed, elapsed
+
+    async def _audit_channels(self):
+        """Periodically re-run the reconciliation sweep"""
+        while True:
+            await asyncio.sleep(AUDIT_INTERVAL)
+            if self.is_ready():
+                # Also repairs overwrites edited by hand since the last sweep
+                self.overwrites.request()
+                await self.reconcile('audit')
+
+    async def log_security_event(self, event_type, user_id, details, guild_id=None, channel_id=None,
+                                 post=True):
+        """Log security events to file, journal and (unless post is false) Discord channel"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_message = f"{timestamp} - {event_type} - User: {user_id} - {details}"
+        
+        # Log to file and journal (written by the listener thread)
+        logging.info(
+            log_message,
+            extra={
+                'event_type': event_type,
+                'user_id': user_id,
+                'guild_id': guild_id,
+                'channel_id': channel_id,
+                'details': details,
+                'mono': time.monotonic(),
+            }
+        )
+        
+        # Queue for the Discord log channel; the writer task does the sending
+        if self.log_writer and post:
+            await self.log_writer.submit(log_message)
+
+    async def check_authorization(self, ctx):
+        """Check if user is authorized and handle unauthorized attempts"""
+        user_id = ctx.author.id
+        is_owner = user_id == self.policy_config.owner_id
+        where = {
+            'guild_id': ctx.guild.id if ctx.guild else None,
+            'channel_id': ctx.channel.id if ctx.channel else None,
+        }
+
+        # Two set lookups; allowlisted callers are exempt from the global bucket
+        allowed = self.policies.is_allowed(user_id) or self.command_allowed(ctx.author, ctx.command.name)
+
+        # Rate limit before any logging or DM work; excess commands are dropped silently
+        if not is_owner:
+            limited = self.rate_limiter.check(user_id, trusted=allowed)
+            if limited:
+                self.metrics.inc('hallmonitor_commands_rate_limited_total', (('bucket', limited),))
+                return False
+
+        # Owner is always authorized
+        if is_owner:
+            await self.log_security_event(
+                "AUTHORIZED_COMMAND",
+                user_id,
+                f"Executed command: {ctx.command}",
+                **where
+            )
+            return True
+
+        security = self.security_for(ctx.guild)
+
+        # Check if user is in timeout
+        remaining_time = security.timeout_remaining(user_id)
+        if remaining_time:
+            await self.log_security_event(
+                "BLOCKED_ATTEMPT",
+                user_id,
+                f"Attempted command while in timeout: {ctx.command}",
+                **where
+            )
+            if NOTIFY_ON_UNAUTHORIZED:
+                self.notifications.notify(
+                    ctx.author,
+                    f"You are in timeout for {int(remaining_time // 60)} more minutes.",
+                    key="timeout-reminder"
+                )
+            return False
+
+        # Check if user is allowed, directly or through a role
+        if allowed:
             await self.log_security_event(
                 "AUTHORIZED_COMMAND",
                 user_id,
-                f"Executed command: {ctx.command}"
+                f"Executed command: {ctx.command}",
+                **where
             )
             return True
         else:
             # Unauthorized attempt
-            await self.security.handle_unauthorized_attempt(ctx, self)
+            await security.handle_unauthorized_attempt(ctx, self)
             return False
 
-bot = SecureBot()
+class ShardedSecureBot(SecureBot, commands.AutoShardedBot):
+    """SecureBot running several gateway shards in one process"""
+
+def create_bot():
+    """Build the bot for the configured sharding mode"""
+    if not SHARDED:
+        return SecureBot()
+    options = {}
+    if SHARD_COUNT:
+        options['shard_count'] = SHARD_COUNT
+    if SHARD_IDS:
+        options['shard_ids'] = parse_shard_ids(SHARD_IDS)
+    return ShardedSecureBot(**options)
+
+bot = create_bot()
 
 @bot.event
 async def on_ready():
     """Event handler for when the bot starts up"""
     print(f'{bot.user} has connected to Discord!')
-    await bot.log_security_event("STARTUP", bot.user.id, "Bot initialized")
+    await bot.log_security_event(
+        "STARTUP",
+        bot.user.id,
+        f"Bot initialized (policy from {bot.policy_source}, "
+        f"{'lean' if bot.lean_cache else 'full'} member cache)"
+    )
+    # Catch anyone who joined a monitored channel while we were offline
+    bot.spawn(bot.reconcile('ready'), name="reconcile-ready")
+    bot.spawn(bot.replay_outbox(), name="replay-outbox")
+    bot.overwrites.request()
+
+@bot.event
+async def on_member_update(before, after):
+    """Keep the role authorization cache current"""
+    if before.roles != after.roles:
+        bot.auth_cache.refresh(after)
+
+@bot.event
+async def on_member_remove(member):
+    """Drop departed members from the role authorization cache"""
+    bot.auth_cache.discard(member)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    """Re-sync a monitored channel whose overwrites were changed by someone else"""
+    if after.id in bot.policies.channels and before.overwrites != after.overwrites:
+        bot.overwrites.request([after.id])
 
 @bot.event
+async def on_resumed():
+    """Event handler for when the gateway session resumes after a disconnect"""
+    bot.spawn(bot.reconcile('resume'), name="reconcile-resume")
+
+@bot.event
+@bot.watchdog.timed('on_voice_state_update')
 async def on_voice_state_update(member, before, after):
     """Event handler for voice channel changes"""
+    bot.metrics.inc('hallmonitor_voice_events_total')
+    if bot.lean_cache and before.channel is None:
+        # Members outside voice aren't cached, so role changes may have been missed
+        bot.auth_cache.discard(member)
+    # Most voice events are for channels we don't watch; reject them with a single dict miss
+    if after.channel is None:
+        return
+    policy = bot.policies.channels.get(after.channel.id)
+    if policy is None:
+        return
+    received_at = time.perf_counter()
+
     # Check if the user joined a new voice channel
     if before.channel != after.channel:
-        # If the user joined the monitored voice channel
-        if after.channel and after.channel.id == MONITORED_CHANNEL_ID:
-            # If the user is not allowed
-            if member.id not in ALLOWED_USER_IDS:
-                general_channel = bot.get_channel(GENERAL_CHANNEL_ID)
-                if general_channel:
-                    try:
-                        await member.move_to(general_channel)
-                        await bot.log_security_event(
-                            "CHANNEL_ENFORCEMENT",
-                            member.id,
-                            f"Moved unauthorized user from monitored channel"
-                        )
-                        if NOTIFY_ON_UNAUTHORIZED:
-                            try:
-                                await member.send(
-                                    "You've been moved to the general channel as you don't "
-                                    "have permission to join the restricted voice channel."
-                                )
-                            except discord.errors.Forbidden:
-                                # User has DMs closed
-                                pass
-                    except Exception as e:
-                        await bot.log_security_event(
-                            "ERROR",
-                            member.id,
-                            f"Error moving user: {str(e)}"
-                        )
-                else:
-                    await bot.log_security_event(
-                        "ERROR",
-                        bot.user.id,
-                        "General channel not found"
-                    )
+        # If the user is not allowed
+        if not bot.member_allowed(policy, member):
+            bot.raids.record(policy)
+            bot.evictions.submit(member, policy, received_at)
+
+USER_TOKEN = re.compile(r"<@!?(\d+)>|(\d+)")
+
+async def collect_user_ids(ctx, args):
+    """Gather user IDs from command arguments and any attached CSV/text files
+
+    Accepts plain IDs and mentions separated by spaces, commas or newlines.
+    Returns (ids, rejected tokens).
+    """
+    chunks = [(arg, False) for arg in args]
+    for attachment in ctx.message.attachments:
+        chunks.append(((await attachment.read()).decode('utf-8', errors='replace'), True))
+
+    user_ids = set()
+    rejected = []
+    for chunk, is_file in chunks:
+        tokens = [token for token in re.split(r"[\s,;]+", chunk) if token]
+        for position, token in enumerate(tokens):
+            match = USER_TOKEN.fullmatch(token)
+            if match:
+                user_ids.add(int(match.group(1) or match.group(2)))
+            elif is_file and position == 0 and token.isidentifier():
+                # Tolerate a CSV header such as "user_id"
+                continue
+            else:
+                rejected.append(token)
+    return user_ids, rejected
+
+def summarize_ids(user_ids, limit=20):
+    """Short, bounded rendering of a set of IDs for replies and log events"""
+    shown = ", ".join(str(uid) for uid in sorted(user_ids)[:limit])
+    if len(user_ids) > limit:
+        shown += f" and {len(user_ids) - limit} more"
+    return shown
+
+class LazyLines:
+    """Read-only sequence that formats items[start:] only as they are read"""
+
+    def __init__(self, items, format_item, start=0):
+        self.items = items
+        self.format_item = format_item
+        self.start = start
+
+    def __len__(self):
+        return len(self.items) - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.format_item(self.items[self.start + index])
+
+    def __iter__(self):
+        for i in range(self.start, len(self.items)):
+            yield self.format_item(self.items[i])
+
+async def send_listing(ctx, title, lines, page="1", filename="listing.txt", page_size=None):
+    """Send one page of a long listing, or the whole listing as an attachment
+
+    lines is any sequence; only the requested page is joined, so large
+    listings never build one huge message.
+    """
+    page_size = page_size or LISTING_PAGE_SIZE
+    total = len(lines)
+    if page == "all":
+        buffer = io.BytesIO()
+        for line in lines:
+            buffer.write(f"{line}\n".encode())
+        buffer.seek(0)
+        await ctx.send(f"{title} ({total} entries):", file=discord.File(buffer, filename=filename))
+        return
+
+    try:
+        number = int(page)
+    except ValueError:
+        await ctx.send(f"Unknown page '{page}'; use a page number or 'all'.")
+        return
+    pages = max(1, -(-total // page_size))
+    number = min(max(number, 1), pages)
+    start = (number - 1) * page_size
+    body = "\n".join(str(line) for line in lines[start:start + page_size])
+    footer = f"\nPage {number}/{pages}, {total} entries" + (
+        f" (`{ctx.prefix}{ctx.invoked_with} <page>` or `all` for a file)" if pages > 1 else ""
+    )
+    message = f"{title}:\n```\n{body or 'None'}\n```{footer}"
+    if len(message) > 2000:
+        # Unusually long lines; fall back to an attachment rather than failing
+        await send_listing(ctx, title, lines, "all", filename)
+        return
+    await ctx.send(message)
 
 @bot.command()
-async def allow(ctx, user_id: int):
-    """Add a user to the allowed list"""
+async def allow(ctx, *user_ids: str):
+    """Add users to the allowed list (IDs, mentions or an attached CSV)"""
     if await bot.check_authorization(ctx):
-        if user_id not in ALLOWED_USER_IDS:
-            ALLOWED_USER_IDS.append(user_id)
-            await ctx.send(f"User {user_id} added to allowed list.")
+        requested, rejected = await collect_user_ids(ctx, user_ids)
+        if rejected:
+            await ctx.send(f"Not user IDs: {', '.join(rejected[:10])}")
+            return
+        if not requested:
+            await ctx.send("Usage: `!allow <id|@mention> ...` or attach a CSV of user IDs.")
+            return
+        added = bot.policies.allow(requested)
+        if added:
+            bot.overwrites.request()
+            await ctx.send(f"{len(added)} user(s) added to allowed list: {summarize_ids(added)}")
             await bot.log_security_event(
                 "USER_ALLOWED",
                 ctx.author.id,
-                f"Added user {user_id} to allowed list"
+                f"Added {len(added)} user(s) to allowed list: {summarize_ids(added)}"
             )
         else:
-            await ctx.send("User is already in the allowed list.")
+            await ctx.send("All given users are already in the allowed list.")
 
 @bot.command()
-async def remove(ctx, user_id: int):
-    """Remove a user from the allowed list"""
+async def remove(ctx, *user_ids: str):
+    """Remove users from the allowed list (IDs, mentions or an attached CSV)"""
     if await bot.check_authorization(ctx):
-        if user_id in ALLOWED_USER_IDS:
-            ALLOWED_USER_IDS.remove(user_id)
-            await ctx.send(f"User {user_id} removed from allowed list.")
+        requested, rejected = await collect_user_ids(ctx, user_ids)
+        if rejected:
+            await ctx.send(f"Not user IDs: {', '.join(rejected[:10])}")
+            return
+        if not requested:
+            await ctx.send("Usage: `!remove <id|@mention> ...` or attach a CSV of user IDs.")
+            return
+        removed = bot.policies.remove(requested)
+        if removed:
+            bot.overwrites.request()
+            await ctx.send(f"{len(removed)} user(s) removed from allowed list: {summarize_ids(removed)}")
             await bot.log_security_event(
                 "USER_REMOVED",
                 ctx.author.id,
-                f"Removed user {user_id} from allowed list"
+                f"Removed {len(removed)} user(s) from allowed list: {summarize_ids(removed)}"
             )
         else:
-            await ctx.send("User is not in the allowed list.")
+            await ctx.send("None of the given users are in the allowed list.")
 
 @bot.command()
-async def listallowed(ctx):
-    """List all allowed users"""
+async def listallowed(ctx, page: str = "1"):
+    """List allowed users, one page at a time or as a file with 'all'"""
     if await bot.check_authorization(ctx):
-        if ALLOWED_USER_IDS:
-            allowed_users = "\n".join([str(uid) for uid in ALLOWED_USER_IDS])
-            await ctx.send(f"Allowed users:\n{allowed_users}")
+        allowed_user_ids = bot.policies.sorted_allowed()
+        if allowed_user_ids:
+            await send_listing(ctx, "Allowed users", allowed_user_ids, page, "allowed_users.txt")
         else:
             await ctx.send("No users in allowed list.")
 
 @bot.command()
-async def security_status(ctx):
-    """View current security status"""
+async def reload(ctx):
+    """Reload config.ini without reconnecting"""
     if await bot.check_authorization(ctx):
-        locked_users_info = "\n".join([
-            f"User {uid}: Locked until {time.strftime('%H:%M:%S', time.localtime(lock_time.timestamp()))}"
-            for uid, lock_time in bot.security.timeout_until.items()
-        ])
-        failed_attempts_info = "\n".join([
-            f"User {uid}: {len(attempts)} attempts"
-            for uid, attempts in bot.security.attempts.items()
+        try:
+            elapsed = await bot.reload_config()
+        except Exception as e:
+            await ctx.send(f"Reload failed, keeping the current configuration: {e}")
+            await bot.log_security_event("ERROR", ctx.author.id, f"Config reload failed: {e}")
+            return
+        await ctx.send(
+            f"Configuration reloaded in {elapsed * 1000:.1f}ms "
+            f"({len(bot.policies.channels)} monitored channels)."
+        )
+        await bot.log_security_event(
+            "CONFIG_RELOADED",
+            ctx.author.id,
+            f"Reloaded by command in {elapsed * 1000:.1f}ms"
+        )
+
+@bot.command()
+async def metrics(ctx):
+    """Dump current metrics in Prometheus text format"""
+    if await bot.check_authorization(ctx):
+        text = bot.metrics.render()
+        if len(text) < 1900:
+            await ctx.send(f"```\n{text}```")
+        else:
+            await ctx.send(file=discord.File(io.BytesIO(text.encode()), filename="metrics.txt"))
+
+@bot.command()
+async def latency(ctx):
+    """View per-stage channel enforcement latency"""
+    if await bot.check_authorization(ctx):
+        lines = [
+            f"{stage}: {histogram.summary()}"
+            for stage, histogram in bot.stage_latency.items()
+        ]
+        lines.append(f"evictions: {bot.evictions.summary()}")
+        body = "\n".join(lines)
+        await ctx.send(f"Enforcement latency:\n```\n{body}\n```")
+
+@bot.command()
+async def exportrules(ctx):
+    """Export allowed users and role rules as JSON"""
+    if await bot.check_authorization(ctx):
+        data = json.dumps(bot.policies.export_rules(), indent=2)
+        await ctx.send(
+            "Current allow rules:",
+            file=discord.File(io.BytesIO(data.encode()), filename="allow_rules.json")
+        )
+
+@bot.command()
+async def importrules(ctx, mode: str = "merge"):
+    """Import allow rules from an attached JSON file (merge or replace)"""
+    if await bot.check_authorization(ctx):
+        if mode not in ("merge", "replace") or not ctx.message.attachments:
+            await ctx.send("Usage: attach an exported rules file to `!importrules [merge|replace]`.")
+            return
+        try:
+            data = json.loads(await ctx.message.attachments[0].read())
+            added, removed = bot.policies.import_rules(data, replace=(mode == "replace"))
+        except (ValueError, TypeError, AttributeError) as e:
+            await ctx.send(f"Could not import rules: {e}")
+            return
+        bot.overwrites.request()
+        await ctx.send(f"Rules imported ({mode}): {len(added)} users added, {len(removed)} removed.")
+        await bot.log_security_event(
+            "RULES_IMPORTED",
+            ctx.author.id,
+            f"Imported allow rules ({mode}): +{len(added)} / -{len(removed)} users, "
+            f"{len(bot.policies.role_rules)} role rule scopes"
+        )
+
+@bot.command()
+async def audit(ctx, user: str, days: float = 7.0, event_type: str = "all", page: str = "1"):
+    """Query the security journal for a user: !audit <user> [days] [event type|all] [page]"""
+    if await bot.check_authorization(ctx):
+        match = USER_TOKEN.fullmatch(user)
+        if not JOURNAL_FILE or not match:
+            await ctx.send("Usage: `!audit <id|@mention> [days] [event type|all] [page]` (journal must be enabled).")
+            return
+        user_id = int(match.group(1) or match.group(2))
+        event_types = None if event_type == "all" else {event_type.upper()}
+        limit = 10000
+        entries = await asyncio.to_thread(lambda: [
+            format_journal_entry(entry)
+            for entry in JournalReader(JOURNAL_FILE).query(
+                user_id=user_id,
+                since=time.time() - days * 86400,
+                event_types=event_types,
+                limit=limit + 1,
+                newest_first=True
+            )
         ])
-        
-        await ctx.send(f"""Security Status:
-Locked Users:
-{locked_users_info or 'None'}
+        title = f"Events for {user_id} in the last {days:g} days, newest first"
+        if len(entries) > limit:
+            entries = entries[:limit]
+            title += f" (only the newest {limit} shown; narrow the days or event type for older ones)"
+        if entries:
+            await send_listing(ctx, title, entries, page, "audit.txt")
+        else:
+            await ctx.send(f"No matching events for {user_id} in the last {days:g} days.")
+
+@bot.command()
+async def simulate(ctx, days: float = 7.0, *, ladder: str = ""):
+    """Replay journaled attempts against a candidate escalation ladder
+
+    The candidate is the given ladder ("2:5:warn, 3:15:timeout, ...") or,
+    without one, the escalation settings currently in config.ini.
+    """
+    if await bot.check_authorization(ctx):
+        if not JOURNAL_FILE:
+            await ctx.send("The security journal is disabled; there is nothing to replay.")
+            return
+        guild_id = ctx.guild.id if ctx.guild else 0
+        try:
+            if ladder:
+                candidate = bot.policy_config.escalation_for(guild_id, parse_escalation(ladder))
+                source = "the given ladder"
+            else:
+                parser = await asyncio.to_thread(read_config, CONFIG_FILE)
+                candidate = load_policy_config(parser).escalation_for(guild_id)
+                source = CONFIG_FILE
+        except (ValueError, KeyError, OSError) as e:
+            await ctx.send(f"Invalid candidate policy: {e}")
+            return
+        current = bot.policy_config.escalation_for(guild_id)
+
+        def replay():
+            entries = [
+                entry for entry in JournalReader(JOURNAL_FILE).query(
+                    since=time.time() - days * 86400,
+                    event_types={"UNAUTHORIZED_ATTEMPT"}
+                )
+                if (entry.get('guild_id') or 0) == guild_id
+            ]
+            return simulate_escalation(entries, current), simulate_escalation(entries, candidate)
+
+        before, after = await asyncio.to_thread(replay)
+        body = "\n".join(
+            f"{outcome}: {before[outcome]} -> {after[outcome]}"
+            for outcome in sorted(set(before) | set(after))
+        )
+        await ctx.send(
+            f"Replayed the last {days:g} days against {source} (current -> candidate):\n"
+            f"```\n{body or 'No attempts journaled'}\n```"
+        )
+
+@bot.command()
+async def security_status(ctx, page: str = "1"):
+    """View current security status, paged, or as a file with 'all'"""
+    if await bot.check_authorization(ctx):
+        security = bot.security_for(ctx.guild)
+        now = time.time()
+        security.purge_expired(now)
+        summary = security.summary(STATUS_TOP_OFFENDERS, now)
+        levels = ", ".join(f"{level}: {count}" for level, count in summary['levels']) or "none"
+        offenders = ", ".join(f"{uid} ({count})" for uid, count in summary['top']) or "none"
+        # Only the page shown is formatted
+        locked = LazyLines(
+            security.timeout_order,
+            lambda entry: f"User {entry[1]}: Locked until "
+                          f"{time.strftime('%H:%M:%S', time.localtime(entry[0]))}",
+            security.active_timeouts(now)
+        )
+
+        raid_info = "Disabled"
+        if bot.raids.enabled:
+            raid_info = ", ".join(f"channel {channel_id}" for channel_id in bot.raids.active()) or "None active"
+
+        log_channel_info = "Disabled"
+        if bot.log_writer:
+            stats = bot.log_writer.stats
+            log_channel_info = (
+                f"{stats['queued']} queued, {stats['flushed']} flushed, "
+                f"{stats['dropped']} dropped, {bot.log_writer.queue.qsize()} pending"
+            )
+
+        await ctx.send(
+            f"Security Status: {summary['locked']} locked users, "
+            f"{summary['tracked']} users with failed attempts\n"
+            f"Users per warning level: {levels}\n"
+            f"Top offenders: {offenders}\n"
+            f"Raid Lockdowns: {raid_info}\n"
+            f"Log Channel: {log_channel_info}\n"
+            f"Rate Limiter: {bot.rate_limiter.stats['dropped_user']} dropped per-user, "
+            f"{bot.rate_limiter.stats['dropped_global']} dropped global, "
+            f"{bot.rate_limiter.tracked_users()} users tracked"
+        )
+        await send_listing(
+            ctx, "Locked users, soonest expiry first", locked, page, "security_status.txt", page_size=30
+        )
+
+def audit_cli(argv):
+    """Query the security journal from the command line"""
+    parser = argparse.ArgumentParser(
+        prog='hallmonitor.py audit',
+        description="Query the structured security event journal"
+    )
+    parser.add_argument('--user', type=int, help="only events for this user ID")
+    parser.add_argument('--days', type=float, default=7.0, help="how far back to look (default 7)")
+    parser.add_argument('--type', action='append', dest='event_types', help="event type, repeatable")
+    parser.add_argument('--limit', type=int, help="stop after this many events")
+    parser.add_argument('--newest', action='store_true', help="newest events first")
+    parser.add_argument('--json', action='store_true', help="print raw JSON entries")
+    parser.add_argument('--journal', default=JOURNAL_FILE, help="journal path (default from config)")
+    args = parser.parse_args(argv)
+
+    reader = JournalReader(args.journal)
+    entries = reader.query(
+        user_id=args.user,
+        since=time.time() - args.days * 86400,
+        event_types=set(args.event_types) if args.event_types else None,
+        limit=args.limit,
+        newest_first=args.newest
+    )
+    for entry in entries:
+        print(json.dumps(entry, ensure_ascii=False) if args.json else format_journal_entry(entry))
 
-Failed Attempts:
-{failed_attempts_info or 'None'}
-""")
+def main():
+    """Run the bot, or the journal query tool with `audit`"""
+    if sys.argv[1:2] == ['audit']:
+        audit_cli(sys.argv[2:])
+        return
+    bot.run(TOKEN)
 
-# Run the bot
-bot.run(TOKEN)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Point hallmonitor at a throwaway config before the tests import it"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CONFIG = """
+[Bot]
+token = offline
+
+[Users]
+owner = 1
+allowed = 2, 3
+
+[Channels]
+monitored = 100
+removal_destination = 200
+
+[Security]
+notify_on_unauthorized = false
+
+[General]
+log_file = {directory}/test.log
+journal_file =
+state_file = {directory}/import_state.db
+policy_snapshot = {directory}/import_policy.snapshot
+config_poll_interval = 0
+"""
+
+_config_dir = tempfile.TemporaryDirectory()
+with open(os.path.join(_config_dir.name, 'config.ini'), 'w') as f:
+    f.write(CONFIG.format(directory=_config_dir.name))
+os.environ['HALLMONITOR_CONFIG'] = os.path.join(_config_dir.name, 'config.ini')
+
+import hallmonitor
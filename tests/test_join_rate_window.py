@@ -0,0 +1,54 @@
+import random
+import unittest
+
+from support import hallmonitor
+
+class JoinRateWindowTest(unittest.TestCase):
+    def test_counts_inside_window(self):
+        window = hallmonitor.JoinRateWindow(window=10.0, buckets=10)
+        self.assertEqual(window.count(100.0), 0)
+        self.assertEqual(window.add(100.0), 1)
+        self.assertEqual(window.add(100.5), 2)
+        self.assertEqual(window.add(105.2), 3)
+        self.assertEqual(window.count(109.9), 3)
+
+    def test_slides_one_bucket_at_a_time(self):
+        window = hallmonitor.JoinRateWindow(window=10.0, buckets=10)
+        window.add(100.0)
+        window.add(100.9)
+        window.add(104.0)
+        # The bucket holding 100.x expires once the window moves past it
+        self.assertEqual(window.count(110.0), 1)
+        self.assertEqual(window.count(113.9), 1)
+        self.assertEqual(window.count(114.0), 0)
+        self.assertEqual(window.counts, [0] * 10)
+
+    def test_gap_longer_than_window_resets(self):
+        window = hallmonitor.JoinRateWindow(window=10.0, buckets=10)
+        for i in range(20):
+            window.add(100.0 + i * 0.1)
+        self.assertEqual(window.add(500.0), 1)
+        self.assertEqual(window.total, sum(window.counts))
+
+    def test_late_event_counts_in_newest_bucket(self):
+        window = hallmonitor.JoinRateWindow(window=10.0, buckets=10)
+        window.add(105.0)
+        self.assertEqual(window.add(103.0), 2)
+        self.assertEqual(window.count(114.9), 2)
+        self.assertEqual(window.count(115.0), 0)
+
+    def test_matches_bucketed_recount(self):
+        window = hallmonitor.JoinRateWindow(window=10.0, buckets=10)
+        rng = random.Random(3)
+        now = 0.0
+        times = []
+        for _ in range(2000):
+            now += rng.expovariate(2.0)
+            times.append(now)
+            bucket = int(now // window.width)
+            expected = sum(1 for ts in times if int(ts // window.width) > bucket - len(window.counts))
+            self.assertEqual(window.add(now), expected)
+            self.assertEqual(window.total, sum(window.counts))
+
+if __name__ == '__main__':
+    unittest.main()
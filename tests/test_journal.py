@@ -0,0 +1,111 @@
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from support import hallmonitor
+
+def event(ts, user_id, event_type='UNAUTHORIZED_JOIN'):
+    return logging.makeLogRecord({
+        'created': ts, 'event_type': event_type, 'user_id': user_id, 'details': f"at {ts}",
+    })
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'journal.jsonl')
+        self.handlers = []
+
+    def tearDown(self):
+        for handler in self.handlers:
+            handler.close()
+        self.directory.cleanup()
+
+    def open_handler(self):
+        handler = hallmonitor.JournalHandler(self.path)
+        self.handlers.append(handler)
+        return handler
+
+    def query(self, **filters):
+        return [(entry['ts'], entry['user_id']) for entry in hallmonitor.JournalReader(self.path).query(**filters)]
+
+    def test_time_range_queries(self):
+        handler = self.open_handler()
+        for i in range(100):
+            handler.emit(event(1000 + i, i % 3))
+        handler.emit(event(1100, 7, event_type='RAID_LOCKDOWN'))
+
+        self.assertEqual(self.query(since=1050, until=1052), [(1050, 2), (1051, 0), (1052, 1)])
+        self.assertEqual(self.query(since=1098), [(1098, 2), (1099, 0), (1100, 7)])
+        self.assertEqual(self.query(until=1001.5), [(1000, 0), (1001, 1)])
+        self.assertEqual(self.query(since=2000), [])
+        self.assertEqual(self.query(event_types={'RAID_LOCKDOWN'}), [(1100, 7)])
+        self.assertEqual(self.query(since=1090, limit=2, newest_first=True), [(1100, 7), (1099, 0)])
+        self.assertEqual(self.query(until=1052, limit=2, newest_first=True), [(1052, 1), (1051, 0)])
+
+    def test_missing_journal_yields_nothing(self):
+        self.assertEqual(self.query(), [])
+        self.assertEqual(self.query(user_id=1), [])
+
+    def test_recovers_from_torn_writes(self):
+        handler = self.open_handler()
+        for i in range(5):
+            handler.emit(event(1000 + i, 1))
+        handler.close()
+        self.handlers.remove(handler)
+        # Crash after a journal line was written but before its index record,
+        # while another index record and journal line were half written
+        with open(self.path, 'ab') as journal:
+            journal.write(b'{"ts": 1005, "mono": null, "event_type": "UNAUTHORIZED_JOIN", '
+                          b'"user_id": 2, "guild_id": null, "channel_id": null, "details": ""}\n')
+            journal.write(b'{"ts": 1006, "user')
+        with open(self.path + '.idx', 'ab') as index:
+            index.write(b'\x00' * 10)
+
+        handler = self.open_handler()
+        self.assertEqual(os.path.getsize(self.path + '.idx') % hallmonitor.JournalHandler.INDEX_RECORD.size, 0)
+        handler.emit(event(1007, 3))
+
+        self.assertEqual(self.query(), [(1000 + i, 1) for i in range(5)] + [(1005, 2), (1007, 3)])
+        self.assertEqual(self.query(user_id=3), [(1007, 3)])
+
+        # Reopening an intact journal indexes nothing twice
+        handler.close()
+        self.handlers.remove(handler)
+        self.open_handler()
+        self.assertEqual(len(self.query()), 7)
+
+    def test_user_index_merges_tail(self):
+        with mock.patch.object(hallmonitor.JournalHandler, 'USER_INDEX_MIN_TAIL', 8):
+            handler = self.open_handler()
+            for i in range(50):
+                handler.emit(event(1000 + i, i % 4))
+            covered = handler._user_indexed
+            self.assertGreater(covered, 0)
+            self.assertLess(covered, 50)
+            with open(self.path + '.uidx', 'rb') as f:
+                header, = hallmonitor.JournalHandler.USER_INDEX_HEADER.unpack(
+                    f.read(hallmonitor.JournalHandler.USER_INDEX_HEADER.size))
+            self.assertEqual(header, covered)
+
+            # Results span the sorted user index and the unmerged tail
+            expected = [(1000 + i, 1) for i in range(1, 50, 4)]
+            self.assertEqual(self.query(user_id=1), expected)
+            self.assertEqual(self.query(user_id=1, since=1020, until=1040),
+                             [item for item in expected if 1020 <= item[0] <= 1040])
+            self.assertEqual(self.query(user_id=1, limit=3, newest_first=True), expected[::-1][:3])
+            self.assertEqual(self.query(user_id=9), [])
+
+            # A user index that does not match the journal is ignored, not trusted
+            with open(self.path + '.uidx', 'ab') as f:
+                f.write(b'\x00' * 5)
+            self.assertEqual(self.query(user_id=1), expected)
+            handler.close()
+            self.handlers.remove(handler)
+            handler = self.open_handler()
+            self.assertEqual(handler._user_indexed, 50)
+            self.assertEqual(self.query(user_id=1), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+from types import SimpleNamespace
+
+import discord
+
+from support import hallmonitor
+
+GUILD_ID = 900
+BOT_ID = 5
+
+def role(role_id):
+    return discord.Object(role_id, type=discord.Role)
+
+def member(user_id):
+    return discord.Object(user_id, type=discord.Member)
+
+def channel(overwrites):
+    return SimpleNamespace(overwrites=overwrites, guild=SimpleNamespace(id=GUILD_ID))
+
+def connect_values(overwrites):
+    return {hallmonitor.overwrite_key(target): overwrite.connect for target, overwrite in overwrites.items()}
+
+class OverwriteSyncTest(unittest.TestCase):
+    def setUp(self):
+        bot = SimpleNamespace(state=None, user=SimpleNamespace(id=BOT_ID))
+        self.sync = hallmonitor.OverwriteSync(bot, mode='overwrites', max_overwrites=5)
+        self.policy = SimpleNamespace(roles=[10], users=[2, 3])
+
+    def test_desired_within_limit(self):
+        self.assertEqual(self.sync.desired(self.policy, GUILD_ID), {
+            ('role', GUILD_ID): False,
+            ('member', BOT_ID): True,
+            ('role', 10): True,
+            ('member', 2): True,
+            ('member', 3): True,
+        })
+
+    def test_desired_over_limit(self):
+        self.sync.max_overwrites = 3
+        # Outside a lockdown the channel is left to reactive eviction
+        self.assertEqual(self.sync.desired(self.policy, GUILD_ID), {('role', GUILD_ID): None})
+        # Under one @everyone stays denied and grants fill the rest of the limit
+        self.assertEqual(self.sync.desired(self.policy, GUILD_ID, lockdown=True), {
+            ('role', GUILD_ID): False,
+            ('member', BOT_ID): True,
+            ('role', 10): True,
+        })
+        self.sync.max_overwrites = 0
+        self.assertEqual(self.sync.desired(self.policy, GUILD_ID, lockdown=True), {('role', GUILD_ID): False})
+
+    def test_diff_adds_missing_targets(self):
+        current = {role(GUILD_ID): discord.PermissionOverwrite(speak=False)}
+        desired = self.sync.desired(self.policy, GUILD_ID)
+        overwrites, changed, owned = self.sync.diff(channel(current), desired)
+
+        self.assertEqual(connect_values(overwrites), desired)
+        self.assertEqual(len(changed), 5)
+        self.assertEqual(owned, set(desired))
+        # Other permissions on an existing overwrite are kept
+        self.assertIs(overwrites[role(GUILD_ID)].speak, False)
+
+    def test_diff_of_synced_channel_is_empty(self):
+        desired = self.sync.desired(self.policy, GUILD_ID)
+        overwrites, _, owned = self.sync.diff(channel({}), desired)
+        _, changed, owned_again = self.sync.diff(channel(overwrites), desired, owned)
+        self.assertEqual(changed, [])
+        self.assertEqual(owned_again, owned)
+
+    def test_diff_leaves_manual_overwrites_alone(self):
+        current = {
+            member(2): discord.PermissionOverwrite(connect=True),
+            member(40): discord.PermissionOverwrite(connect=True),
+            member(41): discord.PermissionOverwrite(connect=False),
+            role(999): discord.PermissionOverwrite(connect=True, speak=True),
+        }
+        desired = self.sync.desired(self.policy, GUILD_ID)
+        overwrites, changed, owned = self.sync.diff(channel(current), desired)
+
+        self.assertEqual({hallmonitor.overwrite_key(target) for target, _ in changed},
+                         {('role', GUILD_ID), ('member', BOT_ID), ('role', 10), ('member', 3)})
+        values = connect_values(overwrites)
+        self.assertIs(values[('member', 40)], True)
+        self.assertIs(values[('member', 41)], False)
+        self.assertIs(values[('role', 999)], True)
+        # A grant made by hand that the policy agrees with is not taken over
+        self.assertNotIn(('member', 2), owned)
+
+    def test_diff_clears_only_managed_targets(self):
+        current = {
+            role(GUILD_ID): discord.PermissionOverwrite(connect=False),
+            member(2): discord.PermissionOverwrite(connect=True),
+            member(3): discord.PermissionOverwrite(connect=True, speak=True),
+            member(40): discord.PermissionOverwrite(connect=True),
+        }
+        managed = {('role', GUILD_ID), ('member', 2), ('member', 3)}
+        # Back in reactive mode nothing is desired any more
+        overwrites, changed, owned = self.sync.diff(channel(current), {}, managed)
+
+        self.assertEqual(len(changed), 3)
+        self.assertEqual(owned, set())
+        self.assertNotIn(role(GUILD_ID), overwrites)
+        self.assertNotIn(member(2), overwrites)
+        self.assertIsNone(overwrites[member(3)].connect)
+        self.assertIs(overwrites[member(3)].speak, True)
+        self.assertIs(overwrites[member(40)].connect, True)
+
+    def test_diff_lifts_deny_over_limit(self):
+        current = {
+            role(GUILD_ID): discord.PermissionOverwrite(connect=False),
+            member(2): discord.PermissionOverwrite(connect=True),
+        }
+        managed = {('role', GUILD_ID), ('member', 2)}
+        overwrites, changed, owned = self.sync.diff(channel(current), {('role', GUILD_ID): None}, managed)
+        self.assertEqual(overwrites, {})
+        self.assertEqual(len(changed), 2)
+        self.assertEqual(owned, set())
+
+    def test_denied(self):
+        self.assertTrue(self.sync.denied(channel({role(GUILD_ID): discord.PermissionOverwrite(connect=False)})))
+        self.assertFalse(self.sync.denied(channel({role(GUILD_ID): discord.PermissionOverwrite(speak=False)})))
+        self.assertFalse(self.sync.denied(channel({member(GUILD_ID): discord.PermissionOverwrite(connect=False)})))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+
+from support import hallmonitor
+
+GUILD_ID = 900
+DIGEST = 'digest'
+
+def policy_config():
+    return hallmonitor.PolicyConfig(
+        owner_id=1,
+        allowed_users=frozenset({1, 2}),
+        allowed_roles=frozenset({10}),
+        guilds={GUILD_ID: hallmonitor.GuildConfig(GUILD_ID, allowed_users=frozenset({4}), escalation_window=3600.0)},
+        channels={
+            100: hallmonitor.ChannelConfig(100, 200, GUILD_ID, allowed_users=frozenset({3}),
+                                           escalation=((2, 5, 'warn'), (4, 60, 'kick'))),
+            101: hallmonitor.ChannelConfig(101, 200, None, allowed_roles=frozenset({11})),
+        },
+        command_roles={'*': frozenset({12})},
+        escalation=hallmonitor.EscalationPolicy(lockout_attempts=3, lockout_seconds=90.0),
+    )
+
+class PolicySnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'policy.snapshot')
+        self.store = hallmonitor.PolicyStore.from_config(policy_config())
+        self.store.allow([50])
+        self.store.remove([2])
+        self.store.import_rules({'roles': {'channel:100': [20], 'command:allow': [21]}})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        hallmonitor.write_policy_snapshot(self.path, self.store.snapshot(DIGEST, 7))
+        loaded = hallmonitor.PolicyStore.load_snapshot(self.path, DIGEST, 7)
+
+        self.assertIsNotNone(loaded)
+        for name in hallmonitor.PolicyStore.SNAPSHOT_FIELDS:
+            self.assertEqual(getattr(loaded, name), getattr(self.store, name), name)
+        policy = loaded.policy_for(100)
+        self.assertIsInstance(policy, hallmonitor.ChannelPolicy)
+        self.assertEqual(policy.escalation.steps, ((2, 5, 'warn'), (4, 60, 'kick')))
+        self.assertEqual(policy.escalation.window, 3600.0)
+        self.assertEqual(policy.escalation.next_step(1, 4), (2, (4, 60, 'kick')))
+        self.assertIsNone(loaded.policy_for(101).guild_id)
+        self.assertTrue(loaded.is_allowed(50))
+        self.assertFalse(loaded.is_allowed(2))
+
+    def test_stale_snapshot_is_ignored(self):
+        hallmonitor.write_policy_snapshot(self.path, self.store.snapshot(DIGEST, 7))
+        self.assertIsNone(hallmonitor.PolicyStore.load_snapshot(self.path, DIGEST, 8))
+        self.assertIsNone(hallmonitor.PolicyStore.load_snapshot(self.path, 'other', 7))
+
+    def test_malformed_snapshot_falls_back(self):
+        hallmonitor.write_policy_snapshot(self.path, self.store.snapshot(DIGEST, 7))
+        with open(self.path) as f:
+            data = json.load(f)
+        broken = [
+            dict(data, tables={**data['tables'], 'channels': {'100': [GUILD_ID]}}),
+            dict(data, tables={**data['tables'], 'allowed_users': ['x']}),
+            dict(data, tables={**data['tables'], 'overrides': None}),
+            dict(data, tables={k: v for k, v in data['tables'].items() if k != 'role_index'}),
+        ]
+        for snapshot in broken:
+            with open(self.path, 'w') as f:
+                json.dump(snapshot, f)
+            with self.assertLogs(level='WARNING'):
+                self.assertIsNone(hallmonitor.PolicyStore.load_snapshot(self.path, DIGEST, 7))
+
+        for contents in (b'', b'{"version": 2', b'\x80\x04\x95'):
+            with open(self.path, 'wb') as f:
+                f.write(contents)
+            self.assertIsNone(hallmonitor.PolicyStore.load_snapshot(self.path, DIGEST, 7))
+
+    def test_missing_snapshot(self):
+        self.assertIsNone(hallmonitor.PolicyStore.load_snapshot(self.path, DIGEST, 7))
+
+if __name__ == '__main__':
+    unittest.main()
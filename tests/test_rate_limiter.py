@@ -0,0 +1,79 @@
+import unittest
+
+from support import hallmonitor
+
+class CommandRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+
+    def limiter(self, rate=1.0, burst=2, global_rate=2.0, global_burst=3, max_users=100):
+        return hallmonitor.CommandRateLimiter(
+            rate, burst, global_rate, global_burst, max_users, clock=lambda: self.now)
+
+    def test_user_bucket_refills(self):
+        limiter = self.limiter(global_rate=0)
+        self.assertIsNone(limiter.check(1))
+        self.assertIsNone(limiter.check(1))
+        self.assertEqual(limiter.check(1), 'user')
+        # Other users have their own bucket
+        self.assertIsNone(limiter.check(2))
+        self.now += 1.0
+        self.assertIsNone(limiter.check(1))
+        self.assertEqual(limiter.check(1), 'user')
+        # Refills stop at the burst size
+        self.now += 60.0
+        self.assertIsNone(limiter.check(1))
+        self.assertIsNone(limiter.check(1))
+        self.assertEqual(limiter.check(1), 'user')
+        self.assertEqual(limiter.stats['dropped_user'], 3)
+
+    def test_global_bucket_caps_everyone(self):
+        limiter = self.limiter()
+        for user_id in range(3):
+            self.assertIsNone(limiter.check(user_id))
+        self.assertEqual(limiter.check(3), 'global')
+        self.now += 0.5
+        self.assertIsNone(limiter.check(4))
+        self.assertEqual(limiter.check(5), 'global')
+        self.assertEqual(limiter.stats['dropped_global'], 2)
+
+    def test_refused_global_does_not_spend_user_token(self):
+        limiter = self.limiter(global_burst=1)
+        self.assertIsNone(limiter.check(1))
+        self.assertEqual(limiter.check(2), 'global')
+        self.now += 0.5
+        # User 2 still has a full bucket
+        self.assertIsNone(limiter.check(2))
+        self.now += 0.5
+        self.assertIsNone(limiter.check(2))
+        self.assertEqual(limiter.check(2), 'user')
+
+    def test_trusted_skip_global_bucket(self):
+        limiter = self.limiter(global_burst=1)
+        self.assertIsNone(limiter.check(1))
+        self.assertEqual(limiter.check(2), 'global')
+        # A moderator still gets through while the global bucket is empty
+        self.assertIsNone(limiter.check(3, trusted=True))
+        self.assertIsNone(limiter.check(3, trusted=True))
+        # ...but is still held to their own bucket
+        self.assertEqual(limiter.check(3, trusted=True), 'user')
+        # and takes nothing from everyone else's budget
+        self.now += 0.5
+        self.assertIsNone(limiter.check(4))
+
+    def test_user_state_is_bounded(self):
+        limiter = self.limiter(global_rate=0, max_users=3)
+        for user_id in range(10):
+            limiter.check(user_id)
+        self.assertEqual(limiter.tracked_users(), 3)
+        self.assertEqual(limiter.stats['evicted'], 7)
+        # Recently used users are kept; an evicted one comes back with a full bucket
+        limiter.check(7)
+        limiter.check(10)
+        self.assertIn(7, limiter._users)
+        self.assertNotIn(8, limiter._users)
+        self.assertIsNone(limiter.check(0))
+        self.assertIsNone(limiter.check(0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from support import hallmonitor
+
+GUILD_ID = 900
+
+class StateStoreTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'state.db')
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.conn.close()
+        self.directory.cleanup()
+
+    def open_store(self, **options):
+        store = hallmonitor.StateStore(self.path, **options)
+        self.stores.append(store)
+        return store
+
+    def restart(self):
+        """Read the database back the way SecureBot does at startup"""
+        store = self.open_store()
+        policies = hallmonitor.PolicyStore.from_config(hallmonitor.POLICY_CONFIG)
+        store.load_into(policies)
+        security = hallmonitor.SecurityResponse(GUILD_ID)
+        store.restore_security(security)
+        return policies, security
+
+    async def test_restart_after_crash_restores_state(self):
+        store = self.open_store()
+        policies = hallmonitor.PolicyStore.from_config(hallmonitor.POLICY_CONFIG)
+        store.load_into(policies)
+        security = hallmonitor.SecurityResponse(GUILD_ID)
+        store.restore_security(security)
+
+        policies.allow([50])
+        policies.remove([2])
+        for _ in range(3):
+            security.record_attempt(77)
+        security.set_warning_level(77, 2)
+        security.set_timeout(77, 600)
+        await store.flush()
+        # Dropped without stop(), as if the process had died
+
+        policies, security = self.restart()
+        self.assertTrue(policies.is_allowed(50))
+        self.assertFalse(policies.is_allowed(2))
+        self.assertTrue(policies.is_allowed(3))
+        self.assertEqual(len(security.attempts[77]), 3)
+        self.assertEqual(security.warning_levels[77], 2)
+        self.assertAlmostEqual(security.timeout_remaining(77), 600, delta=5)
+
+    async def test_restart_drops_expired_state(self):
+        store = self.open_store()
+        now = time.time()
+        store.record_attempt(GUILD_ID, 77, now - 2 * 24 * 60 * 60)
+        store.record_attempt(GUILD_ID, 78, now - 60)
+        store.save_user(GUILD_ID, 78, 1, now - 60)
+        await store.flush()
+
+        _, security = self.restart()
+        self.assertNotIn(77, security.attempts)
+        self.assertEqual(len(security.attempts[78]), 1)
+        self.assertEqual(security.timeout_remaining(78), 0)
+
+    async def test_failed_flush_keeps_batch(self):
+        store = self.open_store()
+        store.set_allowed([50], True)
+        with mock.patch.object(store, '_write', side_effect=sqlite3.OperationalError("database is locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                await store.flush()
+        self.assertTrue(store._pending)
+        store.set_allowed([51], True)
+        await store.flush()
+        self.assertEqual(store._pending, [])
+
+        policies, _ = self.restart()
+        self.assertTrue(policies.is_allowed(50))
+        self.assertTrue(policies.is_allowed(51))
+
+    async def test_stop_waits_for_write_in_flight(self):
+        store = self.open_store(flush_interval=0)
+        write = store._write
+        started = threading.Event()
+
+        def slow_write(batch, cutoff):
+            started.set()
+            time.sleep(0.2)
+            write(batch, cutoff)
+
+        store.start()
+        with mock.patch.object(store, '_write', side_effect=slow_write):
+            store.set_allowed([50], True)
+            await asyncio.to_thread(started.wait, 5)
+            # Queued while the first transaction is still open
+            store.set_allowed([51], True)
+            await asyncio.gather(store.flush(), store.stop())
+        self.stores.remove(store)
+
+        policies, _ = self.restart()
+        self.assertTrue(policies.is_allowed(50))
+        self.assertTrue(policies.is_allowed(51))
+
+    async def test_migrates_v1_database(self):
+        conn = sqlite3.connect(self.path)
+        conn.executescript("""
+            CREATE TABLE allowlist (user_id INTEGER PRIMARY KEY, allowed INTEGER NOT NULL);
+            CREATE TABLE attempts (user_id INTEGER NOT NULL, ts REAL NOT NULL);
+            CREATE TABLE users (
+                user_id INTEGER PRIMARY KEY,
+                warning_level INTEGER NOT NULL,
+                timeout_until REAL
+            );
+            PRAGMA user_version=1;
+        """)
+        now = time.time()
+        conn.execute("INSERT INTO allowlist VALUES (50, 1)")
+        conn.execute("INSERT INTO attempts VALUES (77, ?)", (now - 60,))
+        conn.execute("INSERT INTO users VALUES (77, 2, ?)", (now + 600,))
+        conn.commit()
+        conn.close()
+
+        store = self.open_store()
+        version = store.conn.execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, hallmonitor.StateStore.SCHEMA_VERSION)
+        tables = {row[0] for row in store.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        self.assertTrue({'role_rules', 'meta', 'outbox', 'managed_overwrites'} <= tables)
+
+        policies = hallmonitor.PolicyStore.from_config(hallmonitor.POLICY_CONFIG)
+        store.load_into(policies)
+        # v1 state was not guild-scoped; it comes back under guild 0
+        security = hallmonitor.SecurityResponse(0)
+        store.restore_security(security)
+        self.assertTrue(policies.is_allowed(50))
+        self.assertEqual(len(security.attempts[77]), 1)
+        self.assertEqual(security.warning_levels[77], 2)
+        self.assertGreater(security.timeout_remaining(77), 0)
+
+    async def test_reopening_current_schema_is_a_no_op(self):
+        store = self.open_store()
+        store.save_user(GUILD_ID, 77, 1, None)
+        await store.flush()
+        store.conn.close()
+        self.stores.remove(store)
+
+        store = self.open_store()
+        rows = store.conn.execute("SELECT guild_id, user_id, warning_level FROM users").fetchall()
+        self.assertEqual(rows, [(GUILD_ID, 77, 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import random
+import unittest
+
+from support import hallmonitor
+
+GUILD_ID = 900
+
+class TopOffendersTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1_000_000.0
+        self.security = hallmonitor.SecurityResponse(GUILD_ID, clock=lambda: self.now)
+        self.window = self.security.ATTEMPT_WINDOW
+
+    def expected(self, n):
+        """The top n recomputed from scratch"""
+        cutoff = self.now - self.window
+        counts = sorted(
+            (-sum(1 for ts in attempts if ts > cutoff), user_id)
+            for user_id, attempts in self.security.attempts.items()
+        )
+        return [(user_id, -count) for count, user_id in counts[:n] if count]
+
+    def test_ranks_by_attempts(self):
+        for user_id, count in ((10, 3), (11, 5), (12, 1), (13, 4)):
+            for _ in range(count):
+                self.security.record_attempt(user_id)
+        self.assertEqual(self.security.top_offenders(3), [(11, 5), (13, 4), (10, 3)])
+        # Asking again gives the same answer; the valid entries were pushed back
+        self.assertEqual(self.security.top_offenders(3), [(11, 5), (13, 4), (10, 3)])
+        self.assertEqual(self.security.top_offenders(10), [(11, 5), (13, 4), (10, 3), (12, 1)])
+
+    def test_aged_out_attempts_drop_rank(self):
+        for _ in range(5):
+            self.security.record_attempt(10)
+        self.now += self.window / 2
+        for _ in range(3):
+            self.security.record_attempt(11)
+        self.security.record_attempt(10)
+        self.assertEqual(self.security.top_offenders(2), [(10, 6), (11, 3)])
+
+        # The first five attempts of user 10 leave the window
+        self.now += self.window / 2 + 1
+        self.assertEqual(self.security.top_offenders(2), [(11, 3), (10, 1)])
+
+        self.now += self.window
+        self.assertEqual(self.security.top_offenders(2), [])
+
+    def test_matches_recount_and_stays_bounded(self):
+        rng = random.Random(7)
+        for step in range(5000):
+            self.now += rng.uniform(0, self.window / 200)
+            self.security.record_attempt(rng.randrange(50))
+            if step % 250 == 0:
+                self.assertEqual(self.security.top_offenders(5), self.expected(5))
+        self.assertLessEqual(len(self.security._offenders), 2 * len(self.security.attempts) + 64)
+
+if __name__ == '__main__':
+    unittest.main()